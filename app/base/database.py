@@ -13,17 +13,30 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from core.config import db_settings
+from core.metrics import Gauge, single_value
 
 
 engine = create_async_engine(
     url=db_settings.DB_URL,
-    echo=True,
-    pool_size=5,
-    max_overflow=10,
+    echo=db_settings.DB_ECHO,
+    pool_size=db_settings.DB_POOL_SIZE,
+    max_overflow=db_settings.DB_MAX_OVERFLOW,
     pool_timeout=60,
     pool_pre_ping=True,
 )
 
+Gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out from the pool",
+    single_value(lambda: engine.pool.checkedout()),
+)
+Gauge(
+    "db_pool_overflow",
+    "Overflow connections in use (negative while the pool is not full)",
+    single_value(lambda: engine.pool.overflow()),
+)
+Gauge("db_pool_size", "Configured pool size", single_value(lambda: engine.pool.size()))
+
 async_session = async_sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -1,8 +1,21 @@
 # app/db/models.py
 
-from sqlalchemy import BigInteger, String, ForeignKey, TIMESTAMP
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+    String,
+    ForeignKey,
+    Identity,
+    Index,
+    Table,
+    TIMESTAMP,
+    func,
+    text,
+)
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from datetime import datetime
 import uuid
 
@@ -11,6 +24,14 @@ from app.base.database import Base
 
 class Video(Base):
     __tablename__ = "videos"
+    __table_args__ = (
+        Index(
+            "ix_videos_creator_id_video_created_at", "creator_id", "video_created_at"
+        ),
+        Index("ix_videos_video_created_at", "video_created_at"),
+        Index("ix_videos_views_count", "views_count"),
+        Index("ix_videos_created_at", "created_at"),
+    )
 
     video_created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True),
@@ -26,7 +47,35 @@ class Video(Base):
 
 
 class VideoSnapshot(Base):
+    """
+    Почасовые снапшоты. Таблица партиционирована по дням created_at (UTC),
+    поэтому created_at входит в первичный ключ; партиции создаёт загрузчик
+    (services.partitions).
+    """
+
     __tablename__ = "video_snapshots"
+    __table_args__ = (
+        Index("ix_video_snapshots_video_id", "video_id"),
+        Index(
+            "ix_video_snapshots_created_at_brin",
+            "created_at",
+            postgresql_using="brin",
+        ),
+        Index(
+            "ix_video_snapshots_growth_created_at",
+            "created_at",
+            "video_id",
+            postgresql_where=text("delta_views_count > 0"),
+        ),
+        Index("ix_video_snapshots_views_count", "views_count"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True),
+        primary_key=True,
+        server_default=func.now(),
+    )
 
     video_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
@@ -43,3 +92,77 @@ class VideoSnapshot(Base):
     delta_likes_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
     delta_reports_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
     delta_comments_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+# Дневной роллап снапшотов (день UTC, видео) -> суммы дельт.
+# Поддерживается загрузчиком, своего id нет, поэтому это Core-таблица, не ORM.
+snapshot_daily_rollup = Table(
+    "snapshot_daily_rollup",
+    Base.metadata,
+    Column("day", Date, primary_key=True),
+    Column("video_id", UUID(as_uuid=True), ForeignKey("videos.id"), primary_key=True),
+    Column("snapshots_count", BigInteger, nullable=False),
+    Column("delta_views_count", BigInteger, nullable=False),
+    Column("delta_likes_count", BigInteger, nullable=False),
+    Column("delta_comments_count", BigInteger, nullable=False),
+    Column("delta_reports_count", BigInteger, nullable=False),
+    Column("has_views_growth", Boolean, nullable=False),
+)
+
+
+# Журнал загрузок: номер загрузки (поколение данных) и дни, которых она коснулась.
+# По нему потребители (кэши, in-memory движок) понимают, что и где обновилось.
+data_loads = Table(
+    "data_loads",
+    Base.metadata,
+    Column("id", BigInteger, Identity(), primary_key=True),
+    Column(
+        "finished_at",
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    ),
+    Column("touched_days", ARRAY(Date), nullable=False),
+)
+
+
+# Частота каноничных QuerySpec в вопросах пользователей по дням UTC
+# (пишет бот пачками, старые дни удаляет загрузчик)
+query_stats = Table(
+    "query_stats",
+    Base.metadata,
+    Column("day", Date, primary_key=True),
+    Column("spec_hash", String, primary_key=True),
+    Column("spec", String, nullable=False),
+    Column("hits", BigInteger, nullable=False),
+)
+
+
+# Ответы на самые частые QuerySpec, посчитанные загрузчиком для своей загрузки
+answers = Table(
+    "answers",
+    Base.metadata,
+    Column("spec_hash", String, primary_key=True),
+    Column("generation", BigInteger, primary_key=True),
+    Column("value", BigInteger, nullable=False),
+)
+
+
+# Дни video_snapshots, свёрнутые до дневных строк (services.compaction).
+# Роллап таких дней больше не пересчитывается: почасовых строк уже нет.
+snapshot_compactions = Table(
+    "snapshot_compactions",
+    Base.metadata,
+    Column("day", Date, primary_key=True),
+    Column(
+        "started_at",
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    ),
+    Column("finished_at", TIMESTAMP(timezone=True), nullable=True),
+    Column("rows_removed", BigInteger, server_default=text("0"), nullable=False),
+    Column("rows_added", BigInteger, server_default=text("0"), nullable=False),
+    Column("bytes_before", BigInteger, nullable=False),
+    Column("bytes_after", BigInteger, nullable=True),
+)
@@ -1,8 +1,16 @@
 from aiogram import Router, F
 from aiogram.types import Message
+from loguru import logger
 
+from core.metrics import Counter
 from services.text_query import answer_text_query
 
+REQUESTS = Counter(
+    "bot_requests_total",
+    "Processed questions by outcome",
+    labelnames=("status", "error_type"),
+)
+
 router = Router()
 
 
@@ -29,13 +37,17 @@ async def handle_text(message: Message) -> None:
 
     try:
         value = await answer_text_query(user_text)
-    except Exception:
-        # тут можно залогировать ошибку, чтобы понять, что именно сломалось
+    except Exception as e:
+        REQUESTS.inc(status="error", error_type=type(e).__name__)
+        logger.bind(error_type=type(e).__name__).exception(
+            f"failed to answer: {user_text!r}"
+        )
         await message.answer(
             "Не смог обработать запрос. Попробуй спросить чуть проще "
             "или другими словами."
         )
         return
 
+    REQUESTS.inc(status="ok")
     # Важно для ТЗ: просто число в ответе
     await message.answer(str(value))
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+from loguru import logger
+
+from core.metrics import Gauge, Histogram
+
+BUSY_TEXT = "Сейчас слишком много вопросов, попробуй через минуту."
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "bot_queue_wait_seconds", "Time a message waited before processing"
+)
+
+
+class ProcessingStats:
+    """Счётчики очереди обработки сообщений."""
+
+    def __init__(self) -> None:
+        self.queued = 0  # ждут своей очереди (в чате или общего слота)
+        self.waiting_slot = 0  # первые в своём чате, ждут общего слота
+        self.in_flight = 0  # обрабатываются прямо сейчас
+        self.max_queued = 0
+        self.processed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queued,
+            "waiting_slot": self.waiting_slot,
+            "in_flight": self.in_flight,
+            "max_queued": self.max_queued,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "wait_avg": self.wait_total / self.processed if self.processed else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+class ChatConcurrencyMiddleware(BaseMiddleware):
+    """
+    Ограничивает обработку сообщений:
+    - не больше max_concurrency одновременно (по размеру пула БД);
+    - сообщения одного чата обрабатываются строго по порядку;
+    - если общего слота ждут max_pending чатов или в очереди чата уже
+      max_chat_pending сообщений, сразу отвечаем BUSY_TEXT.
+    Общий лимит считает только первые сообщения чатов: очередь одного
+    занятого чата не занимает места других чатов.
+    """
+
+    def __init__(
+        self, max_concurrency: int, max_pending: int, max_chat_pending: int
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_chat_pending = max_chat_pending
+        self.stats = ProcessingStats()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_refs: Dict[int, int] = {}
+
+        Gauge(
+            "bot_queue",
+            "Messages waiting, in flight, processed and rejected",
+            lambda: {
+                ("queued",): self.stats.queued,
+                ("waiting_slot",): self.stats.waiting_slot,
+                ("in_flight",): self.stats.in_flight,
+                ("processed",): self.stats.processed,
+                ("rejected",): self.stats.rejected,
+            },
+            labelnames=("state",),
+        )
+
+    @asynccontextmanager
+    async def _global_slot(self) -> AsyncIterator[None]:
+        self.stats.waiting_slot += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats.waiting_slot -= 1
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat_id = event.chat.id
+        # в _chat_refs входит и сообщение, которое чат обрабатывает сейчас
+        if (
+            self.stats.waiting_slot >= self.max_pending
+            or self._chat_refs.get(chat_id, 0) > self.max_chat_pending
+        ):
+            self.stats.rejected += 1
+            logger.warning(
+                f"message rejected, chat={chat_id} queue is full: "
+                f"{self.stats.snapshot()}"
+            )
+            await event.answer(BUSY_TEXT)
+            return None
+
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_refs[chat_id] = self._chat_refs.get(chat_id, 0) + 1
+
+        self.stats.queued += 1
+        self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+        enqueued_at = time.monotonic()
+        started = False
+        try:
+            # сначала очередь чата (порядок), потом общий слот (лимит)
+            async with lock, self._global_slot():
+                started = True
+                wait = time.monotonic() - enqueued_at
+                self.stats.queued -= 1
+                self.stats.in_flight += 1
+                self.stats.wait_total += wait
+                self.stats.wait_max = max(self.stats.wait_max, wait)
+                QUEUE_WAIT_SECONDS.observe(wait)
+                logger.debug(
+                    f"chat={chat_id} waited {wait:.3f}s, "
+                    f"queued={self.stats.queued}, in_flight={self.stats.in_flight}"
+                )
+                try:
+                    return await handler(event, data)
+                finally:
+                    self.stats.in_flight -= 1
+                    self.stats.processed += 1
+        finally:
+            if not started:
+                self.stats.queued -= 1
+            self._chat_refs[chat_id] -= 1
+            if self._chat_refs[chat_id] == 0:
+                del self._chat_refs[chat_id]
+                del self._chat_locks[chat_id]
@@ -1,6 +1,7 @@
 """config with settings classes"""
 
 from pathlib import Path
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 from loguru import logger
@@ -18,6 +19,11 @@ class DBSettings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
 
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    # echo=True логирует каждый запрос синхронно — только для отладки
+    DB_ECHO: bool = False
+
     model_config = SettingsConfigDict(
         env_file=ENV_PATH,
         env_file_encoding="utf-8",
@@ -33,6 +39,13 @@ class DBSettings(BaseSettings):
 class BotSettings(BaseSettings):
     BOT_TOKEN: str
 
+    # сколько сообщений обрабатываем одновременно; по умолчанию — размер пула БД
+    BOT_MAX_CONCURRENCY: Optional[int] = None
+    # сколько чатов может ждать общего слота, дальше отвечаем "занят"
+    BOT_MAX_PENDING: int = 100
+    # сколько сообщений одного чата может ждать за его текущим
+    BOT_MAX_CHAT_PENDING: int = 10
+
     model_config = SettingsConfigDict(
         env_file=ENV_PATH,
         env_file_encoding="utf-8",
@@ -43,6 +56,146 @@ class BotSettings(BaseSettings):
 class LLMSettings(BaseSettings):
     OPENAI_API_KEY: str = Field(alias="openai_api_key")
 
+    # "manual" — подробный промпт из nlp.prompts, "generated" — компактный,
+    # собранный из ограничений sql_builder и enum'ов nlp.spec
+    LLM_PROMPT_MODE: str = "manual"
+    # просить у модели вызов функции со схемой QuerySpec вместо свободного текста
+    LLM_STRUCTURED_OUTPUT: bool = False
+    # сколько раз переспрашиваем модель, показав ей ошибку разбора
+    LLM_REPAIR_RETRIES: int = 1
+
+    # пакетный разбор: вопросов в одном запросе к модели, запросов одновременно
+    LLM_BATCH_SIZE: int = 20
+    LLM_BATCH_CONCURRENCY: int = 4
+    # сколько раз переспрашиваем вопросы, которые не удалось разобрать
+    LLM_BATCH_RETRIES: int = 1
+
+    model_config = SettingsConfigDict(
+        env_file=ENV_PATH,
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+
+class SpecIndexSettings(BaseSettings):
+    """setting class for reusing QuerySpecs of similar past questions"""
+
+    # искать похожий вопрос до обращения к LLM
+    SPEC_INDEX_ENABLED: bool = False
+    # журнал шаблонов вопросов (JSONL), дописывается по мере работы
+    SPEC_INDEX_PATH: str = str(
+        Path(__file__).resolve().parents[2] / "data" / "spec_index.jsonl"
+    )
+    # минимальная косинусная близость шаблонов вопросов
+    SPEC_INDEX_THRESHOLD: float = 0.9
+    SPEC_INDEX_MAX_ENTRIES: int = 2000
+
+    model_config = SettingsConfigDict(
+        env_file=ENV_PATH,
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+
+class CacheSettings(BaseSettings):
+    """setting class for in-process spec/answer caches"""
+
+    SPEC_CACHE_SIZE: int = 10_000
+    SPEC_CACHE_TTL: float = 24 * 60 * 60
+    VALUE_CACHE_SIZE: int = 10_000
+    VALUE_CACHE_TTL: float = 10 * 60
+
+    # кэш на диске (SQLite), переживающий рестарт бота
+    PERSISTENT_CACHE_ENABLED: bool = False
+    PERSISTENT_CACHE_PATH: str = str(
+        Path(__file__).resolve().parents[2] / "data" / "answer_cache.sqlite3"
+    )
+    # сколько записей может ждать фоновой записи, дальше новые теряются
+    PERSISTENT_CACHE_QUEUE_SIZE: int = 10_000
+
+    model_config = SettingsConfigDict(
+        env_file=ENV_PATH,
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+
+class QuerySettings(BaseSettings):
+    """setting class for QuerySpec -> SQL execution"""
+
+    USE_DAILY_ROLLUP: bool = True
+    # считать QuerySpec по копии данных в памяти (services.columnar) вместо Postgres
+    USE_COLUMNAR_BACKEND: bool = False
+    # COUNT/SUM по временным окнам из индекса в памяти (services.time_index)
+    USE_TIME_INDEX: bool = False
+    # сначала искать ответ в answers, посчитанных загрузчиком (services.precomputed);
+    # включать, когда загрузчик уже считает ответы — иначе это лишний запрос
+    # на каждый промах кэша
+    USE_PRECOMPUTED_ANSWERS: bool = False
+    # сколько самых частых spec загрузчик считает заранее
+    PRECOMPUTE_TOP_N: int = 200
+
+    model_config = SettingsConfigDict(
+        env_file=ENV_PATH,
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+
+class QueryLogSettings(BaseSettings):
+    """setting class for slow/sampled SQL query logging"""
+
+    # запросы дольше порога пишутся всегда
+    QUERY_SLOW_MS: float = 200
+    # доля быстрых запросов, попадающих в лог
+    QUERY_LOG_SAMPLE_RATE: float = 0.01
+    QUERY_EXPLAIN_SLOW: bool = True
+    # ANALYZE выполняет запрос повторно; False -> только оценка планировщика
+    QUERY_EXPLAIN_ANALYZE: bool = True
+    QUERY_EXPLAIN_TIMEOUT_MS: int = 10_000
+    # один и тот же SQL-шаблон объясняем не чаще, чем раз в столько секунд
+    QUERY_EXPLAIN_COOLDOWN: float = 10 * 60
+
+    # частота каноничных spec в query_stats (для заранее посчитанных ответов)
+    QUERY_STATS_ENABLED: bool = True
+    QUERY_STATS_FLUSH_INTERVAL: float = 60
+    # по скольким последним дням выбирать самые частые spec
+    QUERY_STATS_WINDOW_DAYS: int = 7
+
+    model_config = SettingsConfigDict(
+        env_file=ENV_PATH,
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+
+class CompactionSettings(BaseSettings):
+    """setting class for downsampling old hourly snapshots into daily rows"""
+
+    # сколько последних дней video_snapshots хранится почасово
+    HOURLY_SNAPSHOTS_RETENTION_DAYS: int = 30
+    # сколько видео сворачивается одной транзакцией
+    COMPACTION_BATCH_VIDEOS: int = 2000
+    # дольше блокировку не ждём: батч откатывается и повторяется позже
+    COMPACTION_LOCK_TIMEOUT_MS: int = 2000
+    # VACUUM FULL свёрнутой партиции отдаёт место ОС; без него место только
+    # переиспользуется таблицей
+    COMPACTION_VACUUM_FULL: bool = True
+
+    model_config = SettingsConfigDict(
+        env_file=ENV_PATH,
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+
+class MetricsSettings(BaseSettings):
+    """setting class for the local metrics endpoint"""
+
+    METRICS_ENABLED: bool = True
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108
+
     model_config = SettingsConfigDict(
         env_file=ENV_PATH,
         env_file_encoding="utf-8",
@@ -53,3 +206,9 @@ class LLMSettings(BaseSettings):
 bot_settings = BotSettings()
 db_settings = DBSettings()
 llm_settings = LLMSettings()
+spec_index_settings = SpecIndexSettings()
+cache_settings = CacheSettings()
+query_settings = QuerySettings()
+query_log_settings = QueryLogSettings()
+compaction_settings = CompactionSettings()
+metrics_settings = MetricsSettings()
@@ -1,18 +1,93 @@
 import asyncio
+from pathlib import Path
 
 from aiogram import Bot, Dispatcher
 
-from core.config import bot_settings
+from core.config import (
+    bot_settings,
+    cache_settings,
+    query_log_settings,
+    db_settings,
+    metrics_settings,
+    query_settings,
+)
+from core.metrics import start_metrics_server
 from bot.handlers import router
+from bot.middlewares import ChatConcurrencyMiddleware
+from services.columnar import columnar_store
+from services.compaction import refresh_compacted_days
+from services.data_events import listen_data_loaded
+from services.persistent_cache import persistent_cache
+from services.precomputed import flush_query_stats, run_query_stats_flusher
+from services.time_index import time_index
+from services.text_query import invalidate_answer_cache
+
+
+async def on_data_loaded() -> None:
+    # сначала подтягиваем данные в память, потом сбрасываем кэш ответов,
+    # иначе в кэш снова попадут числа по старой копии; но сбрасываем его,
+    # даже если обновление упало — старые ответы уже неверны
+    try:
+        await refresh_compacted_days()
+        if query_settings.USE_COLUMNAR_BACKEND:
+            await columnar_store.refresh()
+        if query_settings.USE_TIME_INDEX:
+            await time_index.refresh()
+        await persistent_cache.refresh_generation()
+    finally:
+        invalidate_answer_cache()
 
 
 async def main() -> None:
     bot = Bot(token=bot_settings.BOT_TOKEN)
     dp = Dispatcher()
 
+    # не берём в работу больше сообщений, чем соединений в пуле БД
+    max_concurrency = bot_settings.BOT_MAX_CONCURRENCY or (
+        db_settings.DB_POOL_SIZE + db_settings.DB_MAX_OVERFLOW
+    )
+    dp.message.middleware(
+        ChatConcurrencyMiddleware(
+            max_concurrency=max_concurrency,
+            max_pending=bot_settings.BOT_MAX_PENDING,
+            max_chat_pending=bot_settings.BOT_MAX_CHAT_PENDING,
+        )
+    )
+
     dp.include_router(router)
 
-    await dp.start_polling(bot)
+    await refresh_compacted_days()
+    if query_settings.USE_COLUMNAR_BACKEND:
+        await columnar_store.refresh()
+    if query_settings.USE_TIME_INDEX:
+        await time_index.refresh()
+
+    if cache_settings.PERSISTENT_CACHE_ENABLED:
+        await persistent_cache.open(Path(cache_settings.PERSISTENT_CACHE_PATH))
+
+    # загрузчик данных шлёт NOTIFY -> обновляем данные в памяти и сбрасываем кэш
+    listener = await listen_data_loaded(on_data_loaded)
+
+    stats_flusher = None
+    if query_log_settings.QUERY_STATS_ENABLED:
+        stats_flusher = asyncio.create_task(run_query_stats_flusher())
+
+    metrics_runner = None
+    if metrics_settings.METRICS_ENABLED:
+        metrics_runner = await start_metrics_server(
+            metrics_settings.METRICS_HOST, metrics_settings.METRICS_PORT
+        )
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await listener.close()
+        if stats_flusher is not None:
+            stats_flusher.cancel()
+            await flush_query_stats()
+        await persistent_cache.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,20 @@
+import asyncio
 import json
-from typing import Any
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from loguru import logger
+from pydantic import ValidationError
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
-from core.config import llm_settings
-from nlp.prompts import SPEC_SYSTEM_PROMPT
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable
+from core.config import llm_settings, spec_index_settings
+from core.metrics import Counter, stage_timer
+from nlp.normalize import normalize_question
+from nlp.prompts import REPAIR_PROMPT, get_spec_system_prompt, prompt_cache_key
+from nlp.rule_parser import parse_spec_by_rules
 from nlp.spec import QuerySpec
+from nlp.spec_index import spec_index
 
 
 llm = ChatOpenAI(
@@ -13,31 +23,324 @@ llm = ChatOpenAI(
     api_key=llm_settings.OPENAI_API_KEY,
 )
 
+# prompt_cache_key -> модель с ответом-вызовом функции по схеме QuerySpec
+_structured_llms: Dict[str, Runnable] = {}
+
 
-async def call_llm(system_prompt: str, user_text: str) -> str:
+def structured_llm(system_prompt: str) -> Runnable:
     """
-    Вызов langchain-openai: system + user -> content.
-    Возвращает строку, которая должна быть чистым JSON.
+    Та же модель, но ответ — вызов функции с аргументами по схеме QuerySpec.
+    with_structured_output не передаёт аргументы вызова в запрос, поэтому
+    prompt_cache_key зашивается в модель: по одной на системный промпт.
+    """
+    key = prompt_cache_key(system_prompt)
+    runnable = _structured_llms.get(key)
+    if runnable is None:
+        keyed = llm.model_copy(
+            update={"model_kwargs": {**llm.model_kwargs, "prompt_cache_key": key}}
+        )
+        runnable = keyed.with_structured_output(
+            QuerySpec, method="function_calling", include_raw=True
+        )
+        _structured_llms[key] = runnable
+    return runnable
+
+
+LLM_TOKENS = Counter("llm_tokens_total", "LLM token usage", labelnames=("kind",))
+SPEC_SOURCE = Counter(
+    "spec_source_total", "Where QuerySpec came from", labelnames=("source",)
+)
+LLM_PARSE = Counter(
+    "llm_parse_total",
+    "LLM answers by final outcome (ok, repaired, failed)",
+    labelnames=("mode", "outcome"),
+)
+LLM_PARSE_ERRORS = Counter(
+    "llm_parse_errors_total",
+    "LLM answers that failed JSON/QuerySpec validation",
+    labelnames=("mode", "error_type"),
+)
+LLM_REPAIR_RETRIES = Counter(
+    "llm_repair_retries_total", "Extra LLM calls made to repair an answer"
+)
+
+
+class SpecParseError(ValueError):
+    """Ответ модели не превратился в QuerySpec; raw — что именно она ответила."""
+
+    def __init__(self, error: ValueError, raw: str):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.error_type = type(error).__name__
+        self.raw = raw
+
+
+def extract_json_object(raw: str) -> Any:
     """
-    messages = [
+    Достаёт первый JSON-объект из ответа модели, прощая обёртку
+    (```json ... ```, текст до и после).
+    """
+    start = raw.find("{")
+    if start == -1:
+        raise ValueError("no JSON object in model answer")
+    data, _ = json.JSONDecoder().raw_decode(raw, start)
+    return data
+
+
+def _messages(
+    system_prompt: str, user_text: str, history: Sequence[BaseMessage]
+) -> List[BaseMessage]:
+    return [
         SystemMessage(content=system_prompt),
         HumanMessage(content=user_text),
+        *history,
     ]
 
-    resp = await llm.ainvoke(messages)
+
+def _record_usage(resp: AIMessage) -> None:
+    usage = resp.usage_metadata or {}
+    input_tokens = usage.get("input_tokens", 0)
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    LLM_TOKENS.inc(input_tokens, kind="input")
+    LLM_TOKENS.inc(cached_tokens, kind="cached_input")
+    LLM_TOKENS.inc(output_tokens, kind="output")
+    logger.bind(
+        input_tokens=input_tokens,
+        cached_tokens=cached_tokens,
+        output_tokens=output_tokens,
+    ).info(
+        f"llm usage: input={input_tokens} (cached {cached_tokens}), "
+        f"output={output_tokens}"
+    )
+
+
+async def call_llm(
+    system_prompt: str, user_text: str, history: Sequence[BaseMessage] = ()
+) -> str:
+    """
+    Вызов langchain-openai: system + user (+ история переспроса) -> content.
+    Возвращает строку, которая должна быть чистым JSON.
+    """
+    with stage_timer("llm_call"):
+        # системный промпт статичен и идёт первым: общий префикс кэшируется
+        # провайдером, ключ помогает попадать на машину с этим кэшем
+        resp = await llm.ainvoke(
+            _messages(system_prompt, user_text, history),
+            prompt_cache_key=prompt_cache_key(system_prompt),
+        )
+
+    _record_usage(resp)
     # resp.content — это уже строка-ответ от модели
     return resp.content
 
 
+async def call_llm_structured(
+    system_prompt: str, user_text: str, history: Sequence[BaseMessage] = ()
+) -> Union[QuerySpec, str]:
+    """
+    Вызов с tool-схемой QuerySpec. Возвращает готовый QuerySpec или, если
+    аргументы не прошли валидацию, сырой ответ для разбора и переспроса.
+    """
+    with stage_timer("llm_call"):
+        result = await structured_llm(system_prompt).ainvoke(
+            _messages(system_prompt, user_text, history)
+        )
+
+    raw_message: AIMessage = result["raw"]
+    _record_usage(raw_message)
+    if result["parsed"] is not None:
+        return result["parsed"]
+
+    if raw_message.tool_calls:
+        return json.dumps(raw_message.tool_calls[0]["args"], ensure_ascii=False)
+    return str(raw_message.content)
+
+
+async def _request_spec(
+    system_prompt: str, user_text: str, history: Sequence[BaseMessage]
+) -> QuerySpec:
+    """Один запрос к модели и разбор ответа; не получилось -> SpecParseError."""
+    if llm_settings.LLM_STRUCTURED_OUTPUT:
+        answer = await call_llm_structured(system_prompt, user_text, history)
+        if isinstance(answer, QuerySpec):
+            return answer
+        raw = answer
+    else:
+        raw = await call_llm(system_prompt, user_text, history)
+
+    with stage_timer("spec_validation"):
+        try:
+            return QuerySpec.model_validate(extract_json_object(raw))
+        except ValueError as e:
+            # json.JSONDecodeError и pydantic.ValidationError — тоже ValueError
+            raise SpecParseError(e, raw) from e
+
+
 async def build_spec_from_text(user_text: str) -> QuerySpec:
     """
     Берёт текстовый вопрос, просит модель выдать JSON со спецификацией QuerySpec,
     валидирует через Pydantic и возвращает готовый объект.
+    Типовые вопросы разбираются локальными правилами без обращения к LLM,
+    перефразированные уже разобранные — по индексу похожих вопросов.
     """
-    raw = await call_llm(SPEC_SYSTEM_PROMPT, user_text)
+    with stage_timer("rule_parse"):
+        spec = parse_spec_by_rules(user_text)
+    if spec is not None:
+        SPEC_SOURCE.inc(source="rules")
+        return spec
 
-    raw_str = raw.strip()
+    if spec_index_settings.SPEC_INDEX_ENABLED:
+        with stage_timer("spec_index_lookup"):
+            spec = await spec_index.lookup(user_text)
+        if spec is not None:
+            SPEC_SOURCE.inc(source="similar")
+            return spec
 
-    data: Any = json.loads(raw_str)
-    spec = QuerySpec.model_validate(data)
+    system_prompt = get_spec_system_prompt(llm_settings.LLM_PROMPT_MODE)
+    mode = "structured" if llm_settings.LLM_STRUCTURED_OUTPUT else "text"
+    retries = llm_settings.LLM_REPAIR_RETRIES
+
+    # при ошибке показываем модели её ответ и текст ошибки, не больше retries раз
+    history: List[BaseMessage] = []
+    attempt = 0
+    while True:
+        try:
+            spec = await _request_spec(system_prompt, user_text, history)
+            break
+        except SpecParseError as e:
+            LLM_PARSE_ERRORS.inc(mode=mode, error_type=e.error_type)
+            if attempt >= retries:
+                LLM_PARSE.inc(mode=mode, outcome="failed")
+                raise
+            attempt += 1
+            LLM_REPAIR_RETRIES.inc()
+            history = [
+                AIMessage(content=e.raw),
+                HumanMessage(content=REPAIR_PROMPT.format(error=e)),
+            ]
+
+    LLM_PARSE.inc(mode=mode, outcome="ok" if attempt == 0 else "repaired")
+    SPEC_SOURCE.inc(source="llm")
+    if spec_index_settings.SPEC_INDEX_ENABLED:
+        await spec_index.add(user_text, spec)
     return spec
+
+
+@dataclass
+class SpecError:
+    """Вопрос, который не удалось превратить в QuerySpec."""
+
+    text: str
+    error: str
+
+
+SpecResult = Union[QuerySpec, SpecError]
+
+
+def _batch_payload(texts: Sequence[str]) -> str:
+    # один вопрос — одна строка, иначе нумерация поедет
+    return "\n".join(f"{i}. {' '.join(t.split())}" for i, t in enumerate(texts, 1))
+
+
+async def _parse_batch(texts: Sequence[str]) -> List[Union[QuerySpec, str]]:
+    """
+    Один запрос к модели на пачку вопросов.
+    Каждый ответ валидируется отдельно: QuerySpec или текст ошибки.
+    """
+    try:
+        system_prompt = get_spec_system_prompt(llm_settings.LLM_PROMPT_MODE, batch=True)
+        raw = await call_llm(system_prompt, _batch_payload(texts))
+        data: Any = extract_json_object(raw)
+        if not isinstance(data, dict):
+            raise ValueError("batch answer is not a JSON object")
+    except Exception as e:
+        return [f"{type(e).__name__}: {e}"] * len(texts)
+
+    results: List[Union[QuerySpec, str]] = []
+    with stage_timer("spec_validation"):
+        for i in range(1, len(texts) + 1):
+            item = data.get(str(i))
+            if item is None:
+                results.append(f"no answer for question {i}")
+                continue
+            try:
+                results.append(QuerySpec.model_validate(item))
+            except ValidationError as e:
+                results.append(f"ValidationError: {e}")
+    return results
+
+
+async def build_specs_from_texts(
+    user_texts: Sequence[str],
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    retries: Optional[int] = None,
+) -> List[SpecResult]:
+    """
+    Пакетный вариант build_spec_from_text для офлайн-прогонов.
+
+    Вопросы, которые берут правила, в модель не идут; одинаковые (после
+    нормализации) отправляются один раз. Остальные упаковываются по batch_size
+    в один запрос с нумерацией, одновременно идёт не больше concurrency
+    запросов. Не разобранные вопросы переспрашиваются (только они) до retries раз.
+    Результат — в порядке входа: QuerySpec или SpecError.
+    """
+    batch_size = batch_size or llm_settings.LLM_BATCH_SIZE
+    concurrency = concurrency or llm_settings.LLM_BATCH_CONCURRENCY
+    if retries is None:
+        retries = llm_settings.LLM_BATCH_RETRIES
+    if batch_size < 1 or concurrency < 1 or retries < 0:
+        raise ValueError("batch_size and concurrency must be >= 1, retries >= 0")
+
+    results: List[Optional[SpecResult]] = [None] * len(user_texts)
+
+    # нормализованный текст -> номера вопросов с таким текстом
+    groups: Dict[str, List[int]] = {}
+    for idx, user_text in enumerate(user_texts):
+        spec = parse_spec_by_rules(user_text)
+        if spec is not None:
+            SPEC_SOURCE.inc(source="rules")
+            results[idx] = spec
+            continue
+        if spec_index_settings.SPEC_INDEX_ENABLED:
+            spec = await spec_index.lookup(user_text)
+            if spec is not None:
+                SPEC_SOURCE.inc(source="similar")
+                results[idx] = spec
+                continue
+        groups.setdefault(normalize_question(user_text), []).append(idx)
+
+    pending = list(groups)
+    errors: Dict[str, str] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(keys: List[str]) -> None:
+        async with semaphore:
+            parsed = await _parse_batch([user_texts[groups[k][0]] for k in keys])
+        for key, item in zip(keys, parsed):
+            if isinstance(item, QuerySpec):
+                SPEC_SOURCE.inc(source="llm")
+                for idx in groups[key]:
+                    results[idx] = item
+                if spec_index_settings.SPEC_INDEX_ENABLED:
+                    await spec_index.add(user_texts[groups[key][0]], item)
+            else:
+                errors[key] = item
+
+    for _ in range(retries + 1):
+        if not pending:
+            break
+        errors.clear()
+        await asyncio.gather(
+            *(
+                run(pending[i : i + batch_size])
+                for i in range(0, len(pending), batch_size)
+            )
+        )
+        pending = list(errors)
+
+    for key in pending:
+        for idx in groups[key]:
+            results[idx] = SpecError(text=user_texts[idx], error=errors[key])
+
+    return [r for r in results if r is not None]
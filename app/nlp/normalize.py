@@ -0,0 +1,24 @@
+import re
+
+# Пробелы, которыми разделяют разряды: обычный, неразрывный, узкий неразрывный
+_DIGIT_GROUP_RE = re.compile(r"(?<=\d)[ \u00a0\u202f](?=\d{3}(?!\d))")
+# Всё, что не буква/цифра/пробел и не разделитель внутри дат и чисел
+_PUNCT_RE = re.compile(r"[^\w\s.:\-/]")
+# Точка/двоеточие/дефис/слэш, которые не стоят между двумя цифрами или буквами
+_LOOSE_SEP_RE = re.compile(r"(?<!\w)[.:\-/]+|[.:\-/]+(?!\w)")
+_DASHES_RE = re.compile(r"[\u2010-\u2015\u2212]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Приводит вопрос к каноничному виду для кэширования:
+    регистр, ё -> е, пунктуация, лишние пробелы, числа вида "100 000" -> "100000".
+    """
+    s = text.lower().replace("ё", "е")
+    s = _DASHES_RE.sub("-", s)
+    s = _DIGIT_GROUP_RE.sub("", s)
+    s = _PUNCT_RE.sub(" ", s)
+    s = _LOOSE_SEP_RE.sub(" ", s)
+    s = _SPACES_RE.sub(" ", s)
+    return s.strip()
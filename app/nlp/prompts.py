@@ -1,3 +1,28 @@
+"""
+Системные промпты для разбора вопроса в QuerySpec.
+
+Промпт целиком статичен и идёт первым сообщением, вопрос — отдельным
+коротким сообщением, поэтому у всех запросов общий префикс и провайдер
+может его кэшировать. Есть два варианта схемы:
+- "manual"    — подробный текст SPEC_SYSTEM_PROMPT;
+- "generated" — компактное описание, собранное из ALLOWED_FIELDS_BY_TABLE,
+  ALLOWED_FILTER_COLUMNS и enum'ов nlp.spec, примеры — через rule_parser.
+"""
+
+import hashlib
+import json
+from typing import Dict, List
+
+from nlp.rule_parser import parse_spec_by_rules
+from nlp.spec import (
+    ALLOWED_FIELDS_BY_TABLE,
+    ALLOWED_FILTER_COLUMNS,
+    DATETIME_COLUMNS,
+    Aggregation,
+    ConditionOp,
+    Table,
+)
+
 SPEC_SYSTEM_PROMPT = """
 Ты помощник по аналитике. Есть база данных PostgreSQL с двумя таблицами.
 
@@ -136,3 +161,128 @@ SPEC_SYSTEM_PROMPT = """
   ]
 }
 """
+
+BATCH_SPEC_SUFFIX = """
+Пакетный режим.
+Пользователь присылает несколько вопросов, по одному на строке, в формате
+"<номер>. <вопрос>".
+
+Верни ОДИН JSON-объект: ключ — номер вопроса (строкой), значение — спецификация
+для этого вопроса в описанном выше формате. Ответь на каждый номер, ничего не
+пропускай и не добавляй пояснений.
+
+Пример ответа на два вопроса:
+{
+  "1": {"table": "videos", "aggregation": "count_rows", "field": "id", "filters": []},
+  "2": {"table": "videos", "aggregation": "count_rows", "field": "id",
+        "filters": [{"column": "views_count", "op": "gt", "value": 100000}]}
+}
+"""
+
+
+# Переспрос после ответа, который не прошёл проверку
+REPAIR_PROMPT = """
+Ответ выше не прошёл проверку: {error}
+Исправь его и верни только JSON-объект спецификации, без пояснений и Markdown.
+"""
+
+
+# --- схема, собранная из кода -------------------------------------------------
+
+# Смысл агрегатов и операций; ключи сверяются с enum'ами при сборке
+_AGGREGATION_HINTS: Dict[Aggregation, str] = {
+    Aggregation.count_rows: 'COUNT(*), field = "id"',
+    Aggregation.sum_field: "SUM(field)",
+    Aggregation.count_distinct: "COUNT(DISTINCT field)",
+}
+
+_OP_HINTS: Dict[ConditionOp, str] = {
+    ConditionOp.eq: "column = value",
+    ConditionOp.gt: "column > value",
+    ConditionOp.between_datetime: (
+        "column >= value AND column < value2, ISO datetime с зоной, "
+        'например "2025-11-01T00:00:00+00:00"'
+    ),
+    ConditionOp.date_eq: 'один день по UTC, value = "YYYY-MM-DD"',
+}
+
+_COLUMN_HINTS: Dict[str, str] = {
+    "creator_id": "id креатора, 32 hex-символа (только videos)",
+    "video_created_at": "когда видео опубликовано (только videos)",
+    "created_at": "время снапшота (video_snapshots) или появления записи (videos)",
+    "views_count": "всего просмотров (на момент снапшота для video_snapshots)",
+    "delta_views_count": "прирост просмотров с прошлого снапшота (video_snapshots)",
+}
+
+_EXAMPLE_QUESTIONS = [
+    "Сколько всего видео есть в системе?",
+    "Сколько видео у креатора с id aca1061a9d324ecf8c3fa2bb32d7be63 вышло "
+    "с 1 по 5 ноября 2025 года?",
+    "Сколько видео набрало больше 100 000 просмотров?",
+    "На сколько просмотров в сумме выросли все видео 28 ноября 2025?",
+    "Сколько разных видео получали новые просмотры 27 ноября 2025?",
+]
+
+
+def _enum_lines(hints: Dict, enum_cls) -> List[str]:
+    missing = [member.value for member in enum_cls if member not in hints]
+    if missing:
+        raise ValueError(f"No prompt hint for {enum_cls.__name__}: {missing}")
+    return [f"- {member.value}: {hints[member]}" for member in enum_cls]
+
+
+def build_generated_prompt() -> str:
+    """Компактный промпт по тем же ограничениям, что проверяет sql_builder."""
+    lines = [
+        "Переведи вопрос на русском о данных видео в JSON-спецификацию запроса.",
+        "Не пиши SQL. Ответ — только JSON-объект без Markdown и пояснений:",
+        '{"table": ..., "aggregation": ..., "field": ..., '
+        '"filters": [{"column": ..., "op": ..., "value": ..., "value2": ...}]}',
+        "value2 — только для between_datetime.",
+        "",
+        "table и допустимые field:",
+    ]
+    for table in Table:
+        fields = ", ".join(ALLOWED_FIELDS_BY_TABLE[table])
+        lines.append(f"- {table.value}: {fields}")
+    lines.append("delta_* — прирост с прошлого (почасового) снапшота.")
+
+    lines += ["", "aggregation:"] + _enum_lines(_AGGREGATION_HINTS, Aggregation)
+    lines += ["", "filters.column:"]
+    for column in sorted(ALLOWED_FILTER_COLUMNS):
+        kind = "datetime" if column in DATETIME_COLUMNS else "значение"
+        hint = _COLUMN_HINTS.get(column, kind)
+        lines.append(f"- {column}: {hint}")
+    lines += ["", "filters.op:"] + _enum_lines(_OP_HINTS, ConditionOp)
+
+    lines += ["", "Примеры:"]
+    for question in _EXAMPLE_QUESTIONS:
+        spec = parse_spec_by_rules(question)
+        if spec is None:
+            continue
+        answer = json.dumps(
+            spec.model_dump(mode="json", exclude_none=True), ensure_ascii=False
+        )
+        lines += [f"Вопрос: {question}", f"Ответ: {answer}"]
+    return "\n".join(lines) + "\n"
+
+
+GENERATED_SPEC_SYSTEM_PROMPT = build_generated_prompt()
+
+_PROMPTS = {
+    "manual": SPEC_SYSTEM_PROMPT,
+    "generated": GENERATED_SPEC_SYSTEM_PROMPT,
+}
+
+
+def get_spec_system_prompt(mode: str, batch: bool = False) -> str:
+    """Системный промпт для режима схемы ("manual"/"generated")."""
+    if mode not in _PROMPTS:
+        raise ValueError(f"Unknown prompt mode '{mode}'")
+    prompt = _PROMPTS[mode]
+    return prompt + BATCH_SPEC_SUFFIX if batch else prompt
+
+
+def prompt_cache_key(prompt: str) -> str:
+    """Ключ для провайдерского кэша промпта: меняется вместе с текстом."""
+    return "spec-" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
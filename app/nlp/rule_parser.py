@@ -0,0 +1,332 @@
+"""
+Быстрый разбор типовых вопросов без LLM.
+
+Текст нормализуется, сущности (id креатора, даты, числа) заменяются на слоты,
+а оставшийся шаблон сравнивается целиком с набором регулярок.
+Если ни одна не подошла — возвращаем None, и вопрос уходит в LLM.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
+
+from nlp.normalize import normalize_question
+from nlp.spec import Aggregation, Condition, ConditionOp, QuerySpec, Table
+
+MONTHS = {
+    "января": 1,
+    "февраля": 2,
+    "марта": 3,
+    "апреля": 4,
+    "мая": 5,
+    "июня": 6,
+    "июля": 7,
+    "августа": 8,
+    "сентября": 9,
+    "октября": 10,
+    "ноября": 11,
+    "декабря": 12,
+}
+_MONTH = "(" + "|".join(MONTHS) + ")"
+_YEAR = r"(\d{4})(?: года| год| г)?"
+
+# "с 1 ноября по 5 декабря 2025"
+_RANGE_TWO_MONTHS_RE = re.compile(
+    rf"\bс (\d{{1,2}}) {_MONTH} (?:по|до) (\d{{1,2}}) {_MONTH} {_YEAR}\b"
+)
+# "с 1 по 5 ноября 2025", "1-5 ноября 2025"
+_RANGE_RE = re.compile(
+    rf"(?:\bс )?\b(\d{{1,2}})(?: по | до |-)(\d{{1,2}}) {_MONTH} {_YEAR}\b"
+)
+# "28 ноября 2025"
+_DAY_RE = re.compile(rf"\b(\d{{1,2}}) {_MONTH} {_YEAR}\b")
+# "2025-11-28", "28.11.2025"
+_ISO_DAY_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_DOTTED_DAY_RE = re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b")
+
+_CREATOR_ID_RE = re.compile(r"\b[0-9a-f]{32}\b")
+_NUMBER_RE = re.compile(r"\b\d+\b")
+
+DATE_SLOT = "<date>"
+ID_SLOT = "<id>"
+NUMBER_SLOT = "<n>"
+
+
+@dataclass
+class DateRange:
+    """Полуинтервал дней [start; end)."""
+
+    start: date
+    end: date
+
+    @property
+    def is_single_day(self) -> bool:
+        return self.end - self.start == timedelta(days=1)
+
+
+@dataclass
+class Slots:
+    """Сущности, вынутые из текста вопроса, в порядке появления."""
+
+    dates: List[DateRange] = field(default_factory=list)
+    ids: List[str] = field(default_factory=list)
+    numbers: List[int] = field(default_factory=list)
+
+
+def _day(year: str, month: int, day: str) -> date:
+    return date(int(year), month, int(day))
+
+
+def _replace_dates(s: str, slots: Slots) -> str:
+    """Заменяет все найденные даты/диапазоны на DATE_SLOT."""
+
+    def two_months(m: re.Match) -> str:
+        start = _day(m.group(5), MONTHS[m.group(2)], m.group(1))
+        end = _day(m.group(5), MONTHS[m.group(4)], m.group(3))
+        return _add_range(slots, start, end)
+
+    def one_month(m: re.Match) -> str:
+        month = MONTHS[m.group(3)]
+        start = _day(m.group(4), month, m.group(1))
+        end = _day(m.group(4), month, m.group(2))
+        return _add_range(slots, start, end)
+
+    def one_day(m: re.Match) -> str:
+        day = _day(m.group(3), MONTHS[m.group(2)], m.group(1))
+        return _add_range(slots, day, day)
+
+    def iso_day(m: re.Match) -> str:
+        day = _day(m.group(1), int(m.group(2)), m.group(3))
+        return _add_range(slots, day, day)
+
+    def dotted_day(m: re.Match) -> str:
+        day = _day(m.group(3), int(m.group(2)), m.group(1))
+        return _add_range(slots, day, day)
+
+    s = _RANGE_TWO_MONTHS_RE.sub(two_months, s)
+    s = _RANGE_RE.sub(one_month, s)
+    s = _DAY_RE.sub(one_day, s)
+    s = _ISO_DAY_RE.sub(iso_day, s)
+    s = _DOTTED_DAY_RE.sub(dotted_day, s)
+    return s
+
+
+def _add_range(slots: Slots, first_day: date, last_day: date) -> str:
+    if last_day < first_day:
+        raise ValueError("date range end is before start")
+    slots.dates.append(DateRange(first_day, last_day + timedelta(days=1)))
+    return DATE_SLOT
+
+
+def extract_slots(user_text: str) -> Tuple[str, Slots]:
+    """
+    Нормализует текст и заменяет сущности на слоты.
+    Возвращает (шаблон, слоты). Некорректная дата -> ValueError.
+    """
+    slots = Slots()
+    s = normalize_question(user_text)
+    s = _replace_dates(s, slots)
+
+    def creator_id(m: re.Match) -> str:
+        slots.ids.append(m.group(0))
+        return ID_SLOT
+
+    def number(m: re.Match) -> str:
+        slots.numbers.append(int(m.group(0)))
+        return NUMBER_SLOT
+
+    s = _CREATOR_ID_RE.sub(creator_id, s)
+    s = _NUMBER_RE.sub(number, s)
+    return s, slots
+
+
+def _iso_midnight(day: date) -> str:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc).isoformat()
+
+
+def date_condition(column: str, period: DateRange) -> Condition:
+    """Один день -> date_eq, несколько дней -> between_datetime (как в промпте)."""
+    if period.is_single_day:
+        return Condition(
+            column=column, op=ConditionOp.date_eq, value=period.start.isoformat()
+        )
+    return Condition(
+        column=column,
+        op=ConditionOp.between_datetime,
+        value=_iso_midnight(period.start),
+        value2=_iso_midnight(period.end),
+    )
+
+
+# --- шаблоны вопросов ---------------------------------------------------------
+
+_VIDEO = r"(?:видео|роликов|видеороликов)"
+# "на <дата>" не берём: это "по состоянию на", а не "за день"
+_PERIOD = rf"(?: (?:за|в|в период))? {DATE_SLOT}"
+
+_METRIC_FIELDS = {
+    "просмотров": "delta_views_count",
+    "просмотры": "delta_views_count",
+    "лайков": "delta_likes_count",
+    "лайки": "delta_likes_count",
+    "комментариев": "delta_comments_count",
+    "комментарии": "delta_comments_count",
+    "жалоб": "delta_reports_count",
+    "жалобы": "delta_reports_count",
+}
+_METRIC = "(" + "|".join(_METRIC_FIELDS) + ")"
+
+_COUNT_VIDEOS_RE = re.compile(
+    rf"сколько (?:всего )?{_VIDEO}"
+    rf"(?P<creator> (?:у|от) (?:креатора|автора)(?: с)?(?: id)? {ID_SLOT})?"
+    rf"(?P<published> (?:вышло|вышли|опубликовано|опубликовал|выпустил|появилось|"
+    rf"было опубликовано|выложено|выложил|загружено|загрузил|создано))?"
+    rf"(?: есть| имеется)?(?: в (?:системе|базе))?(?: всего)?"
+    # дата — только после глагола публикации: "сколько видео <дата>" без него
+    # может значить и "по состоянию на дату", такое разбирает LLM
+    rf"(?(published)(?P<period>{_PERIOD})?)"
+)
+_VIEWS_THRESHOLD_RE = re.compile(
+    rf"сколько (?:всего )?{_VIDEO}"
+    rf"(?P<creator> (?:у|от) (?:креатора|автора)(?: с)?(?: id)? {ID_SLOT})?"
+    rf"(?: (?:набрало|набрали|имеет|имеют|получило|получили))? "
+    rf"(?:больше|более|свыше) {NUMBER_SLOT} просмотров(?: за все время)?"
+)
+_DELTA_SUM_RE = re.compile(
+    rf"на сколько {_METRIC} (?:в сумме |суммарно |всего )?"
+    rf"(?:выросли|выросло|увеличились|прибавили)(?: все)?(?: {_VIDEO})?(?: в (?:системе|базе))?"
+    rf"{_PERIOD}"
+)
+_DELTA_SUM_ALT_RE = re.compile(
+    rf"(?:какой )?(?:суммарный |общий )?прирост {_METRIC}"
+    rf"(?: (?:у|по) (?:всех )?{_VIDEO})?{_PERIOD}"
+)
+_DISTINCT_GROWTH_RE = re.compile(
+    rf"сколько (?:разных |различных |уникальных )?{_VIDEO} "
+    rf"(?:получали|получили|получало) (?:новые )?просмотры{_PERIOD}"
+)
+
+
+def _count_videos(m: re.Match, slots: Slots) -> QuerySpec:
+    filters: List[Condition] = []
+    if m.group("creator"):
+        filters.append(
+            Condition(column="creator_id", op=ConditionOp.eq, value=slots.ids[0])
+        )
+    if m.group("period"):
+        filters.append(date_condition("video_created_at", slots.dates[0]))
+    return QuerySpec(
+        table=Table.videos,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=filters,
+    )
+
+
+def _views_threshold(m: re.Match, slots: Slots) -> QuerySpec:
+    filters: List[Condition] = []
+    if m.group("creator"):
+        filters.append(
+            Condition(column="creator_id", op=ConditionOp.eq, value=slots.ids[0])
+        )
+    filters.append(
+        Condition(column="views_count", op=ConditionOp.gt, value=slots.numbers[0])
+    )
+    return QuerySpec(
+        table=Table.videos,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=filters,
+    )
+
+
+def _delta_sum(m: re.Match, slots: Slots) -> QuerySpec:
+    return QuerySpec(
+        table=Table.video_snapshots,
+        aggregation=Aggregation.sum_field,
+        field=_METRIC_FIELDS[m.group(1)],
+        filters=[date_condition("created_at", slots.dates[0])],
+    )
+
+
+def _distinct_growth(m: re.Match, slots: Slots) -> QuerySpec:
+    return QuerySpec(
+        table=Table.video_snapshots,
+        aggregation=Aggregation.count_distinct,
+        field="video_id",
+        filters=[
+            date_condition("created_at", slots.dates[0]),
+            Condition(column="delta_views_count", op=ConditionOp.gt, value=0),
+        ],
+    )
+
+
+# (шаблон вопроса, сборщик QuerySpec по совпадению и слотам)
+_RULES: List[Tuple[re.Pattern, Callable[[re.Match, Slots], QuerySpec]]] = [
+    (_COUNT_VIDEOS_RE, _count_videos),
+    (_VIEWS_THRESHOLD_RE, _views_threshold),
+    (_DELTA_SUM_RE, _delta_sum),
+    (_DELTA_SUM_ALT_RE, _delta_sum),
+    (_DISTINCT_GROWTH_RE, _distinct_growth),
+]
+
+
+def parse_spec_by_rules(user_text: str) -> Optional[QuerySpec]:
+    """
+    Пытается разобрать вопрос без LLM.
+    Возвращает QuerySpec или None, если вопрос не подошёл ни под один шаблон.
+    """
+    try:
+        template, slots = extract_slots(user_text)
+    except ValueError:
+        # например, "31 ноября" — пусть разбирается LLM
+        return None
+
+    for pattern, build in _RULES:
+        m = pattern.fullmatch(template)
+        if m is None:
+            continue
+        # шаблон должен использовать все вынутые сущности, иначе смысл теряется
+        used = m.group(0)
+        if (
+            used.count(DATE_SLOT) != len(slots.dates)
+            or used.count(ID_SLOT) != len(slots.ids)
+            or used.count(NUMBER_SLOT) != len(slots.numbers)
+        ):
+            continue
+        return build(m, slots)
+
+    return None
+
+
+if __name__ == "__main__":
+    # Отчёт о покрытии: python app/nlp/rule_parser.py questions.jsonl|questions.txt
+    import json
+    import sys
+
+    if len(sys.argv) != 2:
+        raise SystemExit(1)
+
+    questions: List[str] = []
+    with open(sys.argv[1], encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                line = (
+                    item.get("question") or item.get("text") or item.get("title") or ""
+                )
+            questions.append(line)
+
+    matched = 0
+    for q in questions:
+        spec = parse_spec_by_rules(q)
+        if spec is not None:
+            matched += 1
+        print(f"{'RULE' if spec else 'LLM '} | {q}")
+
+    share = matched / len(questions) if questions else 0.0
+    print(f"без LLM: {matched}/{len(questions)} ({share:.1%})")
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Set, Union
 
 from pydantic import BaseModel
 
@@ -49,3 +49,39 @@ class QuerySpec(BaseModel):
     aggregation: Aggregation
     field: str
     filters: List[Condition] = []
+
+
+# Какие поля можно агрегировать в каких таблицах
+ALLOWED_FIELDS_BY_TABLE: Dict[Table, List[str]] = {
+    Table.videos: [
+        "id",
+        "views_count",
+        "likes_count",
+        "comments_count",
+        "reports_count",
+    ],
+    Table.video_snapshots: [
+        "id",
+        "video_id",
+        "views_count",
+        "likes_count",
+        "comments_count",
+        "reports_count",
+        "delta_views_count",
+        "delta_likes_count",
+        "delta_comments_count",
+        "delta_reports_count",
+    ],
+}
+
+# По каким колонкам можно фильтровать в каких таблицах
+ALLOWED_FILTER_COLUMNS_BY_TABLE: Dict[Table, Set[str]] = {
+    Table.videos: {"creator_id", "video_created_at", "views_count", "created_at"},
+    Table.video_snapshots: {"views_count", "created_at", "delta_views_count"},
+}
+
+# По каким колонкам в принципе разрешаем фильтровать
+ALLOWED_FILTER_COLUMNS = set().union(*ALLOWED_FILTER_COLUMNS_BY_TABLE.values())
+
+# Какие колонки считаем datetime-полями
+DATETIME_COLUMNS = {"video_created_at", "created_at"}
@@ -0,0 +1,378 @@
+"""
+Повторное использование QuerySpec для перефразированных вопросов.
+
+Каждый разобранный моделью вопрос превращается в шаблон: сущности (id
+креатора, даты, числа) вынимаются через rule_parser.extract_slots, а в
+QuerySpec соответствующие значения заменяются ссылками на слоты. Шаблоны
+вопросов индексируются TF-IDF по символьным n-граммам (хэшированным в
+векторы фиксированной длины, NumPy). Векторы хранятся разреженно и
+дописываются по одному; idf и нормы считаются при поиске за один проход
+по ненулевым элементам, так что добавление шаблона ничего не перестраивает.
+Новый вопрос с косинусной близостью
+к известному шаблону не ниже порога получает QuerySpec найденного шаблона
+со своими сущностями — без обращения к LLM.
+
+Индекс хранится на диске как журнал JSONL: новые шаблоны дописываются в
+конец, при старте журнал читается и векторизуется заново.
+"""
+
+import asyncio
+import json
+import re
+import zlib
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from pydantic import ValidationError
+
+from core.config import spec_index_settings
+from core.metrics import Gauge, single_value
+from nlp.rule_parser import Slots, date_condition, extract_slots
+from nlp.spec import DATETIME_COLUMNS, ConditionOp, QuerySpec
+from services.canonical import canonicalize_spec
+from services.sql_builder import build_sql_and_params
+
+# Ссылка на слот в значении фильтра шаблона: "<date:0>", "<id:1>", "<n:0>"
+_SLOT_REF_RE = re.compile(r"<(date|id|n):(\d+)>")
+
+# Длины символьных n-грамм и размерность хэшированного вектора
+NGRAM_SIZES = (3, 4, 5)
+VECTOR_DIM = 1 << 12
+
+# Сколько сущностей каждого вида в вопросе: (даты, id, числа)
+Signature = Tuple[int, int, int]
+
+# Основы слов, от которых зависит поле или агрегат. Замена одного такого слова
+# почти не меняет n-граммы длинного вопроса ("лайков" -> "просмотров"), поэтому
+# у найденного шаблона набор этих основ должен совпасть с вопросом.
+KEY_STEMS = (
+    "просмотр",
+    "лайк",
+    "коммент",
+    "жалоб",
+    "разн",
+    "различн",
+    "уникальн",
+)
+
+
+def _signature(slots: Slots) -> Signature:
+    return len(slots.dates), len(slots.ids), len(slots.numbers)
+
+
+def _key_terms(template: str) -> FrozenSet[str]:
+    return frozenset(stem for stem in KEY_STEMS if stem in template)
+
+
+def _term_counts(template: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Символьные n-граммы шаблона, хэшированные в VECTOR_DIM корзин:
+    (номера корзин, сублинейный tf по ним).
+    """
+    padded = f" {template} "
+    # crc32, а не hash(): номера корзин не должны меняться между запусками
+    buckets = [
+        zlib.crc32(padded[i : i + n].encode("utf-8")) % VECTOR_DIM
+        for n in NGRAM_SIZES
+        for i in range(len(padded) - n + 1)
+    ]
+    columns, counts = np.unique(np.array(buckets, dtype=np.int64), return_counts=True)
+    # повтор n-граммы важен меньше, чем её наличие
+    return columns, (1.0 + np.log(counts)).astype(np.float32)
+
+
+def make_spec_template(spec: QuerySpec, slots: Slots) -> Optional[Dict[str, Any]]:
+    """
+    QuerySpec -> JSON-шаблон, где значения из вопроса заменены ссылками на слоты.
+    None — spec нельзя обобщить: дата или креатор в фильтре не взяты из вопроса
+    (шаблон подставил бы их в чужой вопрос) или сущность вопроса не использована.
+    """
+    try:
+        # spec, который не соберётся в SQL, повторять незачем
+        build_sql_and_params(spec)
+    except ValueError:
+        return None
+    canonical = canonicalize_spec(spec)
+    if canonical is None:
+        return None
+
+    date_conditions = {}
+    used = set()
+    filters: List[Dict[str, Any]] = []
+    for cond in canonical.filters:
+        item = cond.model_dump(mode="json")
+        if cond.column in DATETIME_COLUMNS:
+            if cond.column not in date_conditions:
+                date_conditions[cond.column] = [
+                    date_condition(cond.column, period) for period in slots.dates
+                ]
+            if cond not in date_conditions[cond.column]:
+                return None
+            index = date_conditions[cond.column].index(cond)
+            item = {
+                "column": cond.column,
+                "op": cond.op.value,
+                "value": f"<date:{index}>",
+            }
+            used.add(("date", index))
+        elif cond.column == "creator_id" and cond.op == ConditionOp.eq:
+            if cond.value not in slots.ids:
+                return None
+            index = slots.ids.index(cond.value)
+            item["value"] = f"<id:{index}>"
+            used.add(("id", index))
+        elif cond.value in slots.numbers and isinstance(cond.value, int):
+            index = slots.numbers.index(cond.value)
+            item["value"] = f"<n:{index}>"
+            used.add(("n", index))
+        filters.append(item)
+
+    dates, ids, numbers = _signature(slots)
+    expected = {("date", i) for i in range(dates)}
+    expected |= {("id", i) for i in range(ids)} | {("n", i) for i in range(numbers)}
+    if used != expected:
+        return None
+
+    template = canonical.model_dump(mode="json")
+    template["filters"] = filters
+    return template
+
+
+def fill_spec_template(template: Dict[str, Any], slots: Slots) -> Optional[QuerySpec]:
+    """Подставляет сущности нового вопроса в шаблон. None — шаблон не подошёл."""
+    filters = []
+    for item in template["filters"]:
+        m = _SLOT_REF_RE.fullmatch(str(item["value"]))
+        if m is None:
+            filters.append(item)
+            continue
+        kind, index = m.group(1), int(m.group(2))
+        if kind == "date":
+            cond = date_condition(item["column"], slots.dates[index])
+            filters.append(cond.model_dump(mode="json"))
+        elif kind == "id":
+            filters.append({**item, "value": slots.ids[index]})
+        else:
+            filters.append({**item, "value": slots.numbers[index]})
+    try:
+        spec = QuerySpec.model_validate({**template, "filters": filters})
+    except ValidationError:
+        return None
+    return canonicalize_spec(spec)
+
+
+class SpecIndex:
+    """Шаблоны вопросов с их QuerySpec и поиск ближайшего по TF-IDF."""
+
+    def __init__(self, path: Path, threshold: float, max_entries: int):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        self.templates: List[str] = []
+        self.spec_templates: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        # tf всех шаблонов подряд (разреженно): строка, корзина, вес;
+        # заполнены первые _nnz элементов, ёмкость растёт удвоением
+        self._nnz = 0
+        self._entry_rows = np.zeros(0, dtype=np.int64)
+        self._entry_columns = np.zeros(0, dtype=np.int64)
+        self._entry_tf = np.zeros(0, dtype=np.float32)
+        # число шаблонов с корзиной (для idf)
+        self._doc_freq = np.zeros(VECTOR_DIM, dtype=np.float32)
+        # сигнатуры по строкам, заполнены первые len(self) строк
+        self._signature_array = np.zeros((0, 3), dtype=np.int64)
+        self._key_terms: List[FrozenSet[str]] = []
+
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def memory_bytes(self) -> int:
+        return sum(
+            values.nbytes
+            for values in (
+                self._doc_freq,
+                self._entry_rows,
+                self._entry_columns,
+                self._entry_tf,
+                self._signature_array,
+            )
+        )
+
+    # --- хранение -------------------------------------------------------------
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            entries = await asyncio.to_thread(self._read_log)
+            for template, signature, spec_template in entries:
+                self._put(template, signature, spec_template)
+            self._loaded = True
+            logger.info(f"spec index: {len(self)} templates from {self.path}")
+
+    def _read_log(self) -> List[Tuple[str, Signature, Dict[str, Any]]]:
+        if not self.path.exists():
+            return []
+        entries = []
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    entries.append(
+                        (item["template"], tuple(item["signature"]), item["spec"])
+                    )
+                except (ValueError, KeyError, TypeError) as e:
+                    # недописанная строка после падения процесса — пропускаем
+                    logger.warning(f"spec index: skipping broken line: {e}")
+        return entries
+
+    def _append_log(self, line: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    # --- индекс ---------------------------------------------------------------
+
+    def _put(
+        self, template: str, signature: Signature, spec_template: Dict[str, Any]
+    ) -> bool:
+        """Добавляет или обновляет шаблон. False — индекс заполнен."""
+        row = self._rows.get(template)
+        if row is not None:
+            # более поздний ответ модели для того же шаблона заменяет старый
+            self.spec_templates[row] = spec_template
+            return True
+        if len(self.templates) >= self.max_entries:
+            return False
+
+        columns, tf = _term_counts(template)
+        row = len(self.templates)
+        self._append_entries(row, columns, tf, signature)
+        self._rows[template] = row
+        self.templates.append(template)
+        self.spec_templates.append(spec_template)
+        self._doc_freq[columns] += 1.0
+        self._key_terms.append(_key_terms(template))
+        return True
+
+    def _append_entries(
+        self, row: int, columns: np.ndarray, tf: np.ndarray, signature: Signature
+    ) -> None:
+        """Дописывает tf и сигнатуру строки row, при нехватке места удваивая буферы."""
+        end = self._nnz + len(columns)
+        if end > len(self._entry_tf):
+            size = max(end, 2 * len(self._entry_tf), 1024)
+            self._entry_rows = np.resize(self._entry_rows, size)
+            self._entry_columns = np.resize(self._entry_columns, size)
+            self._entry_tf = np.resize(self._entry_tf, size)
+        self._entry_rows[self._nnz : end] = row
+        self._entry_columns[self._nnz : end] = columns
+        self._entry_tf[self._nnz : end] = tf
+        self._nnz = end
+
+        if row >= len(self._signature_array):
+            size = max(row + 1, 2 * len(self._signature_array), 64)
+            self._signature_array = np.resize(self._signature_array, (size, 3))
+        self._signature_array[row] = signature
+
+    def _nearest(self, template: str, signature: Signature) -> Tuple[int, float]:
+        """Номер ближайшего шаблона с той же сигнатурой и его близость (-1, 0.0)."""
+        n = len(self.templates)
+        idf = (np.log((1.0 + n) / (1.0 + self._doc_freq)) + 1.0).astype(np.float32)
+        columns, tf = _term_counts(template)
+        query = np.zeros(VECTOR_DIM, dtype=np.float32)
+        query[columns] = tf * idf[columns]
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return -1, 0.0
+
+        # косинус с каждым шаблоном за один проход по ненулевым tf-idf весам
+        rows = self._entry_rows[: self._nnz]
+        entry_columns = self._entry_columns[: self._nnz]
+        weights = self._entry_tf[: self._nnz] * idf[entry_columns]
+        norms = np.sqrt(np.bincount(rows, weights * weights, minlength=n))
+        dots = np.bincount(rows, weights * query[entry_columns], minlength=n)
+        scores = dots / (np.maximum(norms, 1e-12) * norm)
+        # шаблон с другим набором сущностей не заполнить сущностями вопроса
+        mismatch = (self._signature_array[:n] != np.array(signature)).any(axis=1)
+        scores[mismatch] = -1.0
+        terms = _key_terms(template)
+        for row in np.flatnonzero(scores >= self.threshold):
+            if self._key_terms[row] != terms:
+                scores[row] = -1.0
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    async def lookup(self, user_text: str) -> Optional[QuerySpec]:
+        """QuerySpec по самому похожему известному вопросу или None."""
+        await self._ensure_loaded()
+        if not self.templates:
+            return None
+        try:
+            template, slots = extract_slots(user_text)
+        except ValueError:
+            return None
+
+        row, score = self._nearest(template, _signature(slots))
+        if row < 0 or score < self.threshold:
+            return None
+        spec = fill_spec_template(self.spec_templates[row], slots)
+        if spec is not None:
+            logger.bind(score=round(score, 3), template=self.templates[row]).debug(
+                "spec index hit"
+            )
+        return spec
+
+    async def add(self, user_text: str, spec: QuerySpec) -> None:
+        """Запоминает разобранный моделью вопрос, если его можно обобщить."""
+        await self._ensure_loaded()
+        try:
+            template, slots = extract_slots(user_text)
+        except ValueError:
+            return
+        spec_template = make_spec_template(spec, slots)
+        if spec_template is None:
+            return
+        row = self._rows.get(template)
+        if row is not None and self.spec_templates[row] == spec_template:
+            return
+        signature = _signature(slots)
+        if not self._put(template, signature, spec_template):
+            return
+
+        line = json.dumps(
+            {"template": template, "signature": signature, "spec": spec_template},
+            ensure_ascii=False,
+        )
+        try:
+            await asyncio.to_thread(self._append_log, line)
+        except OSError as e:
+            logger.warning(f"spec index: failed to persist template: {e}")
+
+
+spec_index = SpecIndex(
+    Path(spec_index_settings.SPEC_INDEX_PATH),
+    threshold=spec_index_settings.SPEC_INDEX_THRESHOLD,
+    max_entries=spec_index_settings.SPEC_INDEX_MAX_ENTRIES,
+)
+
+Gauge(
+    "spec_index_templates",
+    "Question templates in the spec index",
+    single_value(spec_index.__len__),
+)
+Gauge(
+    "spec_index_bytes",
+    "Memory held by the spec index vectors",
+    single_value(spec_index.memory_bytes),
+)
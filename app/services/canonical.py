@@ -0,0 +1,132 @@
+"""
+Приведение QuerySpec к каноничному виду перед кэшами и SQL.
+
+Равносильные вопросы дают разные спецификации (фильтры в другом порядке,
+between_datetime ровно на сутки вместо date_eq, COUNT(DISTINCT id) вместо
+COUNT(*)), из-за чего промахиваются кэши ответов и SQL-шаблонов. Здесь:
+- фильтры по одной колонке сливаются (диапазоны пересекаются, gt -> максимум);
+- противоречивые фильтры дают None — ответ 0 без похода в БД;
+- агрегат заменяется на самый дешёвый равносильный;
+- фильтры сортируются.
+"""
+
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from nlp.spec import DATETIME_COLUMNS, Aggregation, Condition, ConditionOp, QuerySpec
+from services.sql_builder import _aggregate, _build_params, _where_clauses
+
+# Строковые колонки фильтров; остальные не-datetime колонки — целочисленные
+TEXT_FILTER_COLUMNS = {"creator_id"}
+
+
+def _utc(value: datetime) -> datetime:
+    # naive datetime sql_builder считает UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _value_fits(column: str, value: Any) -> bool:
+    """Тип значения подходит колонке (иначе фильтр не трогаем — пусть упадёт SQL)."""
+    if column in TEXT_FILTER_COLUMNS:
+        return isinstance(value, str)
+    return column not in DATETIME_COLUMNS and _is_int(value)
+
+
+def _range_condition(column: str, start: datetime, end: datetime) -> Condition:
+    """Ровно одни сутки UTC -> date_eq, иначе between_datetime в UTC."""
+    if start.time() == time.min and end - start == timedelta(days=1):
+        return Condition(
+            column=column, op=ConditionOp.date_eq, value=start.date().isoformat()
+        )
+    return Condition(
+        column=column,
+        op=ConditionOp.between_datetime,
+        value=start.isoformat(),
+        value2=end.isoformat(),
+    )
+
+
+def _sort_key(cond: Condition) -> Tuple[str, str, str, str]:
+    return (cond.column, cond.op.value, str(cond.value), str(cond.value2))
+
+
+def canonicalize_spec(spec: QuerySpec) -> Optional[QuerySpec]:
+    """
+    Каноничная форма spec, которая считается так же, как исходная.
+    None — фильтры противоречат друг другу и ответ заведомо 0
+    (COUNT, SUM и COUNT DISTINCT по пустому набору в sql_builder дают 0).
+    Некорректный spec возвращается как есть: его отвергнет sql_builder.
+    """
+    try:
+        _aggregate(spec)
+        _where_clauses(spec)
+        params = _build_params(spec)
+    except ValueError:
+        return spec
+
+    ranges: Dict[str, Tuple[datetime, datetime]] = {}
+    equals: Dict[str, Any] = {}
+    greater: Dict[str, int] = {}
+    untouched: List[Condition] = []
+
+    param_index = 0
+    for cond in spec.filters:
+        column = cond.column
+        if cond.op in (ConditionOp.eq, ConditionOp.gt):
+            value = params[f"p{param_index}"]
+            param_index += 1
+            # gt по строкам зависит от collation, его не сворачиваем
+            if not _value_fits(column, value) or (
+                cond.op == ConditionOp.gt and not _is_int(value)
+            ):
+                untouched.append(cond)
+            elif cond.op == ConditionOp.eq:
+                if column in equals and equals[column] != value:
+                    return None
+                equals[column] = value
+            else:
+                greater[column] = max(greater.get(column, value), value)
+            continue
+
+        start = _utc(params[f"p{param_index}"])
+        end = _utc(params[f"p{param_index + 1}"])
+        param_index += 2
+        if column not in DATETIME_COLUMNS:
+            untouched.append(cond)
+            continue
+        if column in ranges:
+            start = max(start, ranges[column][0])
+            end = min(end, ranges[column][1])
+        ranges[column] = (start, end)
+
+    filters: List[Condition] = list(untouched)
+    for column, value in equals.items():
+        if column in greater:
+            if value <= greater.pop(column):
+                return None
+        filters.append(Condition(column=column, op=ConditionOp.eq, value=value))
+    for column, value in greater.items():
+        filters.append(Condition(column=column, op=ConditionOp.gt, value=value))
+    for column, (start, end) in ranges.items():
+        if start >= end:
+            return None
+        filters.append(_range_condition(column, start, end))
+    filters.sort(key=_sort_key)
+
+    aggregation, field = spec.aggregation, spec.field
+    # id уникален в обеих таблицах: COUNT(DISTINCT id) = COUNT(*)
+    if aggregation == Aggregation.count_distinct and field == "id":
+        aggregation = Aggregation.count_rows
+    # COUNT(*) от поля не зависит
+    if aggregation == Aggregation.count_rows:
+        field = "id"
+
+    return QuerySpec(
+        table=spec.table, aggregation=aggregation, field=field, filters=filters
+    )
@@ -0,0 +1,339 @@
+"""
+In-memory колоночный движок для QuerySpec.
+
+videos и video_snapshots целиком держатся в памяти как NumPy-массивы по
+колонкам. Строки каждой таблицы отсортированы по её основной временной
+колонке, поэтому фильтр по диапазону времени — это два бинарных поиска
+и срез, а остальные фильтры — векторные маски по срезу.
+
+Семантика повторяет SQL из sql_builder: фильтры и их параметры берутся
+оттуда же (_where_clauses/_build_params), так что ошибки и граничные случаи
+совпадают. После каждой загрузки данные обновляются инкрементально: по
+data_loads берутся затронутые дни, снапшоты этих дней перечитываются,
+videos (их немного, а счётчики меняются) — целиком.
+"""
+
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from base.session_maker import database_manager
+from core.metrics import Gauge, single_value
+from nlp.spec import Aggregation, ConditionOp, QuerySpec, Table
+from services.data_events import get_loads_since
+from services.sql_builder import (
+    _aggregate,
+    _build_params,
+    _where_clauses,
+    touches_compacted_days,
+)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _epoch_us(column: str) -> str:
+    # EXTRACT(EPOCH) — numeric, так что микросекунды получаются точно
+    return f"(EXTRACT(EPOCH FROM {column}) * 1000000)::bigint"
+
+
+def to_micros(value: datetime) -> int:
+    """datetime -> микросекунды от эпохи UTC; naive считается UTC, как в sql_builder."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+_VIDEO_NUMERIC = ("views_count", "likes_count", "comments_count", "reports_count")
+_SNAPSHOT_NUMERIC = _VIDEO_NUMERIC + (
+    "delta_views_count",
+    "delta_likes_count",
+    "delta_comments_count",
+    "delta_reports_count",
+)
+
+_VIDEOS_SQL = f"""
+    SELECT id::text, creator_id,
+           {_epoch_us("video_created_at")}, {_epoch_us("created_at")},
+           {", ".join(_VIDEO_NUMERIC)}
+    FROM videos
+"""
+
+_SNAPSHOTS_SQL = f"""
+    SELECT video_id::text, {_epoch_us("created_at")},
+           {", ".join(_SNAPSHOT_NUMERIC)}
+    FROM video_snapshots
+"""
+
+_SNAPSHOTS_RANGE_SQL = (
+    _SNAPSHOTS_SQL + " WHERE created_at >= :start AND created_at < :end"
+)
+
+_DAY_US = 24 * 60 * 60 * 1_000_000
+
+
+class ColumnTable:
+    """
+    Таблица из колонок одинаковой длины, отсортированная по sort_column.
+    Колонки "id"/"video_id" хранятся как целые коды видео.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], sort_column: str):
+        order = np.argsort(columns[sort_column], kind="stable")
+        self.columns = {name: values[order] for name, values in columns.items()}
+        self.sort_column = sort_column
+
+    def __len__(self) -> int:
+        return len(self.columns[self.sort_column])
+
+    def time_slice(self, start: int, end: int) -> Tuple[int, int]:
+        """Строки с sort_column в [start; end) — бинарным поиском."""
+        values = self.columns[self.sort_column]
+        lo = int(np.searchsorted(values, start, side="left"))
+        hi = int(np.searchsorted(values, end, side="left"))
+        return lo, max(lo, hi)
+
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in self.columns.values())
+
+
+def _empty_snapshots() -> Dict[str, np.ndarray]:
+    columns = {name: np.empty(0, dtype=np.int64) for name in _SNAPSHOT_NUMERIC}
+    columns["video_id"] = np.empty(0, dtype=np.int64)
+    columns["created_at"] = np.empty(0, dtype=np.int64)
+    return columns
+
+
+class ColumnarStore:
+    """Снимок videos/video_snapshots в памяти и вычисление QuerySpec по нему."""
+
+    def __init__(self) -> None:
+        self.videos: Optional[ColumnTable] = None
+        self.snapshots: Optional[ColumnTable] = None
+        # uuid видео -> постоянный код (коды не меняются между обновлениями)
+        self._video_codes: Dict[str, int] = {}
+        # номер последней учтённой загрузки из data_loads
+        self.generation: Optional[int] = None
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.videos is not None and self.snapshots is not None
+
+    def memory_bytes(self) -> int:
+        total = 0
+        for table in (self.videos, self.snapshots):
+            if table is not None:
+                total += table.nbytes()
+        return total
+
+    # --- загрузка -------------------------------------------------------------
+
+    def _code(self, video_id: str) -> int:
+        code = self._video_codes.get(video_id)
+        if code is None:
+            code = len(self._video_codes)
+            self._video_codes[video_id] = code
+        return code
+
+    def _video_columns(self, rows: Sequence[Any]) -> Dict[str, np.ndarray]:
+        ids, creators, *rest = zip(*rows) if rows else ((),) * (4 + 4)
+        columns: Dict[str, np.ndarray] = {
+            "id": np.fromiter((self._code(v) for v in ids), np.int64, len(ids)),
+            "creator_id": np.array(creators, dtype=str),
+        }
+        for name, values in zip(
+            ("video_created_at", "created_at") + _VIDEO_NUMERIC, rest
+        ):
+            columns[name] = np.array(values, dtype=np.int64)
+        return columns
+
+    def _snapshot_columns(self, rows: Sequence[Any]) -> Dict[str, np.ndarray]:
+        if not rows:
+            return _empty_snapshots()
+        video_ids, *rest = zip(*rows)
+        columns: Dict[str, np.ndarray] = {
+            "video_id": np.fromiter(
+                (self._code(v) for v in video_ids), np.int64, len(video_ids)
+            )
+        }
+        for name, values in zip(("created_at",) + _SNAPSHOT_NUMERIC, rest):
+            columns[name] = np.array(values, dtype=np.int64)
+        return columns
+
+    async def refresh(self) -> None:
+        """
+        Подтягивает изменения с прошлого обновления. Первый вызов — полная
+        загрузка, дальше перечитываются только дни из новых записей data_loads.
+        """
+        async with self._refresh_lock, database_manager.create_session() as session:
+            # один снимок данных на всё чтение
+            await session.execute(
+                text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            )
+            if self.generation is None:
+                generation, _ = await get_loads_since(session, 0)
+                videos, snapshots = await self._load_full(session)
+            else:
+                generation, days = await get_loads_since(session, self.generation)
+                if generation == self.generation:
+                    return
+                videos, snapshots = await self._load_days(session, days)
+            # подменяем обе таблицы разом, без await между присваиваниями
+            self.videos, self.snapshots = videos, snapshots
+            self.generation = generation
+        logger.info(
+            f"columnar store at load #{generation}: videos={len(self.videos)}, "
+            f"snapshots={len(self.snapshots)}, {self.memory_bytes() / 2**20:.1f} MiB"
+        )
+
+    async def _load_videos(self, session: AsyncSession) -> ColumnTable:
+        rows = (await session.execute(text(_VIDEOS_SQL))).all()
+        return ColumnTable(self._video_columns(rows), "video_created_at")
+
+    async def _load_full(
+        self, session: AsyncSession
+    ) -> Tuple[ColumnTable, ColumnTable]:
+        videos = await self._load_videos(session)
+        rows = (await session.execute(text(_SNAPSHOTS_SQL))).all()
+        return videos, ColumnTable(self._snapshot_columns(rows), "created_at")
+
+    async def _load_days(
+        self, session: AsyncSession, days: Set[date]
+    ) -> Tuple[ColumnTable, ColumnTable]:
+        # videos немного, а счётчики в них обновляются — перечитываем целиком
+        videos = await self._load_videos(session)
+        if not days:
+            return videos, self.snapshots
+
+        fresh: List[Any] = []
+        day_starts: List[int] = []
+        for day in sorted(days):
+            start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+            rows = await session.execute(
+                text(_SNAPSHOTS_RANGE_SQL),
+                {"start": start, "end": start + timedelta(days=1)},
+            )
+            fresh.extend(rows.all())
+            day_starts.append(to_micros(start))
+
+        # выкидываем старые строки затронутых дней и добавляем перечитанные
+        old = self.snapshots.columns
+        old_days = old["created_at"] - np.mod(old["created_at"], _DAY_US)
+        keep = ~np.isin(old_days, np.array(day_starts, dtype=np.int64))
+        new = self._snapshot_columns(fresh)
+        merged = {
+            name: np.concatenate([values[keep], new[name]])
+            for name, values in old.items()
+        }
+        return videos, ColumnTable(merged, "created_at")
+
+    # --- вычисление -----------------------------------------------------------
+
+    def evaluate(self, spec: QuerySpec) -> int:
+        """
+        Считает spec так же, как execute_query_spec в Postgres.
+        Некорректный spec -> ValueError (те же проверки, что в sql_builder).
+        """
+        if not self.ready:
+            raise RuntimeError("columnar store is not loaded")
+        if touches_compacted_days(spec):
+            # в копии только дневные строки свёрнутых дней, роллапа нет
+            raise ValueError("Compacted days are answered by the daily rollup only")
+
+        # те же проверки поля/фильтров, что и при сборке SQL
+        _aggregate(spec)
+        _where_clauses(spec)
+        params = _build_params(spec)
+
+        table = self.videos if spec.table == Table.videos else self.snapshots
+        lo, hi = 0, len(table)
+        masks: List[Tuple[str, str, Any, Any]] = []
+
+        param_index = 0
+        for cond in spec.filters:
+            if cond.column not in table.columns:
+                raise ValueError(
+                    f"Column '{cond.column}' does not exist in table "
+                    f"'{spec.table.value}'"
+                )
+            if cond.op in (ConditionOp.eq, ConditionOp.gt):
+                value = self._scalar(cond.column, params[f"p{param_index}"])
+                masks.append((cond.column, cond.op.value, value, None))
+                param_index += 1
+                continue
+
+            start = to_micros(params[f"p{param_index}"])
+            end = to_micros(params[f"p{param_index + 1}"])
+            param_index += 2
+            if cond.column == table.sort_column:
+                s_lo, s_hi = table.time_slice(start, end)
+                lo = max(lo, s_lo)
+                hi = max(lo, min(hi, s_hi))
+            else:
+                masks.append((cond.column, "range", start, end))
+
+        mask: Optional[np.ndarray] = None
+        for column, op, value, value2 in masks:
+            values = table.columns[column][lo:hi]
+            if op == "eq":
+                current = values == value
+            elif op == "gt":
+                current = values > value
+            else:
+                current = (values >= value) & (values < value2)
+            mask = current if mask is None else mask & current
+
+        return self._reduce(table, spec, lo, hi, mask)
+
+    @staticmethod
+    def _scalar(column: str, value: Any) -> Any:
+        # asyncpg не приводит типы за нас: строка в bigint — ошибка, и здесь тоже
+        if column == "creator_id":
+            if not isinstance(value, str):
+                raise ValueError(f"Column '{column}' expects a string value")
+            return value
+        if column in ("video_created_at", "created_at"):
+            raise ValueError(f"eq/gt on datetime column '{column}' is not supported")
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"Column '{column}' expects an integer value")
+        return value
+
+    @staticmethod
+    def _reduce(
+        table: ColumnTable,
+        spec: QuerySpec,
+        lo: int,
+        hi: int,
+        mask: Optional[np.ndarray],
+    ) -> int:
+        def column(name: str) -> np.ndarray:
+            values = table.columns[name][lo:hi]
+            return values if mask is None else values[mask]
+
+        if spec.aggregation == Aggregation.count_rows:
+            return int(hi - lo) if mask is None else int(np.count_nonzero(mask))
+
+        if spec.aggregation == Aggregation.sum_field:
+            if spec.field in ("id", "video_id"):
+                raise ValueError(f"Cannot sum uuid field '{spec.field}'")
+            return int(column(spec.field).sum())
+
+        # COUNT(DISTINCT ...); id — первичный ключ, он уникален по построению
+        if spec.field == "id" and spec.table == Table.video_snapshots:
+            return int(hi - lo) if mask is None else int(np.count_nonzero(mask))
+        return int(np.unique(column(spec.field)).size)
+
+
+columnar_store = ColumnarStore()
+
+Gauge(
+    "columnar_store_bytes",
+    "Memory held by the in-memory columnar store",
+    single_value(columnar_store.memory_bytes),
+)
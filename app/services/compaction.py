@@ -0,0 +1,299 @@
+"""
+Прореживание старых снапшотов: почасовые строки video_snapshots старше
+HOURLY_SNAPSHOTS_RETENTION_DAYS дней сворачиваются в одну строку на
+(день UTC, видео).
+
+Дневная строка берёт id, created_at и *_count последнего снапшота дня (итоги
+на конец дня), а delta_* — суммы за день. Роллап свёрнутого дня собран по
+почасовым строкам до свёртки и больше не пересчитывается
+(snapshot_compactions). Запросы, окно которых задевает свёрнутые дни,
+sql_builder считает только по роллапу, в любом бэкенде; те, что по роллапу
+не считаются (внутри суток, по *_count, с другими фильтрами), отвергаются
+с ValueError — по дневным строкам ответ был бы другим.
+
+День сворачивается батчами по видео, каждый батч — своя короткая транзакция
+с lock_timeout. Суммы за день верны после любого батча, так что прерванная
+свёртка ответов не портит и продолжается следующим запуском.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional, Set, Tuple
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from base.database import engine
+from base.session_maker import database_manager
+from core.config import compaction_settings
+from services.data_events import notify_data_loaded, record_data_load
+from services.partitions import existing_snapshot_partitions, partition_name
+from services.rollup import COMPACTIONS_TABLE, compacted_days, refresh_daily_rollup
+
+# Сколько раз повторять батч, не дождавшийся блокировки
+_LOCK_RETRIES = 3
+
+# Колонка дневной строки -> выражение по почасовым строкам одного видео
+_DAILY_COLUMNS = {
+    "id": "id",
+    "video_id": "video_id",
+    "views_count": "views_count",
+    "likes_count": "likes_count",
+    "reports_count": "reports_count",
+    "comments_count": "comments_count",
+    "delta_views_count": "SUM(delta_views_count) OVER day",
+    "delta_likes_count": "SUM(delta_likes_count) OVER day",
+    "delta_reports_count": "SUM(delta_reports_count) OVER day",
+    "delta_comments_count": "SUM(delta_comments_count) OVER day",
+    "created_at": "created_at",
+    "updated_at": "MAX(updated_at) OVER day",
+}
+
+_CREATE_STAGE_SQL = text(
+    "CREATE TEMP TABLE IF NOT EXISTS video_snapshots_compact "
+    "(LIKE video_snapshots INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+)
+
+# Следующие batch видео дня, у которых больше одной строки, уходят из таблицы
+# в stage. Курсор включительный: последнее видео прошлого батча уже свёрнуто
+# до одной строки и отсекается HAVING.
+_MOVE_BATCH_SQL = text(
+    """
+    WITH batch AS (
+        SELECT video_id FROM video_snapshots
+        WHERE created_at >= :start AND created_at < :end AND video_id >= :after
+        GROUP BY video_id
+        HAVING COUNT(*) > 1
+        ORDER BY video_id
+        LIMIT :batch
+    ), removed AS (
+        DELETE FROM video_snapshots AS s
+        USING batch
+        WHERE s.video_id = batch.video_id
+          AND s.created_at >= :start AND s.created_at < :end
+        RETURNING s.*
+    )
+    INSERT INTO video_snapshots_compact SELECT * FROM removed
+    """
+)
+
+# id и created_at последнего снапшота дня уже удалены из таблицы — конфликта нет
+_INSERT_DAILY_SQL = text(
+    f"""
+    INSERT INTO video_snapshots ({", ".join(_DAILY_COLUMNS)})
+    SELECT DISTINCT ON (video_id) {", ".join(_DAILY_COLUMNS.values())}
+    FROM video_snapshots_compact
+    WINDOW day AS (PARTITION BY video_id)
+    ORDER BY video_id, created_at DESC
+    """
+)
+
+_BATCH_STATS_SQL = text(
+    """
+    SELECT COUNT(*), COUNT(DISTINCT video_id),
+           (SELECT video_id FROM video_snapshots_compact
+            ORDER BY video_id DESC LIMIT 1)
+    FROM video_snapshots_compact
+    """
+)
+
+_START_DAY_SQL = text(
+    f"""
+    INSERT INTO {COMPACTIONS_TABLE} (day, bytes_before)
+    VALUES (:day, :bytes)
+    ON CONFLICT (day) DO NOTHING
+    """
+)
+
+# в транзакции батча: счётчики всегда совпадают с тем, что закоммичено
+_COUNT_BATCH_SQL = text(
+    f"""
+    UPDATE {COMPACTIONS_TABLE}
+    SET rows_removed = rows_removed + :removed, rows_added = rows_added + :added
+    WHERE day = :day
+    """
+)
+
+_FINISH_DAY_SQL = text(
+    f"""
+    UPDATE {COMPACTIONS_TABLE}
+    SET finished_at = now(), bytes_after = :bytes
+    WHERE day = :day
+    """
+)
+
+_FINISHED_DAYS_SQL = text(
+    f"SELECT day FROM {COMPACTIONS_TABLE} WHERE finished_at IS NOT NULL"
+)
+
+_RELATION_SIZE_SQL = text(
+    "SELECT COALESCE(pg_total_relation_size(to_regclass(:name)), 0)"
+)
+
+# Начальное значение курсора по video_id: меньше любого UUID не бывает
+_MIN_UUID = UUID(int=0)
+
+
+@dataclass
+class DayCompaction:
+    """Итог свёртки одного дня."""
+
+    day: date
+    rows_removed: int = 0
+    rows_added: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    finished: bool = False
+
+    @property
+    def rows_reclaimed(self) -> int:
+        return self.rows_removed - self.rows_added
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+async def refresh_compacted_days() -> None:
+    """Перечитывает список свёрнутых дней для маршрутизации запросов."""
+    async with database_manager.create_session() as session:
+        await compacted_days.refresh(session)
+
+
+def compaction_cutoff(
+    retention_days: Optional[int] = None, today: Optional[date] = None
+) -> date:
+    """Первый день UTC, который ещё хранится почасово."""
+    if retention_days is None:
+        retention_days = compaction_settings.HOURLY_SNAPSHOTS_RETENTION_DAYS
+    if today is None:
+        today = datetime.now(timezone.utc).date()
+    return today - timedelta(days=retention_days)
+
+
+async def days_to_compact(session: AsyncSession, cutoff: date) -> List[date]:
+    """Дни с партициями раньше cutoff, ещё не свёрнутые до конца."""
+    days = await existing_snapshot_partitions(session)
+    finished: Set[date] = set((await session.execute(_FINISHED_DAYS_SQL)).scalars())
+    return sorted(day for day in days if day < cutoff and day not in finished)
+
+
+async def _relation_size(session: AsyncSession, name: str) -> int:
+    return int((await session.execute(_RELATION_SIZE_SQL, {"name": name})).scalar_one())
+
+
+def _lock_timeout_sql(scope: str = "") -> str:
+    return f"SET {scope}lock_timeout = {compaction_settings.COMPACTION_LOCK_TIMEOUT_MS}"
+
+
+async def _vacuum_partition(name: str, full: bool) -> None:
+    # VACUUM не работает внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(_lock_timeout_sql()))
+        try:
+            # FULL переписывает партицию под эксклюзивной блокировкой — но только
+            # одного старого дня, и после свёртки она маленькая
+            options = "FULL, ANALYZE" if full else "ANALYZE"
+            await conn.execute(text(f"VACUUM ({options}) {name}"))
+        finally:
+            # соединение вернётся в пул
+            await conn.execute(text("RESET lock_timeout"))
+
+
+async def _compact_batch(
+    session: AsyncSession, day: date, after: UUID, batch: int
+) -> Optional[Tuple[int, int, UUID]]:
+    """Один батч в своей транзакции: (удалено, добавлено, курсор) или None."""
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    await session.execute(text(_lock_timeout_sql("LOCAL ")))
+    await session.execute(_CREATE_STAGE_SQL)
+    await session.execute(
+        _MOVE_BATCH_SQL,
+        {
+            "start": start,
+            "end": start + timedelta(days=1),
+            "after": after,
+            "batch": batch,
+        },
+    )
+    removed, videos, last_video = (await session.execute(_BATCH_STATS_SQL)).one()
+    if not removed:
+        await session.rollback()
+        return None
+    await session.execute(_INSERT_DAILY_SQL)
+    await session.execute(
+        _COUNT_BATCH_SQL, {"day": day, "removed": removed, "added": videos}
+    )
+    await session.commit()
+    return int(removed), int(videos), UUID(str(last_video))
+
+
+async def compact_day(
+    session: AsyncSession,
+    day: date,
+    batch_videos: Optional[int] = None,
+    vacuum_full: Optional[bool] = None,
+) -> DayCompaction:
+    """
+    Сворачивает почасовые снапшоты дня в дневные строки и чистит партицию.
+    Если батч не дождался блокировок за _LOCK_RETRIES попыток, день остаётся
+    недосвёрнутым (finished=False) — следующий запуск продолжит.
+    """
+    if batch_videos is None:
+        batch_videos = compaction_settings.COMPACTION_BATCH_VIDEOS
+    if vacuum_full is None:
+        vacuum_full = compaction_settings.COMPACTION_VACUUM_FULL
+    name = partition_name(day)
+    report = DayCompaction(day=day)
+
+    # роллап дня — последний раз по почасовым строкам (у начатого дня он уже
+    # не пересчитывается), и в той же транзакции отметка о свёртке
+    report.bytes_before = await _relation_size(session, name)
+    await refresh_daily_rollup(session, [day])
+    started = await session.execute(
+        _START_DAY_SQL, {"day": day, "bytes": report.bytes_before}
+    )
+    if started.rowcount:
+        # день объявлен свёрнутым до первого батча: бот переводит запросы
+        # к нему на роллап раньше, чем исчезнут почасовые строки
+        generation = await record_data_load(session, [day])
+        await session.commit()
+        await notify_data_loaded(session, generation)
+    await session.commit()
+
+    after = _MIN_UUID
+    failures = 0
+    while True:
+        try:
+            done = await _compact_batch(session, day, after, batch_videos)
+        except DBAPIError as e:
+            await session.rollback()
+            failures += 1
+            if failures > _LOCK_RETRIES:
+                logger.warning(f"compaction of {day} stopped: {e}")
+                return report
+            await asyncio.sleep(failures)
+            continue
+        if done is None:
+            break
+        removed, added, after = done
+        report.rows_removed += removed
+        report.rows_added += added
+        failures = 0
+
+    try:
+        await _vacuum_partition(name, vacuum_full)
+    except DBAPIError as e:
+        # место освободит autovacuum; свёртка от этого не зависит
+        logger.warning(f"vacuum of {name} failed: {e}")
+
+    report.bytes_after = await _relation_size(session, name)
+    await session.execute(_FINISH_DAY_SQL, {"day": day, "bytes": report.bytes_after})
+    await session.commit()
+    report.finished = True
+    return report
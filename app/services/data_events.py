@@ -0,0 +1,83 @@
+import asyncio
+from datetime import date
+from typing import Awaitable, Callable, Iterable, Optional, Set, Tuple
+
+import asyncpg
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import db_settings
+
+# Канал Postgres LISTEN/NOTIFY: загрузчик сообщает, что данные поменялись
+DATA_LOADED_CHANNEL = "data_loaded"
+
+
+async def record_data_load(session: AsyncSession, touched_days: Iterable[date]) -> int:
+    """
+    Записывает загрузку в data_loads и возвращает её номер (поколение данных).
+    Коммит — на вызывающей стороне.
+    """
+    result = await session.execute(
+        text("INSERT INTO data_loads (touched_days) VALUES (:days) RETURNING id"),
+        {"days": sorted(set(touched_days))},
+    )
+    return int(result.scalar_one())
+
+
+async def get_load_generation(session: AsyncSession) -> int:
+    """Номер последней загрузки, 0 — если загрузок ещё не было."""
+    result = await session.execute(text("SELECT COALESCE(MAX(id), 0) FROM data_loads"))
+    return int(result.scalar_one())
+
+
+async def get_loads_since(
+    session: AsyncSession, generation: int
+) -> Tuple[int, Set[date]]:
+    """
+    Загрузки новее generation: (номер последней, объединение затронутых дней).
+    Если новых загрузок нет, возвращается (generation, пустое множество).
+    """
+    result = await session.execute(
+        text("SELECT id, touched_days FROM data_loads WHERE id > :gen ORDER BY id"),
+        {"gen": generation},
+    )
+    days: Set[date] = set()
+    for load_id, touched in result.all():
+        generation = load_id
+        days.update(touched)
+    return generation, days
+
+
+async def notify_data_loaded(session: AsyncSession, generation: int = 0) -> None:
+    """
+    Отправить уведомление о загрузке новых данных (уходит после commit).
+    В payload — номер загрузки из data_loads.
+    """
+    await session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": DATA_LOADED_CHANNEL, "payload": str(generation)},
+    )
+    await session.commit()
+
+
+async def listen_data_loaded(
+    callback: Callable[[], Awaitable[None] | None],
+) -> asyncpg.Connection:
+    """
+    Подписаться на уведомления о загрузке данных.
+    Использует отдельное соединение вне пула, его надо закрыть при остановке.
+    """
+    dsn = db_settings.DB_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+    conn = await asyncpg.connect(dsn)
+
+    def _on_notify(
+        connection: asyncpg.Connection, pid: int, channel: str, payload: Optional[str]
+    ) -> None:
+        logger.info(f"got {channel} notification from pid={pid}")
+        result = callback()
+        if result is not None:
+            asyncio.ensure_future(result)
+
+    await conn.add_listener(DATA_LOADED_CHANNEL, _on_notify)
+    return conn
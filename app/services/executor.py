@@ -1,14 +1,95 @@
+from typing import List, Sequence
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from base.session_maker import database_manager
+from core.config import query_settings
+from core.metrics import stage_timer
 from nlp.spec import QuerySpec
-from services.sql_builder import execute_query_spec
+from services.canonical import canonicalize_spec
+from services.columnar import columnar_store
+from services.precomputed import get_precomputed_answer
+from services.query_log import log_query
+from services.singleflight import SingleFlight
+from services.time_index import time_index
+from services.sql_builder import (
+    execute_query_spec,
+    execute_query_specs,
+    touches_compacted_days,
+)
+
+# Одинаковые спецификации, пришедшие одновременно, считаются одним запросом
+_value_flight: SingleFlight[int] = SingleFlight()
+
+
+def spec_cache_key(spec: QuerySpec) -> str:
+    """Ключ спецификации для кэшей и склейки запросов: её JSON."""
+    return spec.model_dump_json()
+
+
+async def _answer_in_new_session(spec: QuerySpec) -> int:
+    async with database_manager.create_session() as session:
+        if query_settings.USE_PRECOMPUTED_ANSWERS:
+            with stage_timer("precomputed_lookup"):
+                value = await get_precomputed_answer(session, spec)
+            if value is not None:
+                return value
+        return await execute_query_spec(session, spec, log_query)
 
 
 async def answer_query_spec(spec: QuerySpec) -> int:
     """
     Фасад: взять QuerySpec, сходить в БД, вернуть одно число.
-    Открывает и закрывает сессию сам.
+    Открывает и закрывает сессию сам. Spec сначала приводится к каноничному
+    виду; заведомо пустой результат возвращается без запроса.
+    С USE_COLUMNAR_BACKEND считает по копии данных в памяти, без БД;
+    с USE_TIME_INDEX подходящие запросы берёт из индекса по времени;
+    с USE_PRECOMPUTED_ANSWERS сначала ищет ответ, посчитанный загрузчиком.
     """
-    async with database_manager.create_session() as session:
-        return await execute_query_spec(session, spec)
+    canonical = canonicalize_spec(spec)
+    if canonical is None:
+        return 0
+    spec = canonical
+
+    # свёрнутые дни считаются только по роллапу в БД
+    in_memory = not touches_compacted_days(spec)
+
+    if in_memory and query_settings.USE_COLUMNAR_BACKEND and columnar_store.ready:
+        with stage_timer("columnar_eval"):
+            return columnar_store.evaluate(spec)
+
+    if query_settings.USE_TIME_INDEX:
+        with stage_timer("time_index"):
+            value = time_index.try_evaluate(spec)
+        if value is not None:
+            return value
+
+    return await _value_flight.do(
+        spec_cache_key(spec), lambda: _answer_in_new_session(spec)
+    )
+
+
+async def answer_query_specs(specs: Sequence[QuerySpec]) -> List[int]:
+    """
+    Пакетный фасад для дашбордов и отчётов: все spec считаются одним
+    запросом к БД (по одному проходу на таблицу). Числа — в порядке specs.
+    """
+    canonical = [canonicalize_spec(spec) for spec in specs]
+    # противоречивые spec сразу дают 0, в БД уходят только остальные
+    pending = [spec for spec in canonical if spec is not None]
+
+    if not pending:
+        values: List[int] = []
+    elif (
+        query_settings.USE_COLUMNAR_BACKEND
+        and columnar_store.ready
+        and not any(touches_compacted_days(spec) for spec in pending)
+    ):
+        with stage_timer("columnar_eval"):
+            values = [columnar_store.evaluate(spec) for spec in pending]
+    else:
+        async with database_manager.create_session() as session:
+            values = await execute_query_specs(session, pending, log_query)
+
+    found = iter(values)
+    return [0 if spec is None else next(found) for spec in canonical]
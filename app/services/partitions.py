@@ -0,0 +1,84 @@
+"""
+Дневные партиции video_snapshots (PARTITION BY RANGE (created_at)).
+
+Партиция на сутки UTC называется video_snapshots_pYYYYMMDD. Строку без
+подходящей партиции Postgres не примет, поэтому загрузчик перед записью
+снапшотов создаёт партиции их дней — и ещё PARTITIONS_AHEAD_DAYS вперёд,
+чтобы следующие загрузки обычно обходились без DDL (CREATE TABLE ... PARTITION
+OF берёт на родителе эксклюзивную блокировку и на миг задерживает чтения).
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+SNAPSHOTS_TABLE = "video_snapshots"
+PARTITION_PREFIX = f"{SNAPSHOTS_TABLE}_p"
+PARTITIONS_AHEAD_DAYS = 7
+
+# Параллельные загрузчики создают партиции по очереди
+_PARTITIONS_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext(:name))")
+
+_EXISTING_PARTITIONS_SQL = text(
+    """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = CAST(:parent AS regclass)
+    """
+)
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> date:
+    return datetime.strptime(name[len(PARTITION_PREFIX) :], "%Y%m%d").date()
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+async def existing_snapshot_partitions(session: AsyncSession) -> Set[date]:
+    """Дни, для которых партиции уже есть."""
+    result = await session.execute(
+        _EXISTING_PARTITIONS_SQL, {"parent": SNAPSHOTS_TABLE}
+    )
+    return {
+        partition_day(name)
+        for (name,) in result.all()
+        if name.startswith(PARTITION_PREFIX)
+    }
+
+
+async def create_snapshot_partitions(
+    session: AsyncSession, days: Iterable[date], ahead: int = PARTITIONS_AHEAD_DAYS
+) -> Set[date]:
+    """
+    Создаёт недостающие партиции для days и ahead дней после последнего из них.
+    Возвращает дни, партиции которых теперь точно есть. Коммит — на вызывающей
+    стороне; лучше отдельной короткой транзакцией, не той, что пишет данные.
+    """
+    wanted = set(days)
+    if not wanted:
+        return set()
+    last = max(wanted)
+    wanted.update(last + timedelta(days=i) for i in range(1, ahead + 1))
+
+    await session.execute(_PARTITIONS_LOCK_SQL, {"name": PARTITION_PREFIX})
+    existing = await existing_snapshot_partitions(session)
+    for day in sorted(wanted - existing):
+        start = _day_start(day)
+        end = start + timedelta(days=1)
+        # DDL не принимает bind-параметры; границы — из date, не из ввода
+        await session.execute(
+            text(
+                f"CREATE TABLE {partition_name(day)} PARTITION OF {SNAPSHOTS_TABLE} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+    return wanted | existing
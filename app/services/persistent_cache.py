@@ -0,0 +1,252 @@
+"""
+Кэш текст -> QuerySpec и QuerySpec -> число на диске (SQLite), чтобы рестарт
+бота не начинался с пустых кэшей.
+
+Используется как второй уровень за TTLCache из text_query: промах в памяти
+проверяется здесь, найденное поднимается в память. Записи версионируются:
+- QuerySpec — хэшем системного промпта (сменился промпт или режим — старые
+  разборы не используются);
+- число — номером загрузки данных из data_loads (после новой загрузки старые
+  ответы не используются и удаляются).
+
+Все обращения к SQLite идут в потоках, запись — фоновой задачей пачками,
+ответ пользователю её не ждёт.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from base.session_maker import database_manager
+from core.config import cache_settings, llm_settings
+from core.metrics import Counter
+from nlp.prompts import get_spec_system_prompt, prompt_cache_key
+from nlp.spec import QuerySpec
+from services.data_events import get_load_generation
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS specs (
+    text_key TEXT PRIMARY KEY,
+    prompt_version TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    spec_key TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL,
+    value INTEGER NOT NULL
+);
+"""
+
+_UPSERT_SPEC_SQL = "INSERT OR REPLACE INTO specs VALUES (?, ?, ?, ?)"
+_UPSERT_ANSWER_SQL = "INSERT OR REPLACE INTO answers VALUES (?, ?, ?)"
+_PRUNE_ANSWERS_SQL = "DELETE FROM answers WHERE generation <> ?"
+_PRUNE_SPECS_SQL = "DELETE FROM specs WHERE prompt_version <> ? OR stored_at <= ?"
+
+# Сколько записей берём из очереди в одну транзакцию
+_WRITE_BATCH = 500
+
+PERSISTENT_CACHE = Counter(
+    "persistent_cache_total",
+    "Persistent spec/answer cache lookups and writes",
+    labelnames=("kind", "outcome"),
+)
+
+# (SQL, параметры) для фоновой записи; None — сигнал остановки
+_Write = Optional[Tuple[str, Tuple[Any, ...]]]
+
+
+def prompt_version() -> str:
+    """Версия разборов: хэш текущего системного промпта и режим ответа модели."""
+    prompt = get_spec_system_prompt(llm_settings.LLM_PROMPT_MODE)
+    mode = "structured" if llm_settings.LLM_STRUCTURED_OUTPUT else "text"
+    return f"{prompt_cache_key(prompt)}-{mode}"
+
+
+async def _current_generation() -> int:
+    async with database_manager.create_session() as session:
+        return await get_load_generation(session)
+
+
+class PersistentCache:
+    """SQLite-хранилище за in-memory кэшами; до open() ничего не делает."""
+
+    def __init__(self) -> None:
+        self.path: Optional[Path] = None
+        self.prompt_version = ""
+        # номер загрузки, к которой относятся сохраняемые ответы
+        self.generation: Optional[int] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # одно соединение на все потоки, операции по очереди
+        self._conn_lock = threading.Lock()
+        self._queue: "asyncio.Queue[_Write]" = asyncio.Queue(
+            maxsize=cache_settings.PERSISTENT_CACHE_QUEUE_SIZE
+        )
+        self._writer: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    # --- жизненный цикл -------------------------------------------------------
+
+    async def open(self, path: Path) -> None:
+        """
+        Открывает (создаёт) файл кэша и запускает фоновую запись.
+        Записи от другого промпта, старше SPEC_CACHE_TTL и от прошлых загрузок
+        удаляются — иначе файл растёт без ограничений.
+        """
+        self.path = path
+        self.prompt_version = prompt_version()
+        self.generation = await _current_generation()
+        self._conn = await asyncio.to_thread(self._connect, path)
+        self._writer = asyncio.ensure_future(self._write_loop())
+        self._enqueue(
+            _PRUNE_SPECS_SQL,
+            (self.prompt_version, time.time() - cache_settings.SPEC_CACHE_TTL),
+        )
+        self._enqueue(_PRUNE_ANSWERS_SQL, (self.generation,))
+        logger.info(
+            f"persistent cache at {path}: prompt {self.prompt_version}, "
+            f"load #{self.generation}"
+        )
+
+    @staticmethod
+    def _connect(path: Path) -> sqlite3.Connection:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    async def close(self) -> None:
+        """Дописывает очередь и закрывает файл."""
+        if self._conn is None:
+            return
+        if self._writer is not None:
+            await self._queue.put(None)
+            await self._writer
+            self._writer = None
+        conn, self._conn = self._conn, None
+        await asyncio.to_thread(conn.close)
+
+    async def refresh_generation(self) -> None:
+        """После новой загрузки данных: сохранённые ответы больше не годятся."""
+        if self._conn is None:
+            return
+        # пока номер новой загрузки не прочитан, старым ответам не верим
+        self.generation = None
+        self.generation = await _current_generation()
+        self._enqueue(_PRUNE_ANSWERS_SQL, (self.generation,))
+
+    # --- чтение ---------------------------------------------------------------
+
+    def _fetch_one(self, sql: str, params: Sequence[Any]) -> Optional[Tuple]:
+        with self._conn_lock:
+            if self._conn is None:
+                return None
+            return self._conn.execute(sql, params).fetchone()
+
+    async def get_spec(self, text_key: str) -> Optional[QuerySpec]:
+        if self._conn is None:
+            return None
+        row = await asyncio.to_thread(
+            self._fetch_one,
+            "SELECT spec FROM specs "
+            "WHERE text_key = ? AND prompt_version = ? AND stored_at > ?",
+            (
+                text_key,
+                self.prompt_version,
+                time.time() - cache_settings.SPEC_CACHE_TTL,
+            ),
+        )
+        if row is None:
+            PERSISTENT_CACHE.inc(kind="spec", outcome="miss")
+            return None
+        PERSISTENT_CACHE.inc(kind="spec", outcome="hit")
+        return QuerySpec.model_validate_json(row[0])
+
+    async def get_value(self, spec_key: str) -> Optional[int]:
+        if self._conn is None:
+            return None
+        row = await asyncio.to_thread(
+            self._fetch_one,
+            "SELECT value FROM answers WHERE spec_key = ? AND generation = ?",
+            (spec_key, self.generation),
+        )
+        if row is None:
+            PERSISTENT_CACHE.inc(kind="value", outcome="miss")
+            return None
+        PERSISTENT_CACHE.inc(kind="value", outcome="hit")
+        return int(row[0])
+
+    # --- запись ---------------------------------------------------------------
+
+    def put_spec(self, text_key: str, spec: QuerySpec) -> None:
+        if self._conn is None:
+            return
+        self._enqueue(
+            _UPSERT_SPEC_SQL,
+            (text_key, self.prompt_version, spec.model_dump_json(), time.time()),
+        )
+
+    def put_value(self, spec_key: str, value: int, generation: Optional[int]) -> None:
+        """generation — номер загрузки, при котором ответ начали считать."""
+        if self._conn is None:
+            return
+        if generation is None or generation != self.generation:
+            # пока считали, пришла новая загрузка — ответ мог устареть
+            PERSISTENT_CACHE.inc(kind="value", outcome="stale")
+            return
+        self._enqueue(_UPSERT_ANSWER_SQL, (spec_key, generation, value))
+
+    def _enqueue(self, sql: str, params: Tuple[Any, ...]) -> None:
+        try:
+            self._queue.put_nowait((sql, params))
+        except asyncio.QueueFull:
+            # диск не успевает — теряем запись кэша, а не задерживаем ответ
+            PERSISTENT_CACHE.inc(kind="write", outcome="dropped")
+
+    async def _write_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[str, Tuple[Any, ...]]] = []
+            item = await self._queue.get()
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= _WRITE_BATCH or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            if not batch:
+                continue
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                PERSISTENT_CACHE.inc(len(batch), kind="write", outcome="ok")
+            except sqlite3.Error as e:
+                PERSISTENT_CACHE.inc(len(batch), kind="write", outcome="failed")
+                logger.warning(f"persistent cache write failed: {e}")
+
+    def _write_batch(self, batch: List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        with self._conn_lock:
+            if self._conn is None:
+                return
+            self._conn.execute("BEGIN")
+            try:
+                for sql, params in batch:
+                    self._conn.execute(sql, params)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+
+persistent_cache = PersistentCache()
@@ -0,0 +1,187 @@
+"""
+Заранее посчитанные ответы на самые частые вопросы.
+
+Бот считает, как часто встречается каждый каноничный QuerySpec, и пачками
+сбрасывает счётчики в query_stats — отдельно за каждый день UTC. Загрузчик в
+конце загрузки берёт spec, самые частые за последние QUERY_STATS_WINDOW_DAYS
+дней, считает их одним запросом (execute_query_specs) и кладёт в answers с
+номером своей загрузки; дни старше окна он из query_stats удаляет. executor
+сначала ищет ответ там — это поиск по первичному ключу вместо агрегата по
+таблице.
+
+Ответ из answers годен, только пока его загрузка последняя: после новой
+загрузки старые строки не находятся (и удаляются следующим пересчётом).
+"""
+
+import asyncio
+import hashlib
+from collections import Counter as HitCounter
+from typing import List, Optional
+
+from loguru import logger
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from base.session_maker import database_manager
+from core.config import query_log_settings, query_settings
+from core.metrics import Counter
+from nlp.spec import QuerySpec
+from services.canonical import canonicalize_spec
+from services.query_log import log_query
+from services.rollup import compacted_days
+from services.sql_builder import build_sql_and_params, execute_query_specs
+
+PRECOMPUTED_LOOKUPS = Counter(
+    "precomputed_answer_lookups_total",
+    "Lookups in the precomputed answers table",
+    labelnames=("outcome",),
+)
+
+_TODAY_SQL = "(now() AT TIME ZONE 'UTC')::date"
+
+_UPSERT_STATS_SQL = text(
+    f"""
+    INSERT INTO query_stats (day, spec_hash, spec, hits)
+    VALUES ({_TODAY_SQL}, :spec_hash, :spec, :hits)
+    ON CONFLICT (day, spec_hash) DO UPDATE
+    SET hits = query_stats.hits + EXCLUDED.hits
+    """
+)
+
+# частота за окно — сумма по его дням, а не счётчик за всё время
+_TOP_SPECS_SQL = text(
+    f"""
+    SELECT MIN(spec) FROM query_stats
+    WHERE day > {_TODAY_SQL} - CAST(:days AS integer)
+    GROUP BY spec_hash
+    ORDER BY SUM(hits) DESC, spec_hash
+    LIMIT :limit
+    """
+)
+
+_PRUNE_STATS_SQL = text(
+    f"DELETE FROM query_stats WHERE day <= {_TODAY_SQL} - CAST(:days AS integer)"
+)
+
+_INSERT_ANSWER_SQL = text(
+    "INSERT INTO answers (spec_hash, generation, value) "
+    "VALUES (:spec_hash, :generation, :value) "
+    "ON CONFLICT (spec_hash, generation) DO UPDATE SET value = EXCLUDED.value"
+)
+
+_DELETE_OLD_ANSWERS_SQL = text("DELETE FROM answers WHERE generation < :generation")
+
+# ответ последней загрузки; MAX(id) по первичному ключу data_loads — дёшево
+_GET_ANSWER_SQL = text(
+    """
+    SELECT value FROM answers
+    WHERE spec_hash = :spec_hash
+      AND generation = (SELECT MAX(id) FROM data_loads)
+    """
+)
+
+# каноничный JSON spec -> сколько раз спросили с прошлого сброса
+_pending_hits: "HitCounter[str]" = HitCounter()
+
+
+def _json_hash(spec_json: str) -> str:
+    return hashlib.sha256(spec_json.encode("utf-8")).hexdigest()
+
+
+def spec_hash(spec: QuerySpec) -> str:
+    """Ключ spec в query_stats/answers: хэш его JSON (как spec_cache_key)."""
+    return _json_hash(spec.model_dump_json())
+
+
+def record_spec_hit(spec: QuerySpec) -> None:
+    """Учитывает вопрос с этим (каноничным) spec; в БД уходит при flush."""
+    _pending_hits[spec.model_dump_json()] += 1
+
+
+async def flush_query_stats() -> int:
+    """Сбрасывает накопленные счётчики в query_stats. Возвращает число spec."""
+    if not _pending_hits:
+        return 0
+    hits = dict(_pending_hits)
+    _pending_hits.clear()
+    rows = [
+        {"spec_hash": _json_hash(spec), "spec": spec, "hits": n}
+        for spec, n in hits.items()
+    ]
+    try:
+        async with database_manager.create_session() as session:
+            await session.execute(_UPSERT_STATS_SQL, rows)
+            await session.commit()
+    except Exception as e:
+        # вернём счётчики, попробуем в следующий раз
+        _pending_hits.update(hits)
+        logger.warning(f"query stats flush failed: {e}")
+        return 0
+    return len(rows)
+
+
+async def run_query_stats_flusher() -> None:
+    """
+    Фоновая задача: сброс query_stats раз в QUERY_STATS_FLUSH_INTERVAL.
+    После отмены остаток надо дописать отдельным flush_query_stats().
+    """
+    while True:
+        await asyncio.sleep(query_log_settings.QUERY_STATS_FLUSH_INTERVAL)
+        await flush_query_stats()
+
+
+async def get_precomputed_answer(
+    session: AsyncSession, spec: QuerySpec
+) -> Optional[int]:
+    """Ответ на каноничный spec из answers для последней загрузки или None."""
+    result = await session.execute(_GET_ANSWER_SQL, {"spec_hash": spec_hash(spec)})
+    value = result.scalar_one_or_none()
+    PRECOMPUTED_LOOKUPS.inc(outcome="miss" if value is None else "hit")
+    return None if value is None else int(value)
+
+
+async def precompute_answers(
+    session: AsyncSession, generation: int, limit: Optional[int] = None
+) -> int:
+    """
+    Считает ответы на limit самых частых spec за последние QUERY_STATS_WINDOW_DAYS
+    дней одним запросом и пишет их в answers под номером загрузки generation.
+    Ответы прошлых загрузок и статистика дней вне окна удаляются.
+    Коммит — на вызывающей стороне.
+    Возвращает число посчитанных spec.
+    """
+    if limit is None:
+        limit = query_settings.PRECOMPUTE_TOP_N
+    window = query_log_settings.QUERY_STATS_WINDOW_DAYS
+    # запросы к свёрнутым дням должны уйти в роллап и в процессе загрузчика
+    await compacted_days.refresh(session)
+    await session.execute(_PRUNE_STATS_SQL, {"days": window})
+    result = await session.execute(_TOP_SPECS_SQL, {"days": window, "limit": limit})
+
+    specs: List[QuerySpec] = []
+    for (raw,) in result.all():
+        try:
+            spec = canonicalize_spec(QuerySpec.model_validate_json(raw))
+            if spec is None:
+                continue
+            # один некорректный spec не должен ронять весь пакетный запрос
+            build_sql_and_params(spec)
+        except (ValidationError, ValueError) as e:
+            logger.warning(f"skipping stored spec {raw}: {e}")
+            continue
+        specs.append(spec)
+
+    await session.execute(_DELETE_OLD_ANSWERS_SQL, {"generation": generation})
+    if not specs:
+        return 0
+
+    values = await execute_query_specs(session, specs, log_query)
+    await session.execute(
+        _INSERT_ANSWER_SQL,
+        [
+            {"spec_hash": spec_hash(spec), "generation": generation, "value": value}
+            for spec, value in zip(specs, values)
+        ],
+    )
+    return len(specs)
@@ -0,0 +1,97 @@
+"""
+Журнал SQL-запросов вместо echo=True.
+
+Медленные запросы (дольше QUERY_SLOW_MS) пишутся всегда и, если включено,
+получают EXPLAIN (ANALYZE) в фоне; быстрые — только выборочно
+(QUERY_LOG_SAMPLE_RATE). В запись попадают SQL, параметры и исходный QuerySpec.
+"""
+
+import asyncio
+import random
+from typing import Any, Dict, Sequence, Set, Union
+
+from loguru import logger
+from sqlalchemy import text
+
+from base.session_maker import database_manager
+from core.config import query_log_settings
+from nlp.spec import QuerySpec
+from services.cache import TTLCache
+
+# Один и тот же SQL-шаблон объясняем не чаще раза в QUERY_EXPLAIN_COOLDOWN
+_explained: TTLCache[bool] = TTLCache(
+    maxsize=1024, ttl=query_log_settings.QUERY_EXPLAIN_COOLDOWN
+)
+# Ссылки на фоновые задачи, чтобы их не собрал GC
+_explain_tasks: Set["asyncio.Task[None]"] = set()
+
+# Один QuerySpec или пачка (execute_query_specs)
+SpecOrSpecs = Union[QuerySpec, Sequence[QuerySpec]]
+
+
+def _dump_spec(spec: SpecOrSpecs) -> str:
+    if isinstance(spec, QuerySpec):
+        return spec.model_dump_json()
+    return "[" + ",".join(s.model_dump_json() for s in spec) + "]"
+
+
+def _record(
+    spec: SpecOrSpecs, sql: str, params: Dict[str, Any], duration: float
+) -> Dict[str, Any]:
+    return {
+        "duration_ms": round(duration * 1000, 3),
+        "sql": sql,
+        "params": {k: str(v) for k, v in params.items()},
+        "spec": _dump_spec(spec),
+    }
+
+
+def log_query(
+    spec: SpecOrSpecs, sql: str, params: Dict[str, Any], duration: float
+) -> None:
+    """
+    Фиксирует выполненный запрос. Вызывается после execute, на горячем пути
+    ничего не делает, кроме сравнения с порогом и броска монетки.
+    """
+    settings = query_log_settings
+    if duration * 1000 >= settings.QUERY_SLOW_MS:
+        logger.bind(**_record(spec, sql, params, duration)).warning(
+            f"slow query: {duration * 1000:.1f} ms"
+        )
+        if settings.QUERY_EXPLAIN_SLOW and _explained.get(sql) is None:
+            _explained.set(sql, True)
+            task = asyncio.ensure_future(_explain(spec, sql, params))
+            _explain_tasks.add(task)
+            task.add_done_callback(_explain_tasks.discard)
+        return
+
+    rate = settings.QUERY_LOG_SAMPLE_RATE
+    if rate > 0 and random.random() < rate:
+        logger.bind(**_record(spec, sql, params, duration)).info(
+            f"sampled query: {duration * 1000:.1f} ms"
+        )
+
+
+async def _explain(spec: SpecOrSpecs, sql: str, params: Dict[str, Any]) -> None:
+    """
+    EXPLAIN (ANALYZE, BUFFERS) в отдельной сессии. ANALYZE выполняет запрос
+    ещё раз, поэтому ограничен statement_timeout и делается вне ответа пользователю.
+    """
+    settings = query_log_settings
+    options = "ANALYZE, BUFFERS" if settings.QUERY_EXPLAIN_ANALYZE else "COSTS"
+    try:
+        async with database_manager.create_session() as session:
+            await session.execute(
+                text(
+                    "SET LOCAL statement_timeout = "
+                    f"{int(settings.QUERY_EXPLAIN_TIMEOUT_MS)}"
+                )
+            )
+            result = await session.execute(text(f"EXPLAIN ({options}) {sql}"), params)
+            plan = "\n".join(row[0] for row in result)
+            await session.rollback()
+    except Exception as e:
+        logger.warning(f"EXPLAIN failed for slow query: {e}")
+        return
+
+    logger.bind(sql=sql, spec=_dump_spec(spec)).warning(f"slow query plan:\n{plan}")
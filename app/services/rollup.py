@@ -0,0 +1,108 @@
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Дневной роллап video_snapshots: одна строка на (день UTC, видео)
+ROLLUP_TABLE = "snapshot_daily_rollup"
+
+# Какие суммы хранятся в роллапе (имена совпадают с колонками video_snapshots)
+ROLLUP_SUM_FIELDS = (
+    "delta_views_count",
+    "delta_likes_count",
+    "delta_comments_count",
+    "delta_reports_count",
+)
+
+# Дни, свёрнутые до дневных строк (services.compaction)
+COMPACTIONS_TABLE = "snapshot_compactions"
+
+_COMPACTED_DAYS_SQL = text(
+    f"SELECT day FROM {COMPACTIONS_TABLE} WHERE day = ANY(:days)"
+)
+
+_ALL_COMPACTED_DAYS_SQL = text(f"SELECT day FROM {COMPACTIONS_TABLE}")
+
+_DELETE_DAY_SQL = text(f"DELETE FROM {ROLLUP_TABLE} WHERE day = :day")
+
+_INSERT_DAY_SQL = text(
+    f"""
+    INSERT INTO {ROLLUP_TABLE}
+        (day, video_id, snapshots_count, {", ".join(ROLLUP_SUM_FIELDS)}, has_views_growth)
+    SELECT
+        CAST(:day AS DATE),
+        video_id,
+        COUNT(*),
+        {", ".join(f"SUM({f})" for f in ROLLUP_SUM_FIELDS)},
+        BOOL_OR(delta_views_count > 0)
+    FROM video_snapshots
+    WHERE created_at >= :start AND created_at < :end
+    GROUP BY video_id
+    """
+)
+
+
+def snapshot_day(created_at: datetime) -> date:
+    """День UTC, в который попадает снапшот (так же считает date_eq)."""
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+
+async def get_compacted_days(session: AsyncSession) -> Set[date]:
+    """Дни, свёрнутые или сворачиваемые сейчас (строка в snapshot_compactions)."""
+    return set((await session.execute(_ALL_COMPACTED_DAYS_SQL)).scalars())
+
+
+class CompactedDays:
+    """
+    Свёрнутые дни в памяти процесса. По ним sql_builder отправляет запросы
+    к таким дням в роллап, а in-memory движки их не считают. Обновляется
+    при старте бота и после каждой загрузки (свёртка — тоже загрузка).
+    """
+
+    def __init__(self) -> None:
+        self.days: Tuple[date, ...] = ()
+
+    async def refresh(self, session: AsyncSession) -> None:
+        self.days = tuple(sorted(await get_compacted_days(session)))
+
+    def overlaps(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        """Задевает ли [start; end) хотя бы один свёрнутый день (None — без границы)."""
+        if not self.days:
+            return False
+        first = date.min if start is None else snapshot_day(start)
+        last = date.max if end is None else snapshot_day(end - timedelta.resolution)
+        i = bisect_left(self.days, first)
+        return i < len(self.days) and self.days[i] <= last
+
+
+compacted_days = CompactedDays()
+
+
+async def refresh_daily_rollup(session: AsyncSession, days: Iterable[date]) -> int:
+    """
+    Пересчитывает строки роллапа за указанные дни по сырым снапшотам.
+    Идемпотентно: день целиком удаляется и собирается заново. Свёрнутые дни
+    (services.compaction) пропускаются: почасовых строк у них уже нет, и
+    snapshots_count/has_views_growth по дневным строкам были бы неверны.
+    Устареть их роллап не может: загрузчики (fill_db_script) новых снапшотов
+    в свёрнутые дни не пишут — COPY отказывает, upsert пропускает.
+    Возвращает число пересчитанных дней. Коммит — на вызывающей стороне.
+    """
+    pending = set(days)
+    if pending:
+        result = await session.execute(_COMPACTED_DAYS_SQL, {"days": sorted(pending)})
+        pending -= set(result.scalars())
+    refreshed = 0
+    for day in sorted(pending):
+        start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+        await session.execute(_DELETE_DAY_SQL, {"day": day})
+        await session.execute(
+            _INSERT_DAY_SQL,
+            {"day": day, "start": start, "end": start + timedelta(days=1)},
+        )
+        refreshed += 1
+    return refreshed
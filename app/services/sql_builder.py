@@ -1,151 +1,502 @@
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Tuple
+from datetime import date, datetime, time, timedelta, timezone
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
 
-from nlp.spec import QuerySpec, Table, Aggregation, ConditionOp
-
-
-# Какие поля можно агрегировать в каких таблицах
-ALLOWED_FIELDS_BY_TABLE: Dict[Table, List[str]] = {
-    Table.videos: [
-        "id",
-        "views_count",
-        "likes_count",
-        "comments_count",
-        "reports_count",
-    ],
-    Table.video_snapshots: [
-        "id",
-        "video_id",
-        "views_count",
-        "likes_count",
-        "comments_count",
-        "reports_count",
-        "delta_views_count",
-        "delta_likes_count",
-        "delta_comments_count",
-        "delta_reports_count",
-    ],
-}
-
-# По каким колонкам в принципе разрешаем фильтровать
-ALLOWED_FILTER_COLUMNS = {
-    "creator_id",
-    "video_created_at",
-    "views_count",
-    "created_at",
-    "delta_views_count",
-}
-
-# Какие колонки считаем datetime-полями
-DATETIME_COLUMNS = {"video_created_at", "created_at"}
+from core.config import query_settings
+from core.metrics import stage_timer
+from nlp.spec import (
+    ALLOWED_FIELDS_BY_TABLE,
+    ALLOWED_FILTER_COLUMNS,
+    ALLOWED_FILTER_COLUMNS_BY_TABLE,
+    DATETIME_COLUMNS,
+    QuerySpec,
+    Table,
+    Aggregation,
+    ConditionOp,
+)
+from services.cache import TTLCache
+from services.rollup import ROLLUP_SUM_FIELDS, ROLLUP_TABLE, compacted_days
+
+# Наблюдатель выполненного запроса: (spec или список spec, sql, params, секунды).
+# Журнал запросов подключает слой выше (executor) — билдер о нём не знает.
+QueryObserver = Callable[[Any, str, Dict[str, Any], float], None]
 
 
 def _parse_iso_datetime(value: str) -> datetime:
-    """Ждём строку формата 'YYYY-MM-DDTHH:MM:SS+ZZ:ZZ' или 'YYYY-MM-DDTHH:MM:SS'."""
-    return datetime.fromisoformat(value)
+    """
+    Ждём строку формата 'YYYY-MM-DDTHH:MM:SS+ZZ:ZZ' или 'YYYY-MM-DDTHH:MM:SS'.
+    Без смещения время считается UTC: naive datetime asyncpg передал бы
+    в timestamptz в часовом поясе процесса.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
 
 
-def build_sql_and_params(spec: QuerySpec) -> Tuple[str, Dict[str, Any]]:
+def touches_compacted_days(spec: QuerySpec) -> bool:
     """
-    Собирает SQL-строку и словарь параметров из QuerySpec.
-    Возвращает (sql, params), где sql — SELECT с одним агрегатом и псевдонимом value.
+    Задевает ли окно spec по created_at свёрнутые дни (services.compaction).
+    Почасовых строк у таких дней нет, так что считать их можно только по
+    роллапу. Некорректный spec -> False: его отвергнет обычный путь.
+    """
+    if spec.table != Table.video_snapshots or not compacted_days.days:
+        return False
+    try:
+        params = _build_params(spec)
+    except ValueError:
+        return False
+
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    param_index = 0
+    for cond in spec.filters:
+        if cond.op in (ConditionOp.eq, ConditionOp.gt):
+            param_index += 1
+            if cond.column != "created_at":
+                continue
+            try:
+                moment = _parse_iso_datetime(str(cond.value))
+            except ValueError:
+                # границу не понять — считаем окно открытым
+                continue
+            lo = moment
+            hi = moment + timedelta.resolution if cond.op == ConditionOp.eq else None
+        else:
+            lo, hi = params[f"p{param_index}"], params[f"p{param_index + 1}"]
+            param_index += 2
+            if cond.column != "created_at":
+                continue
+        start = lo if start is None else max(start, lo)
+        if hi is not None:
+            end = hi if end is None else min(end, hi)
+
+    if start is not None and end is not None and start >= end:
+        return False
+    return compacted_days.overlaps(start, end)
+
+
+def _rollup_period(
+    spec: QuerySpec, compacted: bool = False
+) -> Optional[Tuple[date, date]]:
+    """
+    Можно ли посчитать spec по дневному роллапу snapshot_daily_rollup.
+    Возвращает полуинтервал дней [start; end) или None.
+
+    Подходят запросы к video_snapshots с одним фильтром по created_at,
+    выровненным по суткам UTC (date_eq или between_datetime от полуночи до
+    полуночи), плюс "delta_views_count > 0" для COUNT(DISTINCT video_id).
+    Если окно задевает свёрнутые дни (compacted), роллап используется и при
+    выключенном USE_DAILY_ROLLUP, а spec без фильтра по created_at считается
+    по всем дням роллапа.
+    """
+    if spec.table != Table.video_snapshots:
+        return None
+    if not query_settings.USE_DAILY_ROLLUP and not compacted:
+        return None
+
+    if spec.aggregation == Aggregation.sum_field:
+        if spec.field not in ROLLUP_SUM_FIELDS:
+            return None
+    elif spec.aggregation == Aggregation.count_distinct:
+        if spec.field != "video_id":
+            return None
+    elif spec.aggregation != Aggregation.count_rows:
+        return None
+
+    period: Optional[Tuple[date, date]] = None
+    for cond in spec.filters:
+        if cond.column == "created_at" and period is None:
+            period = _day_aligned_period(cond.op, cond.value, cond.value2)
+            if period is None:
+                return None
+        elif (
+            spec.aggregation == Aggregation.count_distinct
+            and cond.column == "delta_views_count"
+            and cond.op == ConditionOp.gt
+            and cond.value == 0
+        ):
+            continue
+        else:
+            return None
+
+    if period is None and compacted:
+        return date.min, date.max
+    return period
+
+
+def _route(spec: QuerySpec) -> Optional[Tuple[date, date]]:
+    """
+    Период роллапа для spec (см. _rollup_period) или None — считать по
+    исходной таблице. Spec, которому нужны почасовые снапшоты свёрнутых
+    дней, отвергается: по дневным строкам ответ был бы другим.
+    """
+    compacted = touches_compacted_days(spec)
+    period = _rollup_period(spec, compacted)
+    if period is None and compacted:
+        raise ValueError(
+            "Query depends on hourly snapshots, but its period includes compacted days"
+        )
+    return period
+
+
+def _day_aligned_period(
+    op: ConditionOp, value: Any, value2: Any
+) -> Optional[Tuple[date, date]]:
+    try:
+        if op == ConditionOp.date_eq:
+            day = datetime.fromisoformat(str(value)).date()
+            return day, day + timedelta(days=1)
+
+        if op == ConditionOp.between_datetime and value2 is not None:
+            bounds = []
+            for raw in (value, value2):
+                dt = _parse_iso_datetime(str(raw))
+                offset = dt.utcoffset()
+                if dt.time() != time.min or (offset is not None and offset):
+                    return None
+                bounds.append(dt.date())
+            return bounds[0], bounds[1]
+    except ValueError:
+        # кривую дату пусть отвергнет обычный путь
+        return None
+
+    return None
+
+
+def _rollup_aggregate(spec: QuerySpec) -> Tuple[str, str]:
+    """(функция агрегата, её аргумент) для роллапа, см. _aggregate."""
+    if spec.aggregation == Aggregation.count_rows:
+        return "SUM", "snapshots_count"
+    if spec.aggregation == Aggregation.sum_field:
+        return "SUM", spec.field
+    return "COUNT", "DISTINCT video_id"
+
+
+def _rollup_where_clauses(spec: QuerySpec, prefix: str = "p") -> List[str]:
+    clauses = [f"day >= :{prefix}0", f"day < :{prefix}1"]
+    if any(cond.column == "delta_views_count" for cond in spec.filters):
+        clauses.append("has_views_growth")
+    return clauses
+
+
+def _rollup_params(period: Tuple[date, date], prefix: str = "p") -> Dict[str, Any]:
+    return {f"{prefix}0": period[0], f"{prefix}1": period[1]}
+
+
+def _build_rollup_sql(spec: QuerySpec) -> str:
+    """SQL по роллапу: те же агрегаты, но по строкам (day, video_id)."""
+    func, arg = _rollup_aggregate(spec)
+    select_expr = f"{func}({arg})"
+    if func == "SUM":
+        select_expr = f"COALESCE({select_expr}, 0)"
+
+    where_sql = " WHERE " + " AND ".join(_rollup_where_clauses(spec))
+    return f"SELECT {select_expr} AS value FROM {ROLLUP_TABLE}{where_sql};"
+
+
+# Форма запроса: всё, от чего зависит текст SQL (но не значения параметров).
+# Первый элемент — идёт ли запрос в роллап.
+ShapeKey = Tuple[bool, str, str, str, Tuple[Tuple[str, str], ...]]
+
+# Форма -> (SQL-строка, готовый TextClause). Форм конечное число, TTL не нужен.
+_statement_cache: TTLCache[Tuple[str, TextClause]] = TTLCache(maxsize=1024)
+
+
+def _shape_key(spec: QuerySpec, use_rollup: bool) -> ShapeKey:
+    return (
+        use_rollup,
+        spec.table.value,
+        spec.aggregation.value,
+        spec.field,
+        tuple((cond.column, cond.op.value) for cond in spec.filters),
+    )
+
+
+def _aggregate(spec: QuerySpec) -> Tuple[str, str]:
+    """
+    Проверяет поле и возвращает (функция агрегата, её аргумент),
+    например ("COUNT", "*") или ("SUM", "views_count").
     """
-    # 1. Проверяем поле, по которому считаем
     allowed_fields = ALLOWED_FIELDS_BY_TABLE.get(spec.table)
     if not allowed_fields or spec.field not in allowed_fields:
         raise ValueError(
             f"Field '{spec.field}' is not allowed for table '{spec.table.value}'"
         )
 
-    # 2. Строим часть SELECT
     if spec.aggregation == Aggregation.count_rows:
-        select_expr = "COUNT(*)"
-    elif spec.aggregation == Aggregation.sum_field:
-        select_expr = f"COALESCE(SUM({spec.field}), 0)"
-    elif spec.aggregation == Aggregation.count_distinct:
-        select_expr = f"COUNT(DISTINCT {spec.field})"
-    else:
-        raise ValueError(f"Unknown aggregation '{spec.aggregation}'")
+        return "COUNT", "*"
+    if spec.aggregation == Aggregation.sum_field:
+        return "SUM", spec.field
+    if spec.aggregation == Aggregation.count_distinct:
+        return "COUNT", f"DISTINCT {spec.field}"
+    raise ValueError(f"Unknown aggregation '{spec.aggregation}'")
 
-    table_name = spec.table.value
 
+def _build_sql(spec: QuerySpec) -> str:
+    """
+    Собирает текст SQL по форме запроса.
+    Параметры именуются по порядку (p0, p1, ...), поэтому одна форма -> один SQL.
+    """
+    # 1. Проверяем поле и строим часть SELECT
+    func, arg = _aggregate(spec)
+    select_expr = f"{func}({arg})"
+    if func == "SUM":
+        select_expr = f"COALESCE({select_expr}, 0)"
+
+    # 2. WHERE по фильтрам
+    where_clauses = _where_clauses(spec)
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = " WHERE " + " AND ".join(where_clauses)
+
+    return f"SELECT {select_expr} AS value FROM {spec.table.value}{where_sql};"
+
+
+def _where_clauses(spec: QuerySpec, prefix: str = "p") -> List[str]:
+    """Условия WHERE по фильтрам spec, параметры :<prefix>0, :<prefix>1, ..."""
     where_clauses: List[str] = []
-    params: Dict[str, Any] = {}
     param_index = 0
 
-    # 3. Перебираем фильтры и строим WHERE
     for cond in spec.filters:
         if cond.column not in ALLOWED_FILTER_COLUMNS:
             raise ValueError(f"Column '{cond.column}' is not allowed in filters")
+        if cond.column not in ALLOWED_FILTER_COLUMNS_BY_TABLE[spec.table]:
+            raise ValueError(
+                f"Column '{cond.column}' is not allowed in filters "
+                f"for table '{spec.table.value}'"
+            )
 
         col = cond.column
 
         if cond.op == ConditionOp.eq:
-            pname = f"p{param_index}"
+            where_clauses.append(f"{col} = :{prefix}{param_index}")
             param_index += 1
-            where_clauses.append(f"{col} = :{pname}")
-            params[pname] = cond.value
 
         elif cond.op == ConditionOp.gt:
-            pname = f"p{param_index}"
+            where_clauses.append(f"{col} > :{prefix}{param_index}")
+            param_index += 1
+
+        elif cond.op in (ConditionOp.between_datetime, ConditionOp.date_eq):
+            if cond.op == ConditionOp.date_eq and col not in DATETIME_COLUMNS:
+                raise ValueError(
+                    f"date_eq is only applicable to datetime columns, got '{col}'"
+                )
+            p1, p2 = f"{prefix}{param_index}", f"{prefix}{param_index + 1}"
+            param_index += 2
+            where_clauses.append(f"{col} >= :{p1} AND {col} < :{p2}")
+
+        else:
+            raise ValueError(f"Unsupported ConditionOp '{cond.op}'")
+
+    return where_clauses
+
+
+def _build_params(spec: QuerySpec, prefix: str = "p") -> Dict[str, Any]:
+    """Значения параметров в том же порядке, в каком _build_sql их объявляет."""
+    params: Dict[str, Any] = {}
+    param_index = 0
+
+    for cond in spec.filters:
+        if cond.op in (ConditionOp.eq, ConditionOp.gt):
+            params[f"{prefix}{param_index}"] = cond.value
             param_index += 1
-            where_clauses.append(f"{col} > :{pname}")
-            params[pname] = cond.value
 
         elif cond.op == ConditionOp.between_datetime:
             if cond.value2 is None:
                 raise ValueError("between_datetime requires value2")
-            p1, p2 = f"p{param_index}", f"p{param_index + 1}"
+            params[f"{prefix}{param_index}"] = _parse_iso_datetime(str(cond.value))
+            params[f"{prefix}{param_index + 1}"] = _parse_iso_datetime(str(cond.value2))
             param_index += 2
 
-            start = _parse_iso_datetime(str(cond.value))
-            end = _parse_iso_datetime(str(cond.value2))
-
-            where_clauses.append(f"{col} >= :{p1} AND {col} < :{p2}")
-            params[p1] = start
-            params[p2] = end
-
         elif cond.op == ConditionOp.date_eq:
-            if col not in DATETIME_COLUMNS:
-                raise ValueError(
-                    f"date_eq is only applicable to datetime columns, got '{col}'"
-                )
-
             # value: 'YYYY-MM-DD'
             day = datetime.fromisoformat(str(cond.value)).date()
-            start = datetime.combine(day, datetime.min.time())
-            end = start + timedelta(days=1)
-
-            p1, p2 = f"p{param_index}", f"p{param_index + 1}"
+            # сутки UTC — ровно одна дневная партиция video_snapshots
+            start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+            params[f"{prefix}{param_index}"] = start
+            params[f"{prefix}{param_index + 1}"] = start + timedelta(days=1)
             param_index += 2
 
-            where_clauses.append(f"{col} >= :{p1} AND {col} < :{p2}")
-            params[p1] = start
-            params[p2] = end
+    return params
 
-        else:
-            raise ValueError(f"Unsupported ConditionOp '{cond.op}'")
 
-    where_sql = ""
-    if where_clauses:
-        where_sql = " WHERE " + " AND ".join(where_clauses)
+def _get_statement(
+    spec: QuerySpec,
+) -> Tuple[str, TextClause, Dict[str, Any]]:
+    """SQL и TextClause для формы spec (из кэша или собранные заново) + параметры."""
+    period = _route(spec)
+    use_rollup = period is not None
+
+    key = _shape_key(spec, use_rollup)
+    cached = _statement_cache.get(key)
+    if cached is None:
+        sql = _build_rollup_sql(spec) if use_rollup else _build_sql(spec)
+        cached = (sql, text(sql))
+        _statement_cache.set(key, cached)
+
+    if period is not None:
+        params = _rollup_params(period)
+    else:
+        params = _build_params(spec)
+
+    sql, stmt = cached
+    return sql, stmt, params
+
 
-    sql = f"SELECT {select_expr} AS value FROM {table_name}{where_sql};"
+def build_sql_and_params(spec: QuerySpec) -> Tuple[str, Dict[str, Any]]:
+    """
+    Собирает SQL-строку и словарь параметров из QuerySpec.
+    Возвращает (sql, params), где sql — SELECT с одним агрегатом и псевдонимом value.
+    Дневные запросы к video_snapshots прозрачно уходят в snapshot_daily_rollup.
+    """
+    sql, _, params = _get_statement(spec)
     return sql, params
 
 
-async def execute_query_spec(session: AsyncSession, spec: QuerySpec) -> int:
+def build_statement(spec: QuerySpec) -> Tuple[TextClause, Dict[str, Any]]:
+    """
+    То же, что build_sql_and_params, но отдаёт закэшированный TextClause.
+    Между вызовами одной формы меняются только параметры, и asyncpg
+    переиспользует подготовленный запрос.
+    """
+    _, stmt, params = _get_statement(spec)
+    return stmt, params
+
+
+def statement_cache_stats() -> Dict[str, Any]:
+    """Размер и hit rate кэша SQL-шаблонов."""
+    return _statement_cache.stats()
+
+
+def _filtered(func: str, arg: str, clauses: List[str]) -> str:
+    """Агрегат с FILTER (WHERE ...); SUM по пустому набору -> 0."""
+    expr = f"{func}({arg})"
+    if clauses:
+        expr += " FILTER (WHERE " + " AND ".join(clauses) + ")"
+    if func == "SUM":
+        expr = f"COALESCE({expr}, 0)"
+    return expr
+
+
+def build_multi_sql_and_params(
+    specs: Sequence[QuerySpec],
+) -> Tuple[str, Dict[str, Any], List[str]]:
+    """
+    Собирает один SELECT на весь список spec.
+
+    Спецификации группируются по таблице (роллап — отдельная группа), каждая
+    группа — один проход по таблице с агрегатами вида
+    COUNT(*) FILTER (WHERE ...), SUM(x) FILTER (WHERE ...). Группы склеены
+    CROSS JOIN'ом: каждая даёт ровно одну строку, так что результат — одна
+    строка. WHERE группы — OR всех её фильтров, чтобы не читать лишнее.
+
+    Возвращает (sql, params, колонки): колонка i — значение specs[i].
+    Одинаковые spec считаются один раз.
+    """
+    if not specs:
+        raise ValueError("specs must not be empty")
+
+    # таблица -> [(выражение, WHERE конкретного spec)], колонки по порядку
+    groups: Dict[str, List[Tuple[str, List[str]]]] = {}
+    params: Dict[str, Any] = {}
+    columns: List[str] = []
+    column_by_spec: Dict[str, str] = {}
+
+    for spec in specs:
+        spec_key = spec.model_dump_json()
+        if spec_key in column_by_spec:
+            columns.append(column_by_spec[spec_key])
+            continue
+
+        column = f"v{len(column_by_spec)}"
+        prefix = f"{column}_p"
+        period = _route(spec)
+        if period is not None:
+            table = ROLLUP_TABLE
+            func, arg = _rollup_aggregate(spec)
+            clauses = _rollup_where_clauses(spec, prefix)
+            params.update(_rollup_params(period, prefix))
+        else:
+            table = spec.table.value
+            func, arg = _aggregate(spec)
+            clauses = _where_clauses(spec, prefix)
+            params.update(_build_params(spec, prefix))
+
+        expr = f"{_filtered(func, arg, clauses)} AS {column}"
+        groups.setdefault(table, []).append((expr, clauses))
+        column_by_spec[spec_key] = column
+        columns.append(column)
+
+    subqueries: List[str] = []
+    for i, (table, items) in enumerate(groups.items()):
+        select_sql = ", ".join(expr for expr, _ in items)
+        where_sql = ""
+        # если хоть у одного spec нет фильтров, читать придётся всю таблицу
+        if all(clauses for _, clauses in items):
+            where_sql = " WHERE " + " OR ".join(
+                "(" + " AND ".join(clauses) + ")" for _, clauses in items
+            )
+        subqueries.append(f"(SELECT {select_sql} FROM {table}{where_sql}) AS g{i}")
+
+    sql = "SELECT * FROM " + " CROSS JOIN ".join(subqueries) + ";"
+    return sql, params, columns
+
+
+async def execute_query_specs(
+    session: AsyncSession,
+    specs: Sequence[QuerySpec],
+    observer: Optional[QueryObserver] = None,
+) -> List[int]:
+    """
+    Выполняет список QuerySpec одним запросом (см. build_multi_sql_and_params).
+    Возвращает числа в порядке specs. observer получает запрос и его время.
+    """
+    if not specs:
+        return []
+
+    with stage_timer("sql_build"):
+        sql, params, columns = build_multi_sql_and_params(specs)
+    with stage_timer("db_checkout"):
+        await session.connection()
+    started = perf_counter()
+    with stage_timer("sql_execute"):
+        result = await session.execute(text(sql), params)
+        row = result.mappings().first()
+    if observer is not None:
+        observer(specs, sql, params, perf_counter() - started)
+
+    if row is None:
+        return [0] * len(specs)
+    return [int(row[column] or 0) for column in columns]
+
+
+async def execute_query_spec(
+    session: AsyncSession,
+    spec: QuerySpec,
+    observer: Optional[QueryObserver] = None,
+) -> int:
     """
     Выполняет QuerySpec через переданный AsyncSession.
     Возвращает одно число (int). Пустой результат -> 0.
+    observer получает запрос и его время.
     """
-    sql, params = build_sql_and_params(spec)
-    stmt = text(sql)
-    result = await session.execute(stmt, params)
-    row = result.first()
+    with stage_timer("sql_build"):
+        sql, stmt, params = _get_statement(spec)
+    # соединение из пула берётся лениво — меряем отдельно от самого запроса
+    with stage_timer("db_checkout"):
+        await session.connection()
+    started = perf_counter()
+    with stage_timer("sql_execute"):
+        result = await session.execute(stmt, params)
+        row = result.first()
+    if observer is not None:
+        observer(spec, sql, params, perf_counter() - started)
     if row is None:
         return 0
 
@@ -1,14 +1,103 @@
+from typing import Any, Dict
+
+from loguru import logger
+
+from core.config import cache_settings, query_log_settings
+from core.metrics import Gauge
 from nlp.llm_parser import build_spec_from_text
-from services.executor import answer_query_spec
+from nlp.normalize import normalize_question
+from nlp.spec import QuerySpec
+from services.cache import TTLCache
+from services.canonical import canonicalize_spec
+from services.executor import answer_query_spec, spec_cache_key
+from services.persistent_cache import persistent_cache
+from services.precomputed import record_spec_hit
+from services.singleflight import SingleFlight
+
+# Уровень 1: нормализованный текст вопроса -> QuerySpec
+spec_cache: TTLCache[QuerySpec] = TTLCache(
+    maxsize=cache_settings.SPEC_CACHE_SIZE, ttl=cache_settings.SPEC_CACHE_TTL
+)
+# Уровень 2: каноничный QuerySpec -> число
+value_cache: TTLCache[int] = TTLCache(
+    maxsize=cache_settings.VALUE_CACHE_SIZE, ttl=cache_settings.VALUE_CACHE_TTL
+)
+# Один и тот же вопрос, присланный многими одновременно, разбирается один раз
+spec_flight: SingleFlight[QuerySpec] = SingleFlight()
+# Сколько раз сбрасывали кэш ответов. Ответ, который начали считать до сброса,
+# мог быть посчитан по старым данным — такой в кэш не кладём.
+_answer_generation = 0
+
+
+Gauge(
+    "answer_cache",
+    "Spec/answer cache counters",
+    lambda: {
+        (level, counter): float(value)
+        for level, stats in cache_stats().items()
+        for counter, value in stats.items()
+    },
+    labelnames=("cache", "counter"),
+)
+
+
+def invalidate_answer_cache() -> None:
+    """
+    Сбросить закэшированные ответы (после загрузки новых данных).
+    Кэш текст -> QuerySpec от данных не зависит и не сбрасывается.
+    """
+    global _answer_generation
+    _answer_generation += 1
+    value_cache.clear()
+    logger.info("answer cache invalidated")
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {
+        "spec": spec_cache.stats(),
+        "value": value_cache.stats(),
+        "spec_flight": spec_flight.stats(),
+    }
 
 
 async def answer_text_query(user_text: str) -> int:
     """
     Высокоуровневая функция:
-    1) парсим текст вопроса в QuerySpec через LLM,
-    2) выполняем запрос к БД,
+    1) парсим текст вопроса в QuerySpec через LLM (или берём из кэша),
+    2) выполняем запрос к БД (или берём ответ из кэша),
     3) возвращаем одно число.
+    Промах кэша в памяти проверяется в кэше на диске (если он открыт).
     """
-    spec = await build_spec_from_text(user_text)
-    value = await answer_query_spec(spec)
+    text_key = normalize_question(user_text)
+
+    spec = spec_cache.get(text_key)
+    if spec is None:
+        spec = await persistent_cache.get_spec(text_key)
+        if spec is None:
+            spec = await spec_flight.do(
+                text_key, lambda: build_spec_from_text(user_text)
+            )
+            persistent_cache.put_spec(text_key, spec)
+        spec_cache.set(text_key, spec)
+
+    # равносильные спецификации делят один ключ кэша ответов
+    canonical = canonicalize_spec(spec)
+    if canonical is None:
+        return 0
+    spec = canonical
+    if query_log_settings.QUERY_STATS_ENABLED:
+        record_spec_hit(spec)
+
+    value_key = spec_cache_key(spec)
+    value = value_cache.get(value_key)
+    if value is None:
+        answer_generation = _answer_generation
+        generation = persistent_cache.generation
+        value = await persistent_cache.get_value(value_key)
+        if value is None:
+            value = await answer_query_spec(spec)
+            persistent_cache.put_value(value_key, value, generation)
+        if answer_generation == _answer_generation:
+            value_cache.set(value_key, value)
+
     return value
@@ -0,0 +1,220 @@
+"""
+Индекс по времени для самых частых вопросов "сколько X за период".
+
+- videos: отсортированные video_created_at — общий массив и по каждому
+  креатору, COUNT за окно = разность двух бинарных поисков;
+- video_snapshots: снапшоты схлопнуты по created_at, по ним построены
+  префиксные суммы числа строк и delta_*-полей, COUNT/SUM за окно =
+  разность двух элементов префиксного массива.
+
+Всё, что индекс посчитать не может, возвращает None — executor уходит в SQL.
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import text
+
+from base.session_maker import database_manager
+from core.metrics import Gauge, single_value
+from nlp.spec import Aggregation, ConditionOp, QuerySpec, Table
+from services.columnar import _epoch_us, to_micros
+from services.data_events import get_load_generation
+from services.rollup import ROLLUP_SUM_FIELDS
+from services.sql_builder import _build_params, touches_compacted_days
+
+_VIDEOS_SQL = f"""
+    SELECT creator_id, {_epoch_us("video_created_at")}
+    FROM videos
+    ORDER BY creator_id, video_created_at
+"""
+
+_SNAPSHOTS_SQL = f"""
+    SELECT {_epoch_us("created_at")}, COUNT(*),
+           {", ".join(f"SUM({f})::bigint" for f in ROLLUP_SUM_FIELDS)}
+    FROM video_snapshots
+    GROUP BY created_at
+    ORDER BY created_at
+"""
+
+# Окно [start; end) в микросекундах UTC; None — без ограничений
+Window = Tuple[Optional[int], Optional[int]]
+
+
+def _window_bounds(values: np.ndarray, window: Window) -> Tuple[int, int]:
+    start, end = window
+    lo = 0 if start is None else int(np.searchsorted(values, start, side="left"))
+    hi = len(values) if end is None else int(np.searchsorted(values, end, "left"))
+    return lo, max(lo, hi)
+
+
+def _prefix(values: np.ndarray) -> np.ndarray:
+    """Префиксные суммы с ведущим нулём: sum(values[lo:hi]) = p[hi] - p[lo]."""
+    result = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(values, out=result[1:])
+    return result
+
+
+class TimeIndex:
+    """COUNT/SUM по временным окнам за O(log n) вместо прохода по таблице."""
+
+    def __init__(self) -> None:
+        self.video_times = np.empty(0, dtype=np.int64)
+        # video_created_at, отсортированные по (креатор, время);
+        # creator_times[creator] — срезы этого массива
+        self.video_times_by_creator = np.empty(0, dtype=np.int64)
+        self.creator_times: Dict[str, np.ndarray] = {}
+        self.snapshot_times = np.empty(0, dtype=np.int64)
+        # "snapshots_count" и delta_* -> префиксные суммы по snapshot_times
+        self.snapshot_prefix: Dict[str, np.ndarray] = {}
+        self.generation: Optional[int] = None
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.generation is not None
+
+    def memory_bytes(self) -> int:
+        arrays: List[np.ndarray] = [
+            self.video_times,
+            self.video_times_by_creator,
+            self.snapshot_times,
+        ]
+        arrays += self.snapshot_prefix.values()
+        return sum(a.nbytes for a in arrays)
+
+    async def refresh(self) -> None:
+        """Перестраивает индекс, если с прошлого раза появились новые загрузки."""
+        async with self._refresh_lock, database_manager.create_session() as session:
+            await session.execute(
+                text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            )
+            generation = await get_load_generation(session)
+            if generation == self.generation:
+                return
+            videos = (await session.execute(text(_VIDEOS_SQL))).all()
+            snapshots = (await session.execute(text(_SNAPSHOTS_SQL))).all()
+
+        self._build(videos, snapshots)
+        self.generation = generation
+        logger.info(
+            f"time index at load #{generation}: videos={len(self.video_times)}, "
+            f"snapshot timestamps={len(self.snapshot_times)}, "
+            f"{self.memory_bytes() / 2**20:.1f} MiB"
+        )
+
+    def _build(self, videos: List[Tuple], snapshots: List[Tuple]) -> None:
+        # videos уже отсортированы по (creator_id, video_created_at)
+        by_creator = np.array([row[1] for row in videos], dtype=np.int64)
+        creator_times: Dict[str, np.ndarray] = {}
+        start = 0
+        for i in range(1, len(videos) + 1):
+            if i == len(videos) or videos[i][0] != videos[start][0]:
+                creator_times[videos[start][0]] = by_creator[start:i]
+                start = i
+
+        columns = list(zip(*snapshots)) if snapshots else [()] * (2 + 4)
+        prefix = {
+            name: _prefix(np.array(values, dtype=np.int64))
+            for name, values in zip(
+                ("snapshots_count",) + ROLLUP_SUM_FIELDS, columns[1:]
+            )
+        }
+
+        # подменяем всё разом, без await между присваиваниями
+        self.video_times = np.sort(by_creator)
+        self.video_times_by_creator = by_creator
+        self.creator_times = creator_times
+        self.snapshot_times = np.array(columns[0], dtype=np.int64)
+        self.snapshot_prefix = prefix
+
+    def try_evaluate(self, spec: QuerySpec) -> Optional[int]:
+        """Число для spec или None, если spec не подходит под индекс."""
+        if not self.ready or touches_compacted_days(spec):
+            # свёрнутые дни считает только роллап в БД
+            return None
+        try:
+            if spec.table == Table.videos:
+                return self._videos(spec)
+            return self._snapshots(spec)
+        except ValueError:
+            # некорректный spec пусть отвергнет SQL-путь со своим сообщением
+            return None
+
+    @staticmethod
+    def _window(
+        spec: QuerySpec, time_column: str
+    ) -> Optional[Tuple[Window, Optional[str]]]:
+        """
+        Пересечение всех временных фильтров по time_column и id креатора.
+        None — в spec есть фильтр, который индекс не умеет.
+        """
+        params = _build_params(spec)
+        start: Optional[int] = None
+        end: Optional[int] = None
+        creator: Optional[str] = None
+        param_index = 0
+        for cond in spec.filters:
+            if cond.op in (ConditionOp.eq, ConditionOp.gt):
+                value = params[f"p{param_index}"]
+                param_index += 1
+                if (
+                    cond.column == "creator_id"
+                    and cond.op == ConditionOp.eq
+                    and isinstance(value, str)
+                    and creator in (None, value)
+                ):
+                    creator = value
+                    continue
+                return None
+
+            first = to_micros(params[f"p{param_index}"])
+            second = to_micros(params[f"p{param_index + 1}"])
+            param_index += 2
+            if cond.column != time_column:
+                return None
+            start = first if start is None else max(start, first)
+            end = second if end is None else min(end, second)
+        return (start, end), creator
+
+    def _videos(self, spec: QuerySpec) -> Optional[int]:
+        # каждое видео — одна строка, COUNT(DISTINCT id) = COUNT(*)
+        if spec.aggregation == Aggregation.sum_field or spec.field != "id":
+            return None
+        found = self._window(spec, "video_created_at")
+        if found is None:
+            return None
+        window, creator = found
+        if creator is None:
+            times = self.video_times
+        else:
+            times = self.creator_times.get(creator, np.empty(0, dtype=np.int64))
+        lo, hi = _window_bounds(times, window)
+        return hi - lo
+
+    def _snapshots(self, spec: QuerySpec) -> Optional[int]:
+        if spec.aggregation == Aggregation.sum_field:
+            if spec.field not in ROLLUP_SUM_FIELDS:
+                return None
+            column = spec.field
+        elif spec.field == "id":
+            column = "snapshots_count"
+        else:
+            return None
+        found = self._window(spec, "created_at")
+        if found is None or found[1] is not None:
+            return None
+        lo, hi = _window_bounds(self.snapshot_times, found[0])
+        prefix = self.snapshot_prefix[column]
+        return int(prefix[hi] - prefix[lo])
+
+
+time_index = TimeIndex()
+
+Gauge(
+    "time_index_bytes",
+    "Memory held by the time index",
+    single_value(time_index.memory_bytes),
+)
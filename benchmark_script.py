@@ -0,0 +1,702 @@
+# benchmark_script.py
+"""
+Офлайн-бенчмарк пайплайна вопрос -> число без настоящей LLM.
+
+Этапы, которые меряются отдельно:
+- parse   — build_spec_from_text (LLM подменена детерминированной заглушкой
+            с настраиваемой задержкой);
+- sql     — build_sql_and_params;
+- execute — execute_query_spec в новой сессии (включая взятие соединения из пула).
+
+Запуск (из корня, с PYTHONPATH=.:app и .env как для бота):
+
+    python benchmark_script.py --generate-videos 10000 --snapshots-per-video 100
+    python benchmark_script.py --corpus questions.jsonl --concurrency 1,8,32 \\
+        --requests 500 --llm-latency-ms 300 --output bench/HEAD.json
+    python benchmark_script.py --compare bench/old.json bench/new.json
+
+Режим --differential N сверяет in-memory движок (services.columnar) и индекс
+по времени (services.time_index) с Postgres на спецификациях из корпуса и
+N случайных спецификациях по всем сочетаниям Aggregation/ConditionOp;
+SQL выполняется и через роллап, и напрямую.
+
+Режим --partition-bench 7,14,28 заливает историю каждой длины (по
+--videos-per-day видео на день) и меряет SUM(delta_views_count) за средний
+день напрямую по video_snapshots, без роллапа, а по EXPLAIN — сколько дневных
+партиций реально читается. При работающем отсечении партиций время не должно
+расти с длиной истории.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import text
+
+import nlp.llm_parser as llm_parser
+from base.session_maker import database_manager
+from core.config import query_settings
+from nlp.rule_parser import parse_spec_by_rules
+from nlp.spec import (
+    ALLOWED_FIELDS_BY_TABLE,
+    Aggregation,
+    Condition,
+    ConditionOp,
+    QuerySpec,
+    Table,
+)
+from services.canonical import canonicalize_spec
+from services.columnar import columnar_store
+from services.partitions import PARTITION_PREFIX, existing_snapshot_partitions
+from services.rollup import snapshot_day
+from services.sql_builder import build_sql_and_params, execute_query_spec
+from services.time_index import time_index
+
+from fill_db_script import (
+    SNAPSHOT_COLUMNS,
+    VIDEO_COLUMNS,
+    copy_records,
+    finish_load,
+)
+
+# Если в корпусе нет своих вопросов — примеры из /start
+DEFAULT_QUESTIONS = [
+    "Сколько всего видео есть в системе?",
+    "Сколько видео у креатора с id aca1061a9d324ecf8c3fa2bb32d7be63 вышло "
+    "с 1 по 5 ноября 2025 года?",
+    "Сколько видео набрало больше 100 000 просмотров?",
+    "На сколько просмотров в сумме выросли все видео 28 ноября 2025?",
+    "Сколько разных видео получали новые просмотры 27 ноября 2025?",
+]
+
+# Что "отвечает" заглушка LLM на вопрос, для которого нет эталона
+FALLBACK_SPEC = QuerySpec(
+    table=Table.videos, aggregation=Aggregation.count_rows, field="id"
+)
+
+STAGES = ["parse", "sql", "execute", "total"]
+
+
+# --- корпус и заглушка LLM ----------------------------------------------------
+
+
+def load_corpus(path: Optional[str]) -> List[Tuple[str, Optional[QuerySpec]]]:
+    """
+    Корпус: .jsonl с полями question/text/title (+ опционально spec)
+    или обычный текст, один вопрос на строку.
+    """
+    if path is None:
+        return [(q, None) for q in DEFAULT_QUESTIONS]
+
+    corpus: List[Tuple[str, Optional[QuerySpec]]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith("{"):
+                corpus.append((line, None))
+                continue
+            item = json.loads(line)
+            question = item.get("question") or item.get("text") or item.get("title")
+            spec = item.get("spec")
+            corpus.append((question, QuerySpec.model_validate(spec) if spec else None))
+    return corpus
+
+
+class FakeLLM:
+    """
+    Детерминированная замена call_llm: отдаёт эталонный JSON спецификации
+    (из корпуса, иначе по правилам, иначе FALLBACK_SPEC) после задержки.
+    """
+
+    def __init__(
+        self, corpus: List[Tuple[str, Optional[QuerySpec]]], latency: float
+    ) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.answers: Dict[str, str] = {}
+        for question, spec in corpus:
+            spec = spec or parse_spec_by_rules(question) or FALLBACK_SPEC
+            self.answers[question] = spec.model_dump_json()
+
+    async def __call__(
+        self, system_prompt: str, user_text: str, history: Any = ()
+    ) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.answers.get(user_text, FALLBACK_SPEC.model_dump_json())
+
+
+# --- синтетические данные -----------------------------------------------------
+
+
+def generate_batches(
+    videos: int,
+    snapshots_per_video: int,
+    creators: int,
+    days: int,
+    batch_videos: int,
+    seed: int,
+) -> Iterator[Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]]]]:
+    """Батчи кортежей для COPY: видео и их почасовые снапшоты."""
+    rnd = random.Random(seed)
+    creator_ids = [uuid.UUID(int=rnd.getrandbits(128)).hex for _ in range(creators)]
+    start = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+    video_batch: List[Tuple[Any, ...]] = []
+    snapshot_batch: List[Tuple[Any, ...]] = []
+    for _ in range(videos):
+        video_id = uuid.UUID(int=rnd.getrandbits(128))
+        published = start + timedelta(minutes=rnd.randrange(days * 24 * 60))
+        totals = [0, 0, 0, 0]  # views, likes, reports, comments
+        snap_at = published
+        for _ in range(snapshots_per_video):
+            snap_at += timedelta(hours=1)
+            deltas = [
+                rnd.randrange(0, 500),
+                rnd.randrange(0, 50),
+                rnd.randrange(0, 2),
+                rnd.randrange(0, 10),
+            ]
+            totals = [t + d for t, d in zip(totals, deltas)]
+            row = {
+                "id": uuid.UUID(int=rnd.getrandbits(128)),
+                "video_id": video_id,
+                "views_count": totals[0],
+                "likes_count": totals[1],
+                "reports_count": totals[2],
+                "comments_count": totals[3],
+                "delta_views_count": deltas[0],
+                "delta_likes_count": deltas[1],
+                "delta_reports_count": deltas[2],
+                "delta_comments_count": deltas[3],
+                "created_at": snap_at,
+                "updated_at": snap_at,
+            }
+            snapshot_batch.append(tuple(row[c] for c in SNAPSHOT_COLUMNS))
+
+        row = {
+            "id": video_id,
+            "video_created_at": published,
+            "views_count": totals[0],
+            "likes_count": totals[1],
+            "reports_count": totals[2],
+            "comments_count": totals[3],
+            "creator_id": rnd.choice(creator_ids),
+            "created_at": published,
+            "updated_at": snap_at,
+        }
+        video_batch.append(tuple(row[c] for c in VIDEO_COLUMNS))
+
+        if len(video_batch) >= batch_videos:
+            yield video_batch, snapshot_batch
+            video_batch, snapshot_batch = [], []
+
+    if video_batch:
+        yield video_batch, snapshot_batch
+
+
+async def generate_dataset(args: argparse.Namespace) -> None:
+    """
+    Заливает синтетический датасет. Без --truncate работает только на пустой
+    базе: бенчмарк ходит в БД из .env, и чужие данные он не стирает.
+    """
+    started = time.monotonic()
+    total_videos = total_snaps = 0
+    touched_days = set()
+    created_at = SNAPSHOT_COLUMNS.index("created_at")
+
+    async with database_manager.create_session() as session:
+        if not args.truncate:
+            has_rows = (
+                await session.execute(text("SELECT EXISTS (SELECT 1 FROM videos)"))
+            ).scalar_one()
+            if has_rows:
+                raise SystemExit(
+                    "videos is not empty: pass --truncate to wipe the database "
+                    "before generating"
+                )
+        else:
+            await session.execute(
+                text(
+                    "TRUNCATE video_snapshots, snapshot_daily_rollup, "
+                    "snapshot_compactions, videos"
+                )
+            )
+            await session.commit()
+
+        for video_records, snapshot_records in generate_batches(
+            videos=args.generate_videos,
+            snapshots_per_video=args.snapshots_per_video,
+            creators=args.creators,
+            days=args.days,
+            batch_videos=max(1, 50_000 // max(1, args.snapshots_per_video)),
+            seed=args.seed,
+        ):
+            await copy_records(session, video_records, snapshot_records)
+            await session.commit()
+            total_videos += len(video_records)
+            total_snaps += len(snapshot_records)
+            touched_days.update(
+                snapshot_day(snap[created_at]) for snap in snapshot_records
+            )
+            rate = (total_videos + total_snaps) / (time.monotonic() - started)
+            print(
+                f"сгенерировано: видео={total_videos}, снапы={total_snaps}, {rate:.0f} строк/с"
+            )
+
+        await finish_load(session, touched_days)
+        await session.execute(text("ANALYZE"))
+        await session.commit()
+
+    print(f"датасет готов за {time.monotonic() - started:.1f} с")
+
+
+# --- прогон -------------------------------------------------------------------
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Перцентили в миллисекундах."""
+    ms = [v * 1000 for v in values]
+    return {
+        "count": len(ms),
+        "mean": sum(ms) / len(ms) if ms else 0.0,
+        "p50": percentile(ms, 50),
+        "p95": percentile(ms, 95),
+        "p99": percentile(ms, 99),
+    }
+
+
+async def run_one(question: str, timings: Dict[str, List[float]]) -> int:
+    t0 = time.perf_counter()
+    spec = await llm_parser.build_spec_from_text(question)
+    t1 = time.perf_counter()
+    build_sql_and_params(spec)
+    t2 = time.perf_counter()
+    async with database_manager.create_session() as session:
+        value = await execute_query_spec(session, spec)
+    t3 = time.perf_counter()
+
+    timings["parse"].append(t1 - t0)
+    timings["sql"].append(t2 - t1)
+    timings["execute"].append(t3 - t2)
+    timings["total"].append(t3 - t0)
+    return value
+
+
+async def run_level(
+    questions: List[str], concurrency: int, requests: int
+) -> Dict[str, Any]:
+    """requests вопросов по кругу из корпуса, concurrency параллельных воркеров."""
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        for i in counter:
+            await run_one(questions[i % len(questions)], timings)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_seconds": wall,
+        "qps": requests / wall if wall else 0.0,
+        "stages": {stage: summarize(values) for stage, values in timings.items()},
+    }
+
+
+async def dataset_size() -> Dict[str, int]:
+    async with database_manager.create_session() as session:
+        videos = (await session.execute(text("SELECT COUNT(*) FROM videos"))).scalar()
+        snaps = (
+            await session.execute(text("SELECT COUNT(*) FROM video_snapshots"))
+        ).scalar()
+    return {"videos": int(videos or 0), "video_snapshots": int(snaps or 0)}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus = load_corpus(args.corpus)
+    questions = [q for q, _ in corpus]
+
+    fake_llm = FakeLLM(corpus, latency=args.llm_latency_ms / 1000)
+    llm_parser.call_llm = fake_llm
+    # заглушка подменяет только текстовый режим
+    llm_parser.llm_settings.LLM_STRUCTURED_OUTPUT = False
+    if args.no_rules:
+        # меряем именно путь через LLM
+        llm_parser.parse_spec_by_rules = lambda _text: None
+
+    # прогрев: пул соединений, кэш SQL-шаблонов, подготовленные запросы
+    for question in questions:
+        await run_one(question, {stage: [] for stage in STAGES})
+
+    levels = [int(x) for x in args.concurrency.split(",")]
+    results = []
+    for level in levels:
+        result = await run_level(questions, level, args.requests)
+        total = result["stages"]["total"]
+        print(
+            f"concurrency={level}: {result['qps']:.1f} qps, "
+            f"p50={total['p50']:.1f} ms, p95={total['p95']:.1f} ms, "
+            f"p99={total['p99']:.1f} ms"
+        )
+        results.append(result)
+
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": {
+            "corpus": args.corpus,
+            "questions": len(questions),
+            "requests": args.requests,
+            "llm_latency_ms": args.llm_latency_ms,
+            "rules": not args.no_rules,
+        },
+        "dataset": await dataset_size(),
+        "llm_calls": fake_llm.calls,
+        "results": results,
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Сравнение двух сохранённых прогонов по p50/p95/p99 и qps."""
+    old = json.loads(Path(old_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    old_by_level = {r["concurrency"]: r for r in old["results"]}
+
+    print(f"{old.get('revision')} -> {new.get('revision')}")
+    for result in new["results"]:
+        before = old_by_level.get(result["concurrency"])
+        if before is None:
+            continue
+        print(
+            f"concurrency={result['concurrency']}: "
+            f"qps {before['qps']:.1f} -> {result['qps']:.1f}"
+        )
+        for stage in STAGES:
+            for q in ("p50", "p95", "p99"):
+                a = before["stages"][stage][q]
+                b = result["stages"][stage][q]
+                change = (b - a) / a * 100 if a else 0.0
+                print(f"  {stage:8} {q}: {a:8.2f} -> {b:8.2f} ms ({change:+.1f}%)")
+
+
+# --- сверка in-memory движка с Postgres ----------------------------------------
+
+# Какие фильтры осмысленны для каждой таблицы: колонка -> допустимые операции
+_DIFF_FILTERS = {
+    Table.videos: {
+        "creator_id": [ConditionOp.eq],
+        "video_created_at": [ConditionOp.date_eq, ConditionOp.between_datetime],
+        "created_at": [ConditionOp.date_eq, ConditionOp.between_datetime],
+        "views_count": [ConditionOp.eq, ConditionOp.gt],
+    },
+    Table.video_snapshots: {
+        "created_at": [ConditionOp.date_eq, ConditionOp.between_datetime],
+        "views_count": [ConditionOp.eq, ConditionOp.gt],
+        "delta_views_count": [ConditionOp.eq, ConditionOp.gt],
+    },
+}
+
+
+def random_specs(
+    count: int, creators: List[str], days: int, seed: int
+) -> List[QuerySpec]:
+    """Случайные корректные спецификации по всем таблицам, агрегатам и фильтрам."""
+    rnd = random.Random(seed)
+    start = datetime(2025, 11, 1, tzinfo=timezone.utc)
+    offsets = [timezone.utc, timezone(timedelta(hours=3))]
+
+    def random_moment(aligned: bool) -> datetime:
+        moment = start + timedelta(days=rnd.randrange(-2, days + 2))
+        if aligned:
+            return moment
+        moment += timedelta(minutes=rnd.randrange(24 * 60))
+        return moment.astimezone(rnd.choice(offsets))
+
+    def random_condition(table: Table) -> Condition:
+        column = rnd.choice(list(_DIFF_FILTERS[table]))
+        op = rnd.choice(_DIFF_FILTERS[table][column])
+        if op == ConditionOp.date_eq:
+            return Condition(
+                column=column, op=op, value=random_moment(True).date().isoformat()
+            )
+        if op == ConditionOp.between_datetime:
+            aligned = rnd.random() < 0.5
+            first = random_moment(aligned)
+            second = first + timedelta(
+                days=rnd.randrange(0, 5), hours=0 if aligned else rnd.randrange(24)
+            )
+            return Condition(
+                column=column,
+                op=op,
+                value=first.isoformat(),
+                value2=second.isoformat(),
+            )
+        if column == "creator_id":
+            return Condition(column=column, op=op, value=rnd.choice(creators))
+        limit = 500 if column.startswith("delta_") else 50_000
+        return Condition(column=column, op=op, value=rnd.randrange(limit))
+
+    specs = []
+    for _ in range(count):
+        table = rnd.choice(list(Table))
+        aggregation = rnd.choice(list(Aggregation))
+        fields = ALLOWED_FIELDS_BY_TABLE[table]
+        if aggregation == Aggregation.count_rows:
+            field = "id"
+        elif aggregation == Aggregation.sum_field:
+            field = rnd.choice([f for f in fields if f not in ("id", "video_id")])
+        else:
+            field = rnd.choice(fields)
+        filters = [random_condition(table) for _ in range(rnd.randrange(4))]
+        specs.append(
+            QuerySpec(
+                table=table, aggregation=aggregation, field=field, filters=filters
+            )
+        )
+    return specs
+
+
+async def _sql_outcome(spec: QuerySpec, use_rollup: bool) -> Union[int, str]:
+    query_settings.USE_DAILY_ROLLUP = use_rollup
+    try:
+        async with database_manager.create_session() as session:
+            return await execute_query_spec(session, spec)
+    except Exception as e:
+        return f"error: {type(e).__name__}"
+
+
+def _columnar_outcome(spec: QuerySpec) -> Union[int, str]:
+    try:
+        return columnar_store.evaluate(spec)
+    except Exception as e:
+        return f"error: {type(e).__name__}"
+
+
+async def run_differential(args: argparse.Namespace) -> int:
+    """Возвращает число расхождений (0 — движки совпали на всех спецификациях)."""
+    await columnar_store.refresh()
+    await time_index.refresh()
+
+    async with database_manager.create_session() as session:
+        creators = list(
+            (
+                await session.execute(
+                    text("SELECT DISTINCT creator_id FROM videos LIMIT 50")
+                )
+            ).scalars()
+        )
+
+    specs = [
+        spec or parse_spec_by_rules(question)
+        for question, spec in load_corpus(args.corpus)
+    ]
+    specs = [spec for spec in specs if spec is not None]
+    specs += random_specs(
+        args.differential, creators or ["0" * 32], args.days, args.seed
+    )
+
+    mismatches = 0
+    use_rollup = query_settings.USE_DAILY_ROLLUP
+    for spec in specs:
+        via_rollup = await _sql_outcome(spec, True)
+        direct = await _sql_outcome(spec, False)
+        in_memory = _columnar_outcome(spec)
+        # индекс берёт не всё; None — значит, ушли бы в SQL
+        indexed = time_index.try_evaluate(spec)
+        # каноничная форма обязана считаться так же; None — заведомый 0
+        canonical = canonicalize_spec(spec)
+        folded = 0 if canonical is None else await _sql_outcome(canonical, True)
+        # ошибка SQL и ошибка движка считаются совпадением независимо от типа
+        outcomes = {
+            "error" if isinstance(o, str) else o
+            for o in (via_rollup, direct, in_memory, indexed, folded)
+            if o is not None
+        }
+        if len(outcomes) > 1:
+            mismatches += 1
+            print(
+                f"MISMATCH rollup={via_rollup} sql={direct} memory={in_memory} "
+                f"index={indexed} canonical={folded}: {spec.model_dump_json()}"
+            )
+    query_settings.USE_DAILY_ROLLUP = use_rollup
+
+    print(f"сверено спецификаций: {len(specs)}, расхождений: {mismatches}")
+    return mismatches
+
+
+# --- партиции ------------------------------------------------------------------
+
+
+def _scanned_relations(plan: Dict[str, Any]) -> Iterator[str]:
+    if "Relation Name" in plan:
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from _scanned_relations(child)
+
+
+async def run_partition_bench(args: argparse.Namespace) -> None:
+    """
+    Время запроса за один день и число читаемых партиций при росте истории.
+    Каждая длина истории заливается в очищенные таблицы, поэтому без
+    --truncate не запускается.
+    """
+    if not args.truncate:
+        raise SystemExit(
+            "--partition-bench wipes videos and video_snapshots for every "
+            "history size: pass --truncate to confirm"
+        )
+    history_sizes = sorted(int(x) for x in args.partition_bench.split(","))
+    use_rollup = query_settings.USE_DAILY_ROLLUP
+    query_settings.USE_DAILY_ROLLUP = False
+    try:
+        rows = await _partition_bench_rows(args, history_sizes)
+    finally:
+        query_settings.USE_DAILY_ROLLUP = use_rollup
+
+    print(
+        f"{'дней':>6} {'снапшотов':>11} {'партиций':>9} {'читается':>9} "
+        f"{'p50 мс':>8} {'p95 мс':>8}"
+    )
+    for days, snapshots, partitions, scanned, stats in rows:
+        print(
+            f"{days:>6} {snapshots:>11} {partitions:>9} {scanned:>9} "
+            f"{stats['p50']:>8.2f} {stats['p95']:>8.2f}"
+        )
+
+
+async def _partition_bench_rows(
+    args: argparse.Namespace, history_sizes: List[int]
+) -> List[Tuple[int, int, int, int, Dict[str, float]]]:
+    rows = []
+    for days in history_sizes:
+        args.days = days
+        args.generate_videos = args.videos_per_day * days
+        await generate_dataset(args)
+
+        middle = datetime(2025, 11, 1) + timedelta(days=days // 2)
+        spec = QuerySpec(
+            table=Table.video_snapshots,
+            aggregation=Aggregation.sum_field,
+            field="delta_views_count",
+            filters=[
+                Condition(
+                    column="created_at",
+                    op=ConditionOp.date_eq,
+                    value=middle.date().isoformat(),
+                )
+            ],
+        )
+        sql, params = build_sql_and_params(spec)
+
+        async with database_manager.create_session() as session:
+            partitions = len(await existing_snapshot_partitions(session))
+            snapshots = (
+                await session.execute(text("SELECT COUNT(*) FROM video_snapshots"))
+            ).scalar_one()
+            plan = (
+                await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params)
+            ).scalar_one()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scanned = {
+                name
+                for name in _scanned_relations(plan[0]["Plan"])
+                if name.startswith(PARTITION_PREFIX)
+            }
+
+        timings = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            async with database_manager.create_session() as session:
+                await execute_query_spec(session, spec)
+            timings.append(time.perf_counter() - started)
+        rows.append((days, snapshots, partitions, len(scanned), summarize(timings)))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк вопрос -> число")
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument(
+        "--no-rules",
+        action="store_true",
+        help="не использовать rule_parser, все вопросы идут в заглушку LLM",
+    )
+    parser.add_argument("--output", default=None, help="куда сохранить JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+
+    parser.add_argument("--generate-videos", type=int, default=0)
+    parser.add_argument("--snapshots-per-video", type=int, default=100)
+    parser.add_argument("--creators", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--differential",
+        type=int,
+        default=0,
+        metavar="N",
+        help="сверить in-memory движок с Postgres на N случайных спецификациях",
+    )
+    parser.add_argument(
+        "--partition-bench",
+        default=None,
+        metavar="DAYS",
+        help="сравнить запрос за день на истории разной длины, например 7,14,28,56",
+    )
+    parser.add_argument("--videos-per-day", type=int, default=200)
+    parser.add_argument(
+        "--truncate",
+        action="store_true",
+        help="очистить videos, video_snapshots, роллап и свёртки перед генерацией",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.differential:
+        raise SystemExit(1 if asyncio.run(run_differential(args)) else 0)
+    elif args.partition_bench:
+        asyncio.run(run_partition_bench(args))
+    elif args.generate_videos:
+        asyncio.run(generate_dataset(args))
+    else:
+        report = asyncio.run(run_benchmark(args))
+        if args.output:
+            Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+            Path(args.output).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            print(f"результаты: {args.output}")
@@ -0,0 +1,116 @@
+# compact_db_script.py
+"""
+Свёртка старых почасовых снапшотов в дневные строки (app/services/compaction.py).
+
+    python compact_db_script.py                        # старше HOURLY_SNAPSHOTS_RETENTION_DAYS
+    python compact_db_script.py --older-than-days 60 --max-days 7 --batch-videos 500
+    python compact_db_script.py --dry-run              # только список дней
+
+Каждый свёрнутый день попадает в data_loads как обычная загрузка: бот
+сбрасывает кэши ответов, in-memory движок перечитывает эти дни.
+"""
+
+import asyncio
+import time
+from typing import List, Optional
+
+from app.base.session_maker import database_manager
+from app.services.compaction import (
+    DayCompaction,
+    compact_day,
+    compaction_cutoff,
+    days_to_compact,
+)
+
+from fill_db_script import finish_load
+
+
+def _mb(size: int) -> str:
+    return f"{size / (1 << 20):.1f} МБ"
+
+
+async def compact(
+    older_than_days: Optional[int] = None,
+    batch_videos: Optional[int] = None,
+    vacuum_full: Optional[bool] = None,
+    max_days: Optional[int] = None,
+    dry_run: bool = False,
+) -> List[DayCompaction]:
+    started = time.monotonic()
+    cutoff = compaction_cutoff(older_than_days)
+    reports: List[DayCompaction] = []
+
+    async with database_manager.create_session() as session:
+        days = await days_to_compact(session, cutoff)
+        if max_days is not None:
+            days = days[:max_days]
+        print(f"к свёртке дней: {len(days)} (раньше {cutoff})")
+        if dry_run or not days:
+            return reports
+
+        for day in days:
+            report = await compact_day(session, day, batch_videos, vacuum_full)
+            reports.append(report)
+            line = (
+                f"{day}: строк {report.rows_removed} -> {report.rows_added} "
+                f"(-{report.rows_reclaimed})"
+            )
+            if report.finished:
+                line += (
+                    f", {_mb(report.bytes_before)} -> {_mb(report.bytes_after)} "
+                    f"(-{_mb(report.bytes_reclaimed)})"
+                )
+            else:
+                line += ", не закончен (блокировки), продолжится следующим запуском"
+            print(line)
+
+        touched = {report.day for report in reports if report.rows_removed}
+        if touched:
+            await finish_load(session, touched)
+
+    finished = [report for report in reports if report.finished]
+    print(
+        f"ГОТОВО за {time.monotonic() - started:.1f} с: "
+        f"строк освобождено {sum(r.rows_reclaimed for r in reports)}, "
+        f"места {_mb(sum(r.bytes_reclaimed for r in finished))}, "
+        f"дней свёрнуто {len(finished)} из {len(days)}"
+    )
+    return reports
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Свёртка старых почасовых снапшотов в дневные строки"
+    )
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=None,
+        help="по умолчанию HOURLY_SNAPSHOTS_RETENTION_DAYS",
+    )
+    parser.add_argument("--batch-videos", type=int, default=None)
+    parser.add_argument(
+        "--max-days", type=int, default=None, help="свернуть не больше N дней"
+    )
+    parser.add_argument(
+        "--no-vacuum-full",
+        dest="vacuum_full",
+        action="store_const",
+        const=False,
+        default=None,
+        help="обычный VACUUM: место переиспользуется, но не отдаётся ОС",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    asyncio.run(
+        compact(
+            older_than_days=args.older_than_days,
+            batch_videos=args.batch_videos,
+            vacuum_full=args.vacuum_full,
+            max_days=args.max_days,
+            dry_run=args.dry_run,
+        )
+    )
@@ -1,16 +1,33 @@
 # fill_db_script.py
 
 import asyncio
+import glob
 import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from typing import List
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.base.database import engine
 from app.base.models import Video, VideoSnapshot
 from app.base.session_maker import database_manager
+from app.services.data_events import notify_data_loaded, record_data_load
+from app.services.partitions import create_snapshot_partitions
+from app.services.precomputed import precompute_answers
+from app.services.rollup import (
+    COMPACTIONS_TABLE,
+    get_compacted_days,
+    refresh_daily_rollup,
+    snapshot_day,
+)
 
 
 class SnapshotIn(BaseModel):
@@ -41,6 +58,563 @@ class VideoIn(BaseModel):
     snapshots: List[SnapshotIn] = []
 
 
+# Порядок колонок для COPY (как в моделях)
+VIDEO_COLUMNS = [name for name in VideoIn.model_fields if name != "snapshots"]
+SNAPSHOT_COLUMNS = list(SnapshotIn.model_fields)
+_SNAPSHOT_CREATED_AT = SNAPSHOT_COLUMNS.index("created_at")
+
+_videos_adapter = TypeAdapter(List[VideoIn])
+_datetime_adapter = TypeAdapter(datetime)
+
+
+def iter_json_array(
+    path: str, key: str = "videos", chunk_size: int = 1 << 20
+) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково отдаёт элементы массива raw[key] из JSON-файла вида {"videos": [...]},
+    не читая файл целиком. В памяти держится один чанк и текущий элемент.
+    Разобранное начало буфера отрезается только при чтении нового чанка,
+    а не после каждого элемента — иначе каждый элемент копировал бы весь
+    остаток чанка.
+    """
+    decoder = json.JSONDecoder()
+    key_re = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def read_more() -> bool:
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        # 1. ищем начало массива
+        while True:
+            m = key_re.search(buf)
+            if m is not None:
+                buf = buf[m.end() :]
+                break
+            # ключ мог разорваться на границе чанков — хвост оставляем
+            buf = buf[-(len(key) + 64) :]
+            if not read_more():
+                return
+
+        # 2. разбираем элементы по одному
+        while True:
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) or not read_more():
+                    break
+            if pos >= len(buf):
+                raise ValueError(f"unexpected end of file inside '{key}' array")
+            if buf[pos] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof or not read_more():
+                    raise
+                continue
+
+            yield item
+            pos = end
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_records(
+    videos: List[VideoIn],
+) -> Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]]]:
+    """Провалидированные видео -> кортежи для COPY в videos и video_snapshots."""
+    video_records = []
+    snapshot_records = []
+    for video in videos:
+        video_records.append(tuple(getattr(video, c) for c in VIDEO_COLUMNS))
+        for snap in video.snapshots:
+            snapshot_records.append(tuple(getattr(snap, c) for c in SNAPSHOT_COLUMNS))
+    return video_records, snapshot_records
+
+
+def prepare_batch(
+    raw_batch: List[Dict[str, Any]],
+) -> Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]]]:
+    """Валидация сырого батча и сборка кортежей (выполняется и в дочерних процессах)."""
+    return to_records(_videos_adapter.validate_python(raw_batch))
+
+
+async def get_asyncpg_connection(session: AsyncSession):
+    """Сырое asyncpg-соединение текущей транзакции сессии (для COPY)."""
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    return raw.driver_connection
+
+
+# Дни, партиции video_snapshots которых этот процесс уже видел или создал
+_known_partitions: Set[date] = set()
+
+
+async def ensure_partition_days(days: Set[date]) -> None:
+    """
+    Партиции для days (и на неделю вперёд) до записи снапшотов.
+    DDL идёт отдельной короткой транзакцией: эксклюзивная блокировка
+    video_snapshots не держится до конца записи батча.
+
+    Только пока никто другой не пишет: партиция берёт ACCESS EXCLUSIVE на
+    video_snapshots, а копия FK — блокировку videos, и с транзакцией, которая
+    уже записала videos и идёт в video_snapshots, получается взаимоблокировка.
+    Параллельная загрузка поэтому создаёт все партиции заранее.
+    """
+    if days <= _known_partitions:
+        return
+    async with database_manager.create_session() as session:
+        ready = await create_snapshot_partitions(session, days - _known_partitions)
+        await session.commit()
+    _known_partitions.update(ready)
+
+
+async def ensure_snapshot_partitions(snapshot_records: List[Tuple[Any, ...]]) -> None:
+    """Партиции для дней батча, см. ensure_partition_days."""
+    await ensure_partition_days(
+        {snapshot_day(snap[_SNAPSHOT_CREATED_AT]) for snap in snapshot_records}
+    )
+
+
+# Свёрнутые дни (services.compaction), прочитанные этим процессом, или None
+_compacted_days: Optional[Set[date]] = None
+
+
+async def reject_compacted_days(days: Set[date]) -> None:
+    """
+    ValueError, если в days есть свёрнутые дни. Их роллап собран по почасовым
+    строкам до свёртки и не пересчитывается, а новые строки рядом с дневными
+    изменили бы ответы по таблице. upsert такие снапшоты пропускает сам.
+    """
+    global _compacted_days
+    if _compacted_days is None:
+        async with database_manager.create_session() as session:
+            _compacted_days = await get_compacted_days(session)
+    compacted = days & _compacted_days
+    if compacted:
+        listed = ", ".join(day.isoformat() for day in sorted(compacted))
+        raise ValueError(f"Snapshots for compacted days cannot be loaded: {listed}")
+
+
+def shard_snapshot_days(path: str) -> Set[date]:
+    """Дни снапшотов шарда без полной валидации (выполняется в дочерних процессах)."""
+    days: Set[date] = set()
+    for video in iter_json_array(path):
+        for snap in video.get("snapshots", ()):
+            days.add(
+                snapshot_day(_datetime_adapter.validate_python(snap["created_at"]))
+            )
+    return days
+
+
+async def copy_records(
+    session: AsyncSession,
+    video_records: List[Tuple[Any, ...]],
+    snapshot_records: List[Tuple[Any, ...]],
+) -> None:
+    """
+    COPY батча в обе таблицы в рамках транзакции сессии (видео раньше — FK).
+    Снапшоты свёрнутых дней отвергаются (см. reject_compacted_days).
+    """
+    await reject_compacted_days(
+        {snapshot_day(snap[_SNAPSHOT_CREATED_AT]) for snap in snapshot_records}
+    )
+    await ensure_snapshot_partitions(snapshot_records)
+    pg = await get_asyncpg_connection(session)
+    if video_records:
+        await pg.copy_records_to_table(
+            "videos", records=video_records, columns=VIDEO_COLUMNS
+        )
+    if snapshot_records:
+        await pg.copy_records_to_table(
+            "video_snapshots", records=snapshot_records, columns=SNAPSHOT_COLUMNS
+        )
+
+
+async def finish_load(session: AsyncSession, touched_days: Set[date]) -> None:
+    """
+    Общий хвост загрузки: пересчёт роллапа, запись в data_loads, ответы
+    на самые частые вопросы и уведомление бота.
+    """
+    days = await refresh_daily_rollup(session, touched_days)
+    generation = await record_data_load(session, touched_days)
+    # в той же транзакции: ответы видны вместе с новой загрузкой
+    answered = await precompute_answers(session, generation)
+    await session.commit()
+    print(
+        f"роллап пересчитан: дней={days}, загрузка #{generation}, "
+        f"заранее посчитано ответов: {answered}"
+    )
+
+    # бот сбросит кэш ответов, посчитанных по старым данным
+    await notify_data_loaded(session, generation)
+
+
+async def fill_db_copy(path: str, batch_size: int = 1000) -> None:
+    """
+    Потоковая загрузка через COPY: файл читается по частям, батч из batch_size
+    видео валидируется одним TypeAdapter и уходит в БД через
+    copy_records_to_table. Память ограничена размером батча, а не файла.
+    Каждый батч коммитится отдельно (одной транзакции на весь файл нет):
+    прерванную загрузку в пустую БД начинают заново с очищенных таблиц.
+    """
+    total_videos = 0
+    total_snaps = 0
+    touched_days: Set[date] = set()
+    started = time.monotonic()
+
+    async with database_manager.create_session() as session:
+        for raw_batch in iter_batches(iter_json_array(path), batch_size):
+            video_records, snapshot_records = prepare_batch(raw_batch)
+
+            await copy_records(session, video_records, snapshot_records)
+            await session.commit()
+
+            total_videos += len(video_records)
+            total_snaps += len(snapshot_records)
+            for snap in snapshot_records:
+                touched_days.add(snapshot_day(snap[_SNAPSHOT_CREATED_AT]))
+
+            elapsed = time.monotonic() - started
+            rate = (total_videos + total_snaps) / elapsed if elapsed else 0.0
+            print(
+                f"батч: видео={total_videos}, снапы={total_snaps}, {rate:.0f} строк/с"
+            )
+
+        if total_videos == 0:
+            print("пустой videos в json’е")
+            return
+
+        await finish_load(session, touched_days)
+
+    elapsed = time.monotonic() - started
+    print(f"ГОТОВО. видео={total_videos}, снапы={total_snaps}, за {elapsed:.1f} с")
+
+
+# Счётчики видео, которые upsert обновляет
+_VIDEO_MUTABLE_COLUMNS = [
+    "views_count",
+    "likes_count",
+    "reports_count",
+    "comments_count",
+    "updated_at",
+]
+
+_CREATE_STAGE_SQL = [
+    "CREATE TEMP TABLE IF NOT EXISTS videos_stage "
+    "(LIKE videos INCLUDING DEFAULTS) ON COMMIT DELETE ROWS",
+    "CREATE TEMP TABLE IF NOT EXISTS video_snapshots_stage "
+    "(LIKE video_snapshots INCLUDING DEFAULTS) ON COMMIT DELETE ROWS",
+]
+
+_UPSERT_VIDEOS_SQL = f"""
+    INSERT INTO videos AS v ({", ".join(VIDEO_COLUMNS)})
+    SELECT {", ".join(VIDEO_COLUMNS)} FROM videos_stage
+    ON CONFLICT (id) DO UPDATE SET
+        {", ".join(f"{c} = EXCLUDED.{c}" for c in _VIDEO_MUTABLE_COLUMNS)}
+    WHERE ({", ".join(f"v.{c}" for c in _VIDEO_MUTABLE_COLUMNS)})
+        IS DISTINCT FROM
+        ({", ".join(f"EXCLUDED.{c}" for c in _VIDEO_MUTABLE_COLUMNS)})
+    RETURNING (xmax = 0) AS inserted
+"""
+
+# снапшоты свёрнутых дней не вставляются: их почасовые строки уже удалены
+# свёрткой, и повторная загрузка того же файла вернула бы их обратно
+_INSERT_NEW_SNAPSHOTS_SQL = f"""
+    INSERT INTO video_snapshots ({", ".join(SNAPSHOT_COLUMNS)})
+    SELECT {", ".join(SNAPSHOT_COLUMNS)} FROM video_snapshots_stage AS s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {COMPACTIONS_TABLE} AS c
+        WHERE c.day = (s.created_at AT TIME ZONE 'UTC')::date
+    )
+    ON CONFLICT (id, created_at) DO NOTHING
+    RETURNING created_at
+"""
+
+
+def new_upsert_stats() -> Dict[str, int]:
+    return {
+        "videos_inserted": 0,
+        "videos_updated": 0,
+        "videos_skipped": 0,
+        "snapshots_inserted": 0,
+        "snapshots_skipped": 0,
+    }
+
+
+async def upsert_records(
+    session: AsyncSession,
+    video_records: List[Tuple[Any, ...]],
+    snapshot_records: List[Tuple[Any, ...]],
+    stats: Dict[str, int],
+    touched_days: Set[date],
+) -> None:
+    """
+    Один батч инкрементальной загрузки в транзакции сессии (коммит снаружи).
+    Обновляет stats и дни, в которые реально добавились снапшоты.
+    """
+    # ON CONFLICT DO UPDATE не переваривает дубли id внутри одной вставки
+    video_records = list({rec[0]: rec for rec in video_records}.values())
+
+    await ensure_snapshot_partitions(snapshot_records)
+    pg = await get_asyncpg_connection(session)
+    for sql in _CREATE_STAGE_SQL:
+        await pg.execute(sql)
+
+    await pg.copy_records_to_table(
+        "videos_stage", records=video_records, columns=VIDEO_COLUMNS
+    )
+    rows = await pg.fetch(_UPSERT_VIDEOS_SQL)
+    inserted = sum(1 for row in rows if row["inserted"])
+    stats["videos_inserted"] += inserted
+    stats["videos_updated"] += len(rows) - inserted
+    stats["videos_skipped"] += len(video_records) - len(rows)
+
+    rows = []
+    if snapshot_records:
+        await pg.copy_records_to_table(
+            "video_snapshots_stage",
+            records=snapshot_records,
+            columns=SNAPSHOT_COLUMNS,
+        )
+        rows = await pg.fetch(_INSERT_NEW_SNAPSHOTS_SQL)
+    stats["snapshots_inserted"] += len(rows)
+    stats["snapshots_skipped"] += len(snapshot_records) - len(rows)
+    for row in rows:
+        touched_days.add(snapshot_day(row["created_at"]))
+
+
+async def fill_db_upsert(path: str, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Инкрементальная загрузка поверх уже заполненной БД, повторный запуск безопасен.
+
+    - videos: INSERT ... ON CONFLICT (id) DO UPDATE счётчиков и updated_at,
+      неизменившиеся строки не трогаются;
+    - video_snapshots: все снапшоты файла идут через stage с ON CONFLICT
+      (id, created_at) DO NOTHING (ключ партиционированной таблицы включает
+      created_at), уже загруженные просто пропускаются. Отсечки по
+      MAX(created_at) нет: батчи коммитятся по одному, и после падения
+      посреди файла она отбросила бы снапшоты ещё не загруженных видео.
+      Снапшоты свёрнутых дней (services.compaction) тоже считаются
+      пропущенными: роллап этих дней остаётся таким, каким был до свёртки.
+
+    Время работы зависит от размера файла, а не от всей истории в БД.
+    Возвращает счётчики inserted/updated/skipped по обеим таблицам.
+    """
+    stats = new_upsert_stats()
+    touched_days: Set[date] = set()
+    started = time.monotonic()
+
+    async with database_manager.create_session() as session:
+        for raw_batch in iter_batches(iter_json_array(path), batch_size):
+            video_records, snapshot_records = prepare_batch(raw_batch)
+            await upsert_records(
+                session, video_records, snapshot_records, stats, touched_days
+            )
+            await session.commit()
+
+            elapsed = time.monotonic() - started
+            print(f"батч: {stats}, {elapsed:.1f} с")
+
+        if touched_days or stats["videos_inserted"] or stats["videos_updated"]:
+            await finish_load(session, touched_days)
+        else:
+            print("новых данных нет")
+
+    elapsed = time.monotonic() - started
+    print(f"ГОТОВО за {elapsed:.1f} с: {stats}")
+    return stats
+
+
+def expand_dump_paths(path_or_glob: str) -> List[str]:
+    """Каталог -> все *.json в нём, иначе путь трактуется как glob."""
+    path = Path(path_or_glob)
+    if path.is_dir():
+        return sorted(str(p) for p in path.glob("*.json"))
+    return sorted(glob.glob(path_or_glob))
+
+
+async def fill_db_sharded(
+    path_or_glob: str,
+    mode: str = "copy",
+    workers: Optional[int] = None,
+    writers: int = 4,
+    batch_size: int = 1000,
+) -> None:
+    """
+    Параллельная загрузка набора шардов (каталог или glob).
+
+    Сначала шарды один раз просматриваются ради дней снапшотов, и все
+    партиции создаются до старта писателей (см. ensure_partition_days).
+    Затем шарды читаются потоково, Pydantic-валидация и сборка кортежей (CPU)
+    идут в ProcessPoolExecutor, запись — в writers конкурентных задачах, каждая
+    со своей сессией из пула base.database. Общее число батчей "в работе"
+    (в процессах, в очереди и в записи) ограничено семафором, поэтому чтение
+    ждёт медленную БД и память не растёт.
+
+    mode: "copy" — COPY в пустые таблицы, "upsert" — как fill_db_upsert.
+    """
+    paths = expand_dump_paths(path_or_glob)
+    if not paths:
+        print(f"нет файлов по пути {path_or_glob}")
+        return
+
+    workers = workers or os.cpu_count() or 1
+    # писателей не больше, чем постоянных соединений в пуле
+    writers = max(1, min(writers, engine.pool.size()))
+    in_flight = asyncio.Semaphore(workers + writers)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    stats = new_upsert_stats()
+    totals = {"videos": 0, "snapshots": 0}
+    touched_days: Set[date] = set()
+    started = time.monotonic()
+
+    # первая ошибка в процессе или писателе останавливает чтение шардов
+    errors: List[BaseException] = []
+
+    async def drain() -> None:
+        """Разбирает очередь без записи, чтобы чтение шардов не ждало вечно."""
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            in_flight.release()
+
+    async def write_batches(session: AsyncSession) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if errors:
+                # загрузка уже упала — только освобождаем место
+                in_flight.release()
+                continue
+
+            video_records, snapshot_records = item
+            try:
+                if mode == "upsert":
+                    await upsert_records(
+                        session,
+                        video_records,
+                        snapshot_records,
+                        stats,
+                        touched_days,
+                    )
+                else:
+                    await copy_records(session, video_records, snapshot_records)
+                    for snap in snapshot_records:
+                        touched_days.add(snapshot_day(snap[_SNAPSHOT_CREATED_AT]))
+                await session.commit()
+            except Exception as e:
+                errors.append(e)
+                await session.rollback()
+                continue
+            finally:
+                in_flight.release()
+
+            totals["videos"] += len(video_records)
+            totals["snapshots"] += len(snapshot_records)
+            elapsed = time.monotonic() - started
+            rate = (totals["videos"] + totals["snapshots"]) / elapsed
+            print(
+                f"батч: видео={totals['videos']}, снапы={totals['snapshots']}, "
+                f"{rate:.0f} строк/с, очередь={queue.qsize()}"
+            )
+
+    async def writer() -> None:
+        try:
+            async with database_manager.create_session() as session:
+                await write_batches(session)
+        except Exception as e:
+            # не открылась сессия или упал откат: ошибку видит чтение,
+            # а очередь этот писатель дальше только разбирает
+            errors.append(e)
+            await drain()
+
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    writer_tasks: List[asyncio.Task] = []
+    prepare_tasks: Set[asyncio.Task] = set()
+
+    async def prepare(raw_batch: List[Dict[str, Any]]) -> None:
+        try:
+            records = await loop.run_in_executor(pool, prepare_batch, raw_batch)
+        except Exception as e:
+            errors.append(e)
+            in_flight.release()
+            return
+        await queue.put(records)
+
+    try:
+        shard_days = await asyncio.gather(
+            *(loop.run_in_executor(pool, shard_snapshot_days, path) for path in paths)
+        )
+        all_days: Set[date] = set().union(*shard_days)
+        if mode == "copy":
+            # отказ до первой записи, а не посреди загрузки
+            await reject_compacted_days(all_days)
+        # писатели найдут все партиции готовыми и DDL не запустят
+        await ensure_partition_days(all_days)
+
+        writer_tasks = [asyncio.create_task(writer()) for _ in range(writers)]
+        for path in paths:
+            print(f"шард: {path}")
+            for raw_batch in iter_batches(iter_json_array(path), batch_size):
+                await in_flight.acquire()
+                if errors:
+                    raise errors[0]
+                task = asyncio.create_task(prepare(raw_batch))
+                prepare_tasks.add(task)
+                task.add_done_callback(prepare_tasks.discard)
+
+        await asyncio.gather(*prepare_tasks)
+        for _ in writer_tasks:
+            await queue.put(None)
+        await asyncio.gather(*writer_tasks)
+        if errors:
+            raise errors[0]
+    finally:
+        for task in (*prepare_tasks, *writer_tasks):
+            task.cancel()
+        await asyncio.gather(*prepare_tasks, *writer_tasks, return_exceptions=True)
+        pool.shutdown(cancel_futures=True)
+
+    async with database_manager.create_session() as session:
+        await finish_load(session, touched_days)
+
+    elapsed = time.monotonic() - started
+    print(
+        f"ГОТОВО за {elapsed:.1f} с: шардов={len(paths)}, "
+        f"видео={totals['videos']}, снапы={totals['snapshots']}"
+    )
+    if mode == "upsert":
+        print(f"upsert: {stats}")
+
+
 async def fill_db(path: str, batch_size: int = 500) -> None:
     path_json = Path(path)
 
@@ -54,6 +628,9 @@ async def fill_db(path: str, batch_size: int = 500) -> None:
 
     total_videos = 0
     total_snaps = 0
+    touched_days: Set[date] = set()
+    # дни снапшотов текущего батча: их партиции нужны до add_all
+    batch_days: Set[date] = set()
 
     async with database_manager.create_session() as session:
         to_add = []
@@ -69,25 +646,68 @@ async def fill_db(path: str, batch_size: int = 500) -> None:
                 snapshot = VideoSnapshot(**snap_in.model_dump())
                 to_add.append(snapshot)
                 total_snaps += 1
+                batch_days.add(snapshot_day(snap_in.created_at))
 
             if len(to_add) >= batch_size:
+                await reject_compacted_days(batch_days)
+                await ensure_partition_days(batch_days)
+                touched_days |= batch_days
+                batch_days = set()
                 session.add_all(to_add)
                 await session.commit()
                 to_add.clear()
                 print(f"батч: видео={total_videos}, снапы={total_snaps}")
 
         if to_add:
+            await reject_compacted_days(batch_days)
+            await ensure_partition_days(batch_days)
+            touched_days |= batch_days
             session.add_all(to_add)
             await session.commit()
             print(f"финал: видео={total_videos}, снапы={total_snaps}")
 
+        await finish_load(session, touched_days)
+
     print(f"ГОТОВО. видео={total_videos}, снапы={total_snaps}")
 
 
 if __name__ == "__main__":
-    import sys
+    import argparse
 
-    if len(sys.argv) != 2:
-        raise SystemExit(1)
+    parser = argparse.ArgumentParser(description="Заливка JSON с видео в БД")
+    parser.add_argument("path")
+    parser.add_argument(
+        "--mode",
+        choices=["orm", "copy", "upsert"],
+        default="orm",
+        help=(
+            "orm — ORM add_all (по умолчанию), copy — потоковый COPY в пустую БД, "
+            "upsert — инкрементальная дозагрузка поверх существующих данных"
+        ),
+    )
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="параллельная загрузка шардов: path — каталог или glob, N процессов",
+    )
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
 
-    asyncio.run(fill_db(sys.argv[1]))
+    if args.workers is not None:
+        asyncio.run(
+            fill_db_sharded(
+                args.path,
+                mode="upsert" if args.mode == "upsert" else "copy",
+                workers=args.workers,
+                writers=args.writers,
+                batch_size=args.batch_size or 1000,
+            )
+        )
+    elif args.mode == "copy":
+        asyncio.run(fill_db_copy(args.path, batch_size=args.batch_size or 1000))
+    elif args.mode == "upsert":
+        asyncio.run(fill_db_upsert(args.path, batch_size=args.batch_size or 1000))
+    else:
+        asyncio.run(fill_db(args.path, batch_size=args.batch_size or 500))
@@ -0,0 +1,66 @@
+"""query indexes for QuerySpec filters
+
+Revision ID: 3f1c9a7d2b64
+Revises: 82bbc1c74e8c
+Create Date: 2025-12-20 12:10:04.118233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2b64'
+down_revision: Union[str, Sequence[str], None] = '82bbc1c74e8c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # videos: creator_id = ... AND video_created_at в диапазоне
+    op.create_index(
+        'ix_videos_creator_id_video_created_at',
+        'videos',
+        ['creator_id', 'video_created_at'],
+    )
+    # videos: video_created_at в диапазоне без креатора
+    op.create_index('ix_videos_video_created_at', 'videos', ['video_created_at'])
+    # videos: views_count > N
+    op.create_index('ix_videos_views_count', 'videos', ['views_count'])
+    op.create_index('ix_videos_created_at', 'videos', ['created_at'])
+
+    # video_snapshots: FK без индекса
+    op.create_index('ix_video_snapshots_video_id', 'video_snapshots', ['video_id'])
+    # video_snapshots: created_at растёт вместе с физическим порядком строк
+    # (почасовые вставки), BRIN даёт range-скан при крошечном размере
+    op.create_index(
+        'ix_video_snapshots_created_at_brin',
+        'video_snapshots',
+        ['created_at'],
+        postgresql_using='brin',
+    )
+    # video_snapshots: "разные видео с приростом просмотров за день"
+    op.create_index(
+        'ix_video_snapshots_growth_created_at',
+        'video_snapshots',
+        ['created_at', 'video_id'],
+        postgresql_where=sa.text('delta_views_count > 0'),
+    )
+    op.create_index(
+        'ix_video_snapshots_views_count', 'video_snapshots', ['views_count']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_video_snapshots_views_count', table_name='video_snapshots')
+    op.drop_index('ix_video_snapshots_growth_created_at', table_name='video_snapshots')
+    op.drop_index('ix_video_snapshots_created_at_brin', table_name='video_snapshots')
+    op.drop_index('ix_video_snapshots_video_id', table_name='video_snapshots')
+    op.drop_index('ix_videos_created_at', table_name='videos')
+    op.drop_index('ix_videos_views_count', table_name='videos')
+    op.drop_index('ix_videos_video_created_at', table_name='videos')
+    op.drop_index('ix_videos_creator_id_video_created_at', table_name='videos')
@@ -0,0 +1,61 @@
+"""snapshot daily rollup
+
+Revision ID: 9b2e4d1f6a10
+Revises: 3f1c9a7d2b64
+Create Date: 2025-12-21 15:32:47.502114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b2e4d1f6a10'
+down_revision: Union[str, Sequence[str], None] = '3f1c9a7d2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('snapshot_daily_rollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('video_id', sa.UUID(), nullable=False),
+    sa.Column('snapshots_count', sa.BigInteger(), nullable=False),
+    sa.Column('delta_views_count', sa.BigInteger(), nullable=False),
+    sa.Column('delta_likes_count', sa.BigInteger(), nullable=False),
+    sa.Column('delta_comments_count', sa.BigInteger(), nullable=False),
+    sa.Column('delta_reports_count', sa.BigInteger(), nullable=False),
+    sa.Column('has_views_growth', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ),
+    sa.PrimaryKeyConstraint('day', 'video_id')
+    )
+
+    # заполняем по уже загруженным снапшотам, дни — по UTC
+    op.execute(
+        """
+        INSERT INTO snapshot_daily_rollup
+            (day, video_id, snapshots_count,
+             delta_views_count, delta_likes_count,
+             delta_comments_count, delta_reports_count,
+             has_views_growth)
+        SELECT
+            (created_at AT TIME ZONE 'UTC')::date,
+            video_id,
+            COUNT(*),
+            SUM(delta_views_count),
+            SUM(delta_likes_count),
+            SUM(delta_comments_count),
+            SUM(delta_reports_count),
+            BOOL_OR(delta_views_count > 0)
+        FROM video_snapshots
+        GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('snapshot_daily_rollup')
@@ -0,0 +1,37 @@
+"""snapshot compactions
+
+Revision ID: a4d92e6c0b15
+Revises: f3b8d61a5c27
+Create Date: 2025-12-30 11:08:14.630295
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d92e6c0b15'
+down_revision: Union[str, Sequence[str], None] = 'f3b8d61a5c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('snapshot_compactions',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('started_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('rows_removed', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('rows_added', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('bytes_before', sa.BigInteger(), nullable=False),
+    sa.Column('bytes_after', sa.BigInteger(), nullable=True),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('snapshot_compactions')
@@ -0,0 +1,56 @@
+"""query stats per day
+
+Revision ID: b81f5e2d9c47
+Revises: a4d92e6c0b15
+Create Date: 2026-01-05 12:17:45.904133
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81f5e2d9c47'
+down_revision: Union[str, Sequence[str], None] = 'a4d92e6c0b15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('query_stats', sa.Column('day', sa.Date(), nullable=True))
+    # накопленные счётчики относим ко дню последнего вопроса
+    op.execute("UPDATE query_stats SET day = (last_seen AT TIME ZONE 'UTC')::date")
+    op.alter_column('query_stats', 'day', nullable=False)
+    op.drop_constraint('query_stats_pkey', 'query_stats', type_='primary')
+    op.create_primary_key('query_stats_pkey', 'query_stats', ['day', 'spec_hash'])
+    op.drop_column('query_stats', 'last_seen')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('query_stats', sa.Column('last_seen', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+    # одна строка на spec: сумма по дням в строке последнего дня
+    op.execute(
+        """
+        UPDATE query_stats AS s
+        SET hits = t.hits, last_seen = t.last_day::timestamp AT TIME ZONE 'UTC'
+        FROM (
+            SELECT spec_hash, SUM(hits) AS hits, MAX(day) AS last_day
+            FROM query_stats GROUP BY spec_hash
+        ) AS t
+        WHERE s.spec_hash = t.spec_hash AND s.day = t.last_day
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM query_stats AS s
+        USING (SELECT spec_hash, MAX(day) AS last_day FROM query_stats GROUP BY spec_hash) AS t
+        WHERE s.spec_hash = t.spec_hash AND s.day < t.last_day
+        """
+    )
+    op.drop_constraint('query_stats_pkey', 'query_stats', type_='primary')
+    op.create_primary_key('query_stats_pkey', 'query_stats', ['spec_hash'])
+    op.drop_column('query_stats', 'day')
@@ -0,0 +1,41 @@
+"""query stats and precomputed answers
+
+Revision ID: e7a4c2b9d183
+Revises: c5e81f3a7d42
+Create Date: 2025-12-26 10:42:51.218377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a4c2b9d183'
+down_revision: Union[str, Sequence[str], None] = 'c5e81f3a7d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('query_stats',
+    sa.Column('spec_hash', sa.String(), nullable=False),
+    sa.Column('spec', sa.String(), nullable=False),
+    sa.Column('hits', sa.BigInteger(), nullable=False),
+    sa.Column('last_seen', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('spec_hash')
+    )
+    op.create_table('answers',
+    sa.Column('spec_hash', sa.String(), nullable=False),
+    sa.Column('generation', sa.BigInteger(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('spec_hash', 'generation')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('answers')
+    op.drop_table('query_stats')
@@ -0,0 +1,145 @@
+"""partition video_snapshots by day
+
+Revision ID: f3b8d61a5c27
+Revises: e7a4c2b9d183
+Create Date: 2025-12-29 14:21:37.502814
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d61a5c27'
+down_revision: Union[str, Sequence[str], None] = 'e7a4c2b9d183'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = (
+    'ix_video_snapshots_views_count',
+    'ix_video_snapshots_growth_created_at',
+    'ix_video_snapshots_created_at_brin',
+    'ix_video_snapshots_video_id',
+)
+
+# Дневные партиции (сутки UTC) от первого дня данных до недели вперёд
+# от последнего (или от сегодня, если таблица пустая)
+_CREATE_PARTITIONS_SQL = """
+DO $$
+DECLARE
+    first_day date;
+    last_day date;
+    d date;
+BEGIN
+    SELECT MIN(created_at AT TIME ZONE 'UTC')::date,
+           MAX(created_at AT TIME ZONE 'UTC')::date
+    INTO first_day, last_day
+    FROM video_snapshots_unpartitioned;
+    first_day := COALESCE(first_day, (now() AT TIME ZONE 'UTC')::date);
+    last_day := GREATEST(COALESCE(last_day, first_day), (now() AT TIME ZONE 'UTC')::date) + 7;
+    d := first_day;
+    WHILE d <= last_day LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF video_snapshots FOR VALUES FROM (%L) TO (%L)',
+            'video_snapshots_p' || to_char(d, 'YYYYMMDD'),
+            d::timestamp AT TIME ZONE 'UTC',
+            (d + 1)::timestamp AT TIME ZONE 'UTC'
+        );
+        d := d + 1;
+    END LOOP;
+END
+$$;
+"""
+
+
+def _snapshot_columns():
+    return [
+        sa.Column('video_id', sa.UUID(), nullable=False),
+        sa.Column('views_count', sa.BigInteger(), nullable=False),
+        sa.Column('likes_count', sa.BigInteger(), nullable=False),
+        sa.Column('reports_count', sa.BigInteger(), nullable=False),
+        sa.Column('comments_count', sa.BigInteger(), nullable=False),
+        sa.Column('delta_views_count', sa.BigInteger(), nullable=False),
+        sa.Column('delta_likes_count', sa.BigInteger(), nullable=False),
+        sa.Column('delta_reports_count', sa.BigInteger(), nullable=False),
+        sa.Column('delta_comments_count', sa.BigInteger(), nullable=False),
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ),
+    ]
+
+
+def _create_indexes() -> None:
+    op.create_index('ix_video_snapshots_video_id', 'video_snapshots', ['video_id'])
+    op.create_index(
+        'ix_video_snapshots_created_at_brin',
+        'video_snapshots',
+        ['created_at'],
+        postgresql_using='brin',
+    )
+    op.create_index(
+        'ix_video_snapshots_growth_created_at',
+        'video_snapshots',
+        ['created_at', 'video_id'],
+        postgresql_where=sa.text('delta_views_count > 0'),
+    )
+    op.create_index(
+        'ix_video_snapshots_views_count', 'video_snapshots', ['views_count']
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # старая таблица уходит в сторону вместе с именами индексов и PK
+    for name in _INDEXES:
+        op.drop_index(name, table_name='video_snapshots')
+    op.rename_table('video_snapshots', 'video_snapshots_unpartitioned')
+    op.execute(
+        'ALTER TABLE video_snapshots_unpartitioned '
+        'RENAME CONSTRAINT video_snapshots_pkey TO video_snapshots_unpartitioned_pkey'
+    )
+
+    # ключ партиционирования обязан входить в первичный ключ
+    op.create_table('video_snapshots',
+    *_snapshot_columns(),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    _create_indexes()
+    op.execute(_CREATE_PARTITIONS_SQL)
+
+    op.execute(
+        'INSERT INTO video_snapshots SELECT '
+        'video_id, views_count, likes_count, reports_count, comments_count, '
+        'delta_views_count, delta_likes_count, delta_reports_count, '
+        'delta_comments_count, id, created_at, updated_at '
+        'FROM video_snapshots_unpartitioned'
+    )
+    op.drop_table('video_snapshots_unpartitioned')
+    op.execute('ANALYZE video_snapshots')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table('video_snapshots_unpartitioned',
+    *_snapshot_columns(),
+    sa.PrimaryKeyConstraint('id', name='video_snapshots_unpartitioned_pkey')
+    )
+    op.execute(
+        'INSERT INTO video_snapshots_unpartitioned SELECT '
+        'video_id, views_count, likes_count, reports_count, comments_count, '
+        'delta_views_count, delta_likes_count, delta_reports_count, '
+        'delta_comments_count, id, created_at, updated_at '
+        'FROM video_snapshots'
+    )
+    # партиции удаляются вместе с родителем
+    op.drop_table('video_snapshots')
+    op.rename_table('video_snapshots_unpartitioned', 'video_snapshots')
+    op.execute(
+        'ALTER TABLE video_snapshots '
+        'RENAME CONSTRAINT video_snapshots_unpartitioned_pkey TO video_snapshots_pkey'
+    )
+    _create_indexes()
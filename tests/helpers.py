@@ -0,0 +1,109 @@
+"""Вспомогательные функции тестов: запуск корутин и синтетические данные в БД."""
+
+import asyncio
+import random
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Dict, Iterator, List, Set, TypeVar
+
+from sqlalchemy import insert, text
+
+from app.base.models import Base, Video, VideoSnapshot
+from base.database import engine
+from base.session_maker import database_manager
+from services.partitions import create_snapshot_partitions
+from services.rollup import refresh_daily_rollup, snapshot_day
+
+T = TypeVar("T")
+
+START = datetime(2025, 11, 1, tzinfo=timezone.utc)
+
+
+def run(coro: Awaitable[T]) -> T:
+    """asyncio.run + закрытие пула: соединения привязаны к своему event loop."""
+
+    async def wrapper() -> T:
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(wrapper())
+
+
+async def reset_schema() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+def generate_rows(
+    videos: int, snapshots_per_video: int, days: int, seed: int = 7
+) -> Iterator[Dict[str, Any]]:
+    """Видео с почасовыми снапшотами; отдаёт строки videos, у каждой — "snapshots"."""
+    rnd = random.Random(seed)
+    creators = [uuid.UUID(int=rnd.getrandbits(128)).hex for _ in range(5)]
+    for _ in range(videos):
+        video_id = uuid.UUID(int=rnd.getrandbits(128))
+        published = START + timedelta(minutes=rnd.randrange(days * 24 * 60))
+        totals = [0, 0, 0, 0]
+        snapshots: List[Dict[str, Any]] = []
+        at = published
+        for _ in range(snapshots_per_video):
+            at += timedelta(hours=1)
+            deltas = [
+                rnd.randrange(0, 300) * rnd.randrange(0, 2),
+                rnd.randrange(0, 20),
+                rnd.randrange(0, 2),
+                rnd.randrange(0, 5),
+            ]
+            totals = [t + d for t, d in zip(totals, deltas)]
+            snapshots.append(
+                {
+                    "id": uuid.UUID(int=rnd.getrandbits(128)),
+                    "video_id": video_id,
+                    "views_count": totals[0],
+                    "likes_count": totals[1],
+                    "reports_count": totals[2],
+                    "comments_count": totals[3],
+                    "delta_views_count": deltas[0],
+                    "delta_likes_count": deltas[1],
+                    "delta_reports_count": deltas[2],
+                    "delta_comments_count": deltas[3],
+                    "created_at": at,
+                    "updated_at": at,
+                }
+            )
+        yield {
+            "id": video_id,
+            "creator_id": rnd.choice(creators),
+            "video_created_at": published,
+            "views_count": totals[0],
+            "likes_count": totals[1],
+            "reports_count": totals[2],
+            "comments_count": totals[3],
+            "created_at": published,
+            "updated_at": at,
+            "snapshots": snapshots,
+        }
+
+
+async def seed(
+    videos: int = 120, snapshots_per_video: int = 48, days: int = 6
+) -> Set[date]:
+    """Заливает синтетические данные с партициями и роллапом; возвращает дни снапшотов."""
+    video_rows = list(generate_rows(videos, snapshots_per_video, days))
+    snapshot_rows = [snap for row in video_rows for snap in row.pop("snapshots")]
+    touched = {snapshot_day(snap["created_at"]) for snap in snapshot_rows}
+
+    async with database_manager.create_session() as session:
+        await create_snapshot_partitions(session, touched)
+        await session.commit()
+        await session.execute(insert(Video.__table__), video_rows)
+        await session.execute(insert(VideoSnapshot.__table__), snapshot_rows)
+        await refresh_daily_rollup(session, touched)
+        await session.commit()
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
+    return touched
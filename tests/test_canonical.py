@@ -0,0 +1,196 @@
+"""
+canonicalize_spec не меняет ответ: проверяется на случайных спецификациях
+по in-memory движку (services.columnar), собранному без БД.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+import pytest
+
+from nlp.spec import (
+    ALLOWED_FIELDS_BY_TABLE,
+    Aggregation,
+    Condition,
+    ConditionOp,
+    QuerySpec,
+    Table,
+)
+from services.canonical import canonicalize_spec
+from services.columnar import ColumnarStore, ColumnTable, to_micros
+from services.sql_builder import build_sql_and_params
+
+from helpers import START, generate_rows
+
+DAYS = 4
+SPECS_PER_TABLE = 400
+
+_SNAPSHOT_COUNTS = (
+    "views_count",
+    "likes_count",
+    "comments_count",
+    "reports_count",
+    "delta_views_count",
+    "delta_likes_count",
+    "delta_comments_count",
+    "delta_reports_count",
+)
+
+
+def _store() -> Tuple[ColumnarStore, List[str]]:
+    """Columnar-движок поверх generate_rows и список креаторов в данных."""
+    store = ColumnarStore()
+    videos, snapshots = [], []
+    for row in generate_rows(videos=60, snapshots_per_video=30, days=DAYS):
+        videos.append(
+            (
+                str(row["id"]),
+                row["creator_id"],
+                to_micros(row["video_created_at"]),
+                to_micros(row["created_at"]),
+                row["views_count"],
+                row["likes_count"],
+                row["comments_count"],
+                row["reports_count"],
+            )
+        )
+        for snap in row["snapshots"]:
+            snapshots.append(
+                (str(snap["video_id"]), to_micros(snap["created_at"]))
+                + tuple(snap[name] for name in _SNAPSHOT_COUNTS)
+            )
+    store.videos = ColumnTable(store._video_columns(videos), "video_created_at")
+    store.snapshots = ColumnTable(store._snapshot_columns(snapshots), "created_at")
+    creators = sorted({row[1] for row in videos})
+    return store, creators
+
+
+def _random_spec(rnd: random.Random, table: Table, creators: List[str]) -> QuerySpec:
+    """
+    Корректная spec, в которой фильтры нередко повторяют колонку —
+    так появляются и сливаемые, и противоречивые условия.
+    """
+
+    def moment(aligned: bool) -> datetime:
+        value = START + timedelta(days=rnd.randrange(-1, DAYS + 2))
+        if aligned:
+            return value
+        value += timedelta(hours=rnd.randrange(24), minutes=rnd.choice((0, 30)))
+        return value.astimezone(
+            rnd.choice((timezone.utc, timezone(timedelta(hours=3))))
+        )
+
+    def condition(column: str) -> Condition:
+        if column == "creator_id":
+            return Condition(
+                column=column, op=ConditionOp.eq, value=rnd.choice(creators)
+            )
+        if column in ("created_at", "video_created_at"):
+            if rnd.random() < 0.4:
+                return Condition(
+                    column=column,
+                    op=ConditionOp.date_eq,
+                    value=moment(True).date().isoformat(),
+                )
+            first = moment(rnd.random() < 0.5)
+            return Condition(
+                column=column,
+                op=ConditionOp.between_datetime,
+                value=first.isoformat(),
+                value2=(first + timedelta(hours=rnd.randrange(1, 72))).isoformat(),
+            )
+        limit = 300 if column.startswith("delta_") else 3000
+        op = rnd.choice((ConditionOp.eq, ConditionOp.gt, ConditionOp.gt))
+        return Condition(column=column, op=op, value=rnd.randrange(limit))
+
+    columns = (
+        ["creator_id", "video_created_at", "created_at", "views_count"]
+        if table == Table.videos
+        else ["created_at", "views_count", "delta_views_count"]
+    )
+    aggregation = rnd.choice(list(Aggregation))
+    fields = ALLOWED_FIELDS_BY_TABLE[table]
+    if aggregation == Aggregation.sum_field:
+        field = rnd.choice([f for f in fields if f not in ("id", "video_id")])
+    else:
+        field = rnd.choice(fields)
+    filters = [condition(rnd.choice(columns)) for _ in range(rnd.randrange(5))]
+    return QuerySpec(table=table, aggregation=aggregation, field=field, filters=filters)
+
+
+@pytest.fixture(scope="module")
+def data():
+    return _store()
+
+
+@pytest.mark.parametrize("table", list(Table), ids=lambda table: table.value)
+def test_canonical_form_keeps_the_answer(data, table):
+    store, creators = data
+    rnd = random.Random(f"canonical-{table.value}")
+    folded = 0
+
+    for _ in range(SPECS_PER_TABLE):
+        spec = _random_spec(rnd, table, creators)
+        expected = store.evaluate(spec)
+        canonical = canonicalize_spec(spec)
+
+        shuffled = spec.model_copy(deep=True)
+        rnd.shuffle(shuffled.filters)
+        assert canonicalize_spec(shuffled) == canonical, spec
+
+        if canonical is None:
+            # None разрешён только там, где ответ и правда 0
+            assert expected == 0, spec
+            folded += 1
+            continue
+        assert canonicalize_spec(canonical) == canonical, spec
+        assert store.evaluate(canonical) == expected, spec
+        build_sql_and_params(canonical)
+
+    # генератор действительно порождает противоречивые фильтры
+    assert folded > 0
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        # creator_id есть только в videos
+        QuerySpec(
+            table=Table.video_snapshots,
+            aggregation=Aggregation.count_rows,
+            field="id",
+            filters=[
+                Condition(column="creator_id", op=ConditionOp.eq, value="a" * 32),
+                Condition(column="creator_id", op=ConditionOp.eq, value="b" * 32),
+            ],
+        ),
+        # delta_views_count есть только в video_snapshots
+        QuerySpec(
+            table=Table.videos,
+            aggregation=Aggregation.count_rows,
+            field="id",
+            filters=[
+                Condition(column="delta_views_count", op=ConditionOp.gt, value=10),
+                Condition(column="delta_views_count", op=ConditionOp.eq, value=5),
+            ],
+        ),
+        # date_eq только для datetime-колонок
+        QuerySpec(
+            table=Table.videos,
+            aggregation=Aggregation.count_rows,
+            field="id",
+            filters=[
+                Condition(
+                    column="views_count", op=ConditionOp.date_eq, value="2025-11-01"
+                )
+            ],
+        ),
+    ],
+    ids=["creator_on_snapshots", "delta_on_videos", "date_eq_on_counter"],
+)
+def test_invalid_spec_is_rejected_not_folded(spec):
+    # противоречие в недопустимом spec не должно превращаться в ответ 0
+    assert canonicalize_spec(spec) == spec
+    with pytest.raises(ValueError):
+        build_sql_and_params(spec)
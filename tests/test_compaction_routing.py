@@ -0,0 +1,120 @@
+"""
+Запросы к свёрнутым дням (services.compaction) считаются только по роллапу:
+при любых настройках бэкендов, а то, что по роллапу не посчитать,
+отвергается. Проверяется без БД — по тексту SQL.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from core.config import query_settings
+from nlp.spec import Aggregation, Condition, ConditionOp, QuerySpec, Table
+from services.columnar import ColumnarStore, ColumnTable, to_micros
+from services.executor import answer_query_spec
+from services.rollup import ROLLUP_TABLE, compacted_days
+from services.sql_builder import build_multi_sql_and_params, build_sql_and_params
+
+from helpers import START, run
+
+COMPACTED = START.date()
+
+
+def _spec(aggregation: Aggregation, field: str, *filters: Condition) -> QuerySpec:
+    return QuerySpec(
+        table=Table.video_snapshots,
+        aggregation=aggregation,
+        field=field,
+        filters=list(filters),
+    )
+
+
+def _day(day: date) -> Condition:
+    return Condition(column="created_at", op=ConditionOp.date_eq, value=day.isoformat())
+
+
+def _hours(first: int, last: int) -> Condition:
+    return Condition(
+        column="created_at",
+        op=ConditionOp.between_datetime,
+        value=(START + timedelta(hours=first)).isoformat(),
+        value2=(START + timedelta(hours=last)).isoformat(),
+    )
+
+
+@pytest.fixture(autouse=True)
+def compacted(monkeypatch):
+    monkeypatch.setattr(compacted_days, "days", (COMPACTED,))
+    monkeypatch.setattr(query_settings, "USE_DAILY_ROLLUP", False)
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        _spec(Aggregation.count_rows, "id", _day(COMPACTED)),
+        _spec(Aggregation.sum_field, "delta_views_count", _hours(0, 48)),
+        _spec(
+            Aggregation.count_distinct,
+            "video_id",
+            _day(COMPACTED),
+            Condition(column="delta_views_count", op=ConditionOp.gt, value=0),
+        ),
+        # без фильтра по времени — все дни, в том числе свёрнутые
+        _spec(Aggregation.count_rows, "id"),
+    ],
+    ids=["count_day", "sum_two_days", "growth_day", "whole_table"],
+)
+def test_compacted_days_go_to_rollup(spec):
+    sql, _ = build_sql_and_params(spec)
+    assert f"FROM {ROLLUP_TABLE}" in sql
+    multi_sql, _, _ = build_multi_sql_and_params([spec])
+    assert f"FROM {ROLLUP_TABLE}" in multi_sql
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        _spec(
+            Aggregation.count_rows,
+            "id",
+            _day(COMPACTED),
+            Condition(column="delta_views_count", op=ConditionOp.gt, value=10),
+        ),
+        _spec(Aggregation.sum_field, "views_count", _day(COMPACTED)),
+        _spec(Aggregation.count_rows, "id", _hours(3, 9)),
+    ],
+    ids=["delta_gt_n", "views_count_sum", "inside_day"],
+)
+def test_hourly_specs_over_compacted_days_are_rejected(spec):
+    with pytest.raises(ValueError):
+        build_sql_and_params(spec)
+    with pytest.raises(ValueError):
+        build_multi_sql_and_params([spec])
+
+
+def test_days_after_compaction_keep_hourly_rows():
+    spec = _spec(
+        Aggregation.sum_field, "views_count", _day(COMPACTED + timedelta(days=1))
+    )
+    sql, _ = build_sql_and_params(spec)
+    assert "FROM video_snapshots" in sql
+
+
+def test_in_memory_backends_skip_compacted_days(monkeypatch):
+    store = ColumnarStore()
+    store.videos = ColumnTable(store._video_columns([]), "video_created_at")
+    store.snapshots = ColumnTable(
+        store._snapshot_columns([("v", to_micros(START), *range(8))]), "created_at"
+    )
+    spec = _spec(Aggregation.count_rows, "id", _day(COMPACTED))
+    with pytest.raises(ValueError):
+        store.evaluate(spec)
+
+    # executor не спрашивает копию в памяти, а идёт в БД
+    async def from_db(queried: QuerySpec) -> int:
+        return -1
+
+    monkeypatch.setattr(query_settings, "USE_COLUMNAR_BACKEND", True)
+    monkeypatch.setattr("services.executor.columnar_store", store)
+    monkeypatch.setattr("services.executor._answer_in_new_session", from_db)
+    assert run(answer_query_spec(spec)) == -1
@@ -0,0 +1,60 @@
+"""In-memory движок (services.columnar) считает так же, как Postgres."""
+
+from typing import List, Tuple, Union
+
+import pytest
+from sqlalchemy import text
+
+from base.session_maker import database_manager
+from benchmark_script import random_specs
+from core.config import query_settings
+from nlp.spec import QuerySpec
+from services.columnar import columnar_store
+from services.sql_builder import execute_query_spec
+
+from helpers import run, seed
+
+SPECS_PER_RUN = 300
+
+Outcome = Union[int, str]
+
+
+async def _sql_outcome(spec: QuerySpec) -> Outcome:
+    try:
+        async with database_manager.create_session() as session:
+            return await execute_query_spec(session, spec)
+    except ValueError:
+        return "error"
+
+
+def _columnar_outcome(spec: QuerySpec) -> Outcome:
+    try:
+        return columnar_store.evaluate(spec)
+    except ValueError:
+        return "error"
+
+
+async def _mismatches(days: int) -> List[Tuple[str, Outcome, Outcome]]:
+    await seed(days=days)
+    await columnar_store.refresh()
+    async with database_manager.create_session() as session:
+        creators = list(
+            (await session.execute(text("SELECT DISTINCT creator_id FROM videos")))
+            .scalars()
+            .all()
+        )
+
+    mismatches = []
+    for spec in random_specs(SPECS_PER_RUN, creators, days, seed=11):
+        expected = await _sql_outcome(spec)
+        actual = _columnar_outcome(spec)
+        if expected != actual:
+            mismatches.append((spec.model_dump_json(), expected, actual))
+    return mismatches
+
+
+@pytest.mark.parametrize("use_rollup", [False, True], ids=["raw", "rollup"])
+def test_columnar_matches_postgres(pg, monkeypatch, use_rollup):
+    monkeypatch.setattr(query_settings, "USE_DAILY_ROLLUP", use_rollup)
+
+    assert run(_mismatches(days=6)) == []
@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from fill_db_script import iter_json_array
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_iter_json_array_matches_json_load(tmp_path, chunk_size):
+    videos = [
+        {
+            "id": i,
+            "title": "x" * (i % 37),
+            "snapshots": [{"n": j} for j in range(i % 4)],
+        }
+        for i in range(500)
+    ]
+    path = tmp_path / "videos.json"
+    path.write_text(json.dumps({"meta": {"videos": 1}, "videos": videos}, indent=1))
+
+    assert list(iter_json_array(str(path), chunk_size=chunk_size)) == videos
+
+
+def test_iter_json_array_truncated_file(tmp_path):
+    path = tmp_path / "videos.json"
+    path.write_text('{"videos": [{"id": 1}, {"id": ')
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path), chunk_size=8))
@@ -0,0 +1,96 @@
+"""Запросы к модели несут prompt_cache_key в обоих режимах разбора."""
+
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from langchain_openai import ChatOpenAI
+
+import nlp.llm_parser as llm_parser
+from nlp.prompts import get_spec_system_prompt, prompt_cache_key
+from nlp.spec import Aggregation, QuerySpec, Table
+
+SPEC_ARGS = {"table": "videos", "aggregation": "count_rows", "field": "id"}
+
+
+def _completion(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4.1-mini",
+        "choices": [
+            {"index": 0, "finish_reason": "stop", "message": message},
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+
+
+@pytest.fixture
+def payloads(monkeypatch) -> List[Dict[str, Any]]:
+    """Тела запросов к OpenAI; отвечает заглушка, в сеть ничего не уходит."""
+    seen: List[Dict[str, Any]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        seen.append(payload)
+        if "tools" in payload:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": "call_1",
+                        "type": "function",
+                        "function": {
+                            "name": "QuerySpec",
+                            "arguments": json.dumps(SPEC_ARGS),
+                        },
+                    }
+                ],
+            }
+        else:
+            message = {"role": "assistant", "content": json.dumps(SPEC_ARGS)}
+        return httpx.Response(200, json=_completion(message))
+
+    llm = ChatOpenAI(
+        model="gpt-4.1-mini",
+        temperature=0,
+        api_key="test",
+        http_async_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    monkeypatch.setattr(llm_parser, "llm", llm)
+    monkeypatch.setattr(llm_parser, "_structured_llms", {})
+    return seen
+
+
+def test_text_mode_sends_prompt_cache_key(payloads):
+    system_prompt = get_spec_system_prompt("manual")
+    raw = asyncio.run(llm_parser.call_llm(system_prompt, "Сколько видео?"))
+
+    assert json.loads(raw) == SPEC_ARGS
+    assert payloads[-1]["prompt_cache_key"] == prompt_cache_key(system_prompt)
+
+
+def test_structured_mode_sends_prompt_cache_key(payloads):
+    system_prompt = get_spec_system_prompt("manual")
+    spec = asyncio.run(llm_parser.call_llm_structured(system_prompt, "Сколько видео?"))
+
+    assert spec == QuerySpec(
+        table=Table.videos, aggregation=Aggregation.count_rows, field="id"
+    )
+    assert "tools" in payloads[-1]
+    assert payloads[-1]["prompt_cache_key"] == prompt_cache_key(system_prompt)
+
+
+def test_structured_mode_keys_follow_the_prompt(payloads):
+    prompts = [get_spec_system_prompt("manual"), get_spec_system_prompt("generated")]
+    for system_prompt in prompts:
+        asyncio.run(llm_parser.call_llm_structured(system_prompt, "Сколько видео?"))
+
+    assert [p["prompt_cache_key"] for p in payloads] == [
+        prompt_cache_key(p) for p in prompts
+    ]
+    assert len(set(prompt_cache_key(p) for p in prompts)) == 2
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+from bot.middlewares import BUSY_TEXT, ChatConcurrencyMiddleware
+
+
+class FakeMessage(SimpleNamespace):
+    async def answer(self, text: str) -> None:
+        self.answers.append(text)
+
+
+def message(chat_id: int) -> FakeMessage:
+    return FakeMessage(chat=SimpleNamespace(id=chat_id), answers=[])
+
+
+def test_busy_chat_does_not_reject_other_chats():
+    async def scenario() -> List[FakeMessage]:
+        middleware = ChatConcurrencyMiddleware(
+            max_concurrency=1, max_pending=2, max_chat_pending=10
+        )
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            await release.wait()
+            return "ok"
+
+        # чат 1 занял единственный слот, за ним ещё 5 его сообщений
+        busy = [message(1) for _ in range(6)]
+        tasks = [asyncio.create_task(middleware(handler, m, {})) for m in busy]
+        await asyncio.sleep(0)
+        other = message(2)
+        tasks.append(asyncio.create_task(middleware(handler, other, {})))
+        await asyncio.sleep(0)
+
+        assert middleware.stats.waiting_slot == 1
+        release.set()
+        assert await asyncio.gather(*tasks) == ["ok"] * 7
+        return busy + [other]
+
+    assert all(not m.answers for m in asyncio.run(scenario()))
+
+
+def test_chat_queue_limit_rejects_only_that_chat():
+    async def scenario() -> None:
+        middleware = ChatConcurrencyMiddleware(
+            max_concurrency=4, max_pending=100, max_chat_pending=2
+        )
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            await release.wait()
+            return "ok"
+
+        # одно в работе + два ждут; четвёртое — уже лишнее
+        flood = [message(1) for _ in range(4)]
+        tasks = [asyncio.create_task(middleware(handler, m, {})) for m in flood]
+        await asyncio.sleep(0)
+        other = message(2)
+        tasks.append(asyncio.create_task(middleware(handler, other, {})))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(*tasks) == ["ok", "ok", "ok", None, "ok"]
+        assert flood[3].answers == [BUSY_TEXT]
+        assert middleware.stats.rejected == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,109 @@
+"""Фильтры QuerySpec идут по индексам (миграция 3f1c9a7d2b64), а не полным сканом."""
+
+import json
+from typing import Any, Dict, Iterator, List
+
+import pytest
+from sqlalchemy import text
+
+from base.session_maker import database_manager
+from core.config import query_settings
+from nlp.spec import Aggregation, Condition, ConditionOp, QuerySpec, Table
+from services.sql_builder import build_sql_and_params
+
+from helpers import run, seed
+
+CREATOR_PLACEHOLDER = "<creator>"
+
+SPECS: List[QuerySpec] = [
+    QuerySpec(
+        table=Table.videos,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=[
+            Condition(
+                column="creator_id", op=ConditionOp.eq, value=CREATOR_PLACEHOLDER
+            ),
+            Condition(
+                column="video_created_at",
+                op=ConditionOp.between_datetime,
+                value="2025-11-02T00:00:00",
+                value2="2025-11-04T00:00:00",
+            ),
+        ],
+    ),
+    QuerySpec(
+        table=Table.videos,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=[
+            Condition(
+                column="video_created_at", op=ConditionOp.date_eq, value="2025-11-03"
+            )
+        ],
+    ),
+    QuerySpec(
+        table=Table.videos,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=[Condition(column="views_count", op=ConditionOp.gt, value=100_000)],
+    ),
+    QuerySpec(
+        table=Table.video_snapshots,
+        aggregation=Aggregation.sum_field,
+        field="delta_views_count",
+        filters=[
+            Condition(column="created_at", op=ConditionOp.date_eq, value="2025-11-03")
+        ],
+    ),
+    QuerySpec(
+        table=Table.video_snapshots,
+        aggregation=Aggregation.count_distinct,
+        field="video_id",
+        filters=[
+            Condition(column="created_at", op=ConditionOp.date_eq, value="2025-11-03"),
+            Condition(column="delta_views_count", op=ConditionOp.gt, value=0),
+        ],
+    ),
+    QuerySpec(
+        table=Table.video_snapshots,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=[Condition(column="views_count", op=ConditionOp.gt, value=100_000)],
+    ),
+]
+
+
+def _seq_scans(plan: Dict[str, Any]) -> Iterator[str]:
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from _seq_scans(child)
+
+
+async def _seq_scanned(spec: QuerySpec) -> List[str]:
+    async with database_manager.create_session() as session:
+        creator = (
+            await session.execute(text("SELECT creator_id FROM videos LIMIT 1"))
+        ).scalar_one()
+        for cond in spec.filters:
+            if cond.value == CREATOR_PLACEHOLDER:
+                cond.value = creator
+        sql, params = build_sql_and_params(spec)
+        # без индекса планировщику остаётся только полный скан, даже с этим
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = (
+            await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params)
+        ).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return list(_seq_scans(plan[0]["Plan"]))
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=lambda spec: spec.model_dump_json())
+def test_filters_use_indexes(pg, monkeypatch, spec):
+    # сырые снапшоты, а не роллап: индексы нужны именно им
+    monkeypatch.setattr(query_settings, "USE_DAILY_ROLLUP", False)
+    run(seed())
+
+    assert run(_seq_scanned(spec.model_copy(deep=True))) == []
@@ -0,0 +1,89 @@
+"""Быстрый разбор без LLM: что разбирается правилами, а что уходит в LLM."""
+
+import pytest
+
+from nlp.rule_parser import parse_spec_by_rules
+from nlp.spec import Aggregation, Condition, ConditionOp, QuerySpec, Table
+
+CREATOR = "aca1061a9d324ecf8c3fa2bb32d7be63"
+
+
+def _videos(*filters: Condition) -> QuerySpec:
+    return QuerySpec(
+        table=Table.videos,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=list(filters),
+    )
+
+
+def _published(value: str, value2=None) -> Condition:
+    if value2 is None:
+        return Condition(column="video_created_at", op=ConditionOp.date_eq, value=value)
+    return Condition(
+        column="video_created_at",
+        op=ConditionOp.between_datetime,
+        value=value,
+        value2=value2,
+    )
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("Сколько всего видео есть в системе?", _videos()),
+        (
+            "Сколько видео вышло 28 ноября 2025?",
+            _videos(_published("2025-11-28")),
+        ),
+        (
+            "Сколько видео опубликовано за 28.11.2025",
+            _videos(_published("2025-11-28")),
+        ),
+        (
+            f"Сколько видео у креатора с id {CREATOR} вышло с 1 по 5 ноября 2025 года?",
+            _videos(
+                Condition(column="creator_id", op=ConditionOp.eq, value=CREATOR),
+                _published("2025-11-01T00:00:00+00:00", "2025-11-06T00:00:00+00:00"),
+            ),
+        ),
+        (
+            "Сколько видео набрало больше 100 000 просмотров за все время?",
+            _videos(Condition(column="views_count", op=ConditionOp.gt, value=100000)),
+        ),
+        (
+            "На сколько просмотров в сумме выросли все видео 28 ноября 2025?",
+            QuerySpec(
+                table=Table.video_snapshots,
+                aggregation=Aggregation.sum_field,
+                field="delta_views_count",
+                filters=[
+                    Condition(
+                        column="created_at", op=ConditionOp.date_eq, value="2025-11-28"
+                    )
+                ],
+            ),
+        ),
+    ],
+)
+def test_rules_parse_typical_questions(question, expected):
+    assert parse_spec_by_rules(question) == expected
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        # "на дату" и дата без глагола — это "по состоянию на", а не "за день"
+        "Сколько видео на 28 ноября 2025",
+        "Сколько видео всего 1 ноября 2025 года?",
+        "Сколько видео опубликовано на 28 ноября 2025?",
+        "Сколько видео 28.11.2025",
+        "На сколько просмотров выросли видео на 28 ноября 2025?",
+        # несуществующая дата
+        "Сколько видео вышло 31 ноября 2025?",
+        # лишняя сущность, которую шаблон не использует
+        f"Сколько всего видео {CREATOR}?",
+    ],
+)
+def test_ambiguous_questions_go_to_llm(question):
+    assert parse_spec_by_rules(question) is None
@@ -0,0 +1,112 @@
+import asyncio
+
+from nlp.spec import Aggregation, QuerySpec, Table
+from services.singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_execute_once():
+    async def scenario() -> None:
+        flight: SingleFlight[int] = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def compute() -> int:
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return 42
+
+        waiters = [
+            asyncio.create_task(flight.do("same question", compute)) for _ in range(50)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(*waiters) == [42] * 50
+        assert calls == 1
+        assert flight.stats() == {"in_flight": 0, "executed": 1, "shared": 49}
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_and_later_calls_execute_separately():
+    async def scenario() -> None:
+        flight: SingleFlight[str] = SingleFlight()
+        calls = []
+
+        async def compute(key: str) -> str:
+            calls.append(key)
+            await asyncio.sleep(0)
+            return key
+
+        first = await asyncio.gather(
+            flight.do("a", lambda: compute("a")), flight.do("b", lambda: compute("b"))
+        )
+        # прошлый вызов завершён — следующий выполняется заново
+        second = await flight.do("a", lambda: compute("a"))
+
+        assert first == ["a", "b"] and second == "a"
+        assert calls == ["a", "b", "a"]
+
+    asyncio.run(scenario())
+
+
+def test_error_is_shared_and_cancelling_one_waiter_keeps_others():
+    async def scenario() -> None:
+        flight: SingleFlight[int] = SingleFlight()
+        release = asyncio.Event()
+
+        async def failing() -> int:
+            await release.wait()
+            raise RuntimeError("db is down")
+
+        waiters = [asyncio.create_task(flight.do("k", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        waiters[0].cancel()
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert all(isinstance(r, RuntimeError) for r in results[1:])
+        assert flight.stats()["executed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_identical_questions_parse_and_query_once(monkeypatch):
+    import services.executor as executor
+    import services.text_query as text_query
+    from core.config import query_settings
+
+    parsed = 0
+    queried = 0
+    spec = QuerySpec(table=Table.videos, aggregation=Aggregation.count_rows, field="id")
+
+    async def fake_parse(user_text: str) -> QuerySpec:
+        nonlocal parsed
+        parsed += 1
+        await asyncio.sleep(0.01)
+        return spec
+
+    async def fake_db(query_spec: QuerySpec) -> int:
+        nonlocal queried
+        queried += 1
+        await asyncio.sleep(0.01)
+        return 7
+
+    monkeypatch.setattr(text_query, "build_spec_from_text", fake_parse)
+    # подменяем только поход в БД: склейка в executor (_value_flight) настоящая
+    monkeypatch.setattr(executor, "_answer_in_new_session", fake_db)
+    monkeypatch.setattr(query_settings, "USE_COLUMNAR_BACKEND", False)
+    monkeypatch.setattr(query_settings, "USE_TIME_INDEX", False)
+    text_query.spec_cache.clear()
+    text_query.value_cache.clear()
+
+    async def scenario():
+        return await asyncio.gather(
+            *(text_query.answer_text_query("Сколько всего видео?") for _ in range(20))
+        )
+
+    assert asyncio.run(scenario()) == [7] * 20
+    assert parsed == 1
+    assert queried == 1
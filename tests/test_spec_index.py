@@ -0,0 +1,159 @@
+"""
+Индекс похожих вопросов (nlp.spec_index): перефразированный вопрос получает
+QuerySpec известного шаблона со своими сущностями, а всё, что шаблон
+изменил бы по смыслу, уходит в LLM.
+"""
+
+import asyncio
+from pathlib import Path
+
+from nlp.rule_parser import extract_slots
+from nlp.spec import Aggregation, Condition, ConditionOp, QuerySpec, Table
+from nlp.spec_index import SpecIndex, fill_spec_template, make_spec_template
+
+CREATOR_A = "aca1061a9d324ecf8c3fa2bb32d7be63"
+CREATOR_B = "0123456789abcdef0123456789abcdef"
+
+QUESTION = (
+    f"Покажи число видео, которые креатор {CREATOR_A} "
+    "выложил в промежутке с 1 по 5 ноября 2025"
+)
+SPEC = QuerySpec(
+    table=Table.videos,
+    aggregation=Aggregation.count_rows,
+    field="id",
+    filters=[
+        Condition(column="creator_id", op=ConditionOp.eq, value=CREATOR_A),
+        Condition(
+            column="video_created_at",
+            op=ConditionOp.between_datetime,
+            value="2025-11-01T00:00:00+00:00",
+            value2="2025-11-06T00:00:00+00:00",
+        ),
+    ],
+)
+
+LIKES_QUESTION = "Покажи, насколько суммарно поднялось число лайков 28 ноября 2025"
+LIKES_SPEC = QuerySpec(
+    table=Table.video_snapshots,
+    aggregation=Aggregation.sum_field,
+    field="delta_likes_count",
+    filters=[
+        Condition(column="created_at", op=ConditionOp.date_eq, value="2025-11-28")
+    ],
+)
+
+
+def _index(path: Path) -> SpecIndex:
+    return SpecIndex(path, threshold=0.9, max_entries=100)
+
+
+def test_paraphrase_gets_spec_with_its_own_entities(tmp_path):
+    index = _index(tmp_path / "index.jsonl")
+    asyncio.run(index.add(QUESTION, SPEC))
+
+    paraphrase = (
+        f"покажи число видео которые креатор {CREATOR_B} "
+        "выложил в промежутке с 2 по 3 декабря 2025 г!"
+    )
+    spec = asyncio.run(index.lookup(paraphrase))
+
+    assert spec == QuerySpec(
+        table=Table.videos,
+        aggregation=Aggregation.count_rows,
+        field="id",
+        filters=[
+            Condition(column="creator_id", op=ConditionOp.eq, value=CREATOR_B),
+            Condition(
+                column="video_created_at",
+                op=ConditionOp.between_datetime,
+                value="2025-12-02T00:00:00+00:00",
+                value2="2025-12-04T00:00:00+00:00",
+            ),
+        ],
+    )
+
+
+def test_other_set_of_entities_is_not_filled(tmp_path):
+    index = _index(tmp_path / "index.jsonl")
+    asyncio.run(index.add(QUESTION, SPEC))
+
+    # без креатора шаблону нечего подставить в creator_id
+    question = (
+        "Покажи число видео, которые креатор выложил в промежутке с 1 по 5 ноября 2025"
+    )
+    assert asyncio.run(index.lookup(question)) is None
+
+
+# длинный вопрос: замена одного слова почти не меняет его n-граммы
+LONG_LIKES_QUESTION = (
+    "Подскажи пожалуйста, насколько в сумме выросло общее количество лайков у всех "
+    "роликов на нашей платформе за 28 ноября 2025 года, если считать по данным всех "
+    "почасовых снапшотов этого дня и складывать прирост каждого ролика отдельно"
+)
+
+
+def test_other_key_stem_is_not_reused(tmp_path, monkeypatch):
+    index = _index(tmp_path / "index.jsonl")
+    asyncio.run(index.add(LONG_LIKES_QUESTION, LIKES_SPEC))
+
+    same = LONG_LIKES_QUESTION.replace("28 ноября", "3 декабря")
+    spec = asyncio.run(index.lookup(same))
+    assert spec is not None and spec.filters[0].value == "2025-12-03"
+
+    # n-граммы почти те же, но поле другое: такой вопрос разбирает LLM
+    views = LONG_LIKES_QUESTION.replace("лайков", "просмотров")
+    assert asyncio.run(index.lookup(views)) is None
+
+    # без проверки основ тот же вопрос прошёл бы порог и получил поле лайков
+    monkeypatch.setattr("nlp.spec_index.KEY_STEMS", ())
+    unguarded = _index(tmp_path / "unguarded.jsonl")
+    asyncio.run(unguarded.add(LONG_LIKES_QUESTION, LIKES_SPEC))
+    assert asyncio.run(unguarded.lookup(views)) == LIKES_SPEC
+
+
+def test_spec_with_literals_is_not_generalized():
+    _, slots = extract_slots(QUESTION)
+
+    # дата в фильтре не из вопроса
+    other_date = SPEC.model_copy(deep=True)
+    other_date.filters[1].value2 = "2025-11-07T00:00:00+00:00"
+    assert make_spec_template(other_date, slots) is None
+
+    # креатор в фильтре не из вопроса
+    other_creator = SPEC.model_copy(deep=True)
+    other_creator.filters[0].value = CREATOR_B
+    assert make_spec_template(other_creator, slots) is None
+
+    # сущность вопроса не использована (креатор потерян)
+    no_creator = SPEC.model_copy(update={"filters": SPEC.filters[1:]})
+    assert make_spec_template(no_creator, slots) is None
+
+    # некорректный spec не запоминается
+    invalid = SPEC.model_copy(update={"field": "views"})
+    assert make_spec_template(invalid, slots) is None
+
+
+def test_template_round_trip():
+    _, slots = extract_slots(QUESTION)
+    template = make_spec_template(SPEC, slots)
+
+    assert template is not None
+    assert [item["value"] for item in template["filters"]] == ["<id:0>", "<date:0>"]
+    assert fill_spec_template(template, slots) == SPEC
+
+
+def test_journal_is_reloaded_and_broken_lines_skipped(tmp_path):
+    path = tmp_path / "index.jsonl"
+    first = _index(path)
+    asyncio.run(first.add(QUESTION, SPEC))
+    asyncio.run(first.add(LIKES_QUESTION, LIKES_SPEC))
+    # недописанная строка после падения процесса
+    with path.open("a", encoding="utf-8") as f:
+        f.write('{"template": "сколько')
+
+    reloaded = _index(path)
+    assert asyncio.run(reloaded.lookup(QUESTION)) == SPEC
+    assert asyncio.run(reloaded.lookup(LIKES_QUESTION)) == LIKES_SPEC
+    assert len(reloaded) == 2
+    assert reloaded.templates == first.templates
@@ -0,0 +1,341 @@
+"""
+Индекс по времени (services.time_index) отвечает так же, как SQL, а что не
+умеет — отдаёт None. Края окон проверяются на маленьком наборе без БД,
+совпадение с Postgres — на синтетических данных.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional
+
+import pytest
+from sqlalchemy import text
+
+from base.session_maker import database_manager
+from nlp.spec import Aggregation, Condition, ConditionOp, QuerySpec, Table
+from services.columnar import to_micros
+from services.sql_builder import execute_query_spec
+from services.time_index import TimeIndex
+
+from helpers import START, run, seed
+
+CREATOR_A = "a" * 32
+CREATOR_B = "b" * 32
+CREATOR_PLACEHOLDER = "<creator>"
+
+
+def _spec(
+    table: Table, aggregation: Aggregation, field: str, *filters: Condition
+) -> QuerySpec:
+    return QuerySpec(
+        table=table, aggregation=aggregation, field=field, filters=list(filters)
+    )
+
+
+def _between(column: str, start: datetime, end: datetime) -> Condition:
+    return Condition(
+        column=column,
+        op=ConditionOp.between_datetime,
+        value=start.isoformat(),
+        value2=end.isoformat(),
+    )
+
+
+def _day(column: str, day: datetime) -> Condition:
+    return Condition(
+        column=column, op=ConditionOp.date_eq, value=day.date().isoformat()
+    )
+
+
+def _creator(value: str) -> Condition:
+    return Condition(column="creator_id", op=ConditionOp.eq, value=value)
+
+
+# --- края окон на маленьком наборе --------------------------------------------
+
+# два видео A и одно B; снапшоты в полночь 1 ноября и в 23:00 того же дня,
+# ещё один — в полночь 2 ноября
+T0 = START
+T1 = START + timedelta(hours=23)
+T2 = START + timedelta(days=1)
+
+
+@pytest.fixture
+def small_index() -> TimeIndex:
+    index = TimeIndex()
+    index._build(
+        [
+            (CREATOR_A, to_micros(T0)),
+            (CREATOR_A, to_micros(T2)),
+            (CREATOR_B, to_micros(T1)),
+        ],
+        [
+            (to_micros(T0), 2, 10, 1, 0, 0),
+            (to_micros(T1), 1, 5, 2, 0, 0),
+            (to_micros(T2), 3, 7, 4, 0, 0),
+        ],
+    )
+    index.generation = 1
+    return index
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        # date_eq — сутки UTC: полночь следующего дня не входит
+        (
+            _spec(
+                Table.videos, Aggregation.count_rows, "id", _day("video_created_at", T0)
+            ),
+            2,
+        ),
+        # полуинтервал: начало входит, конец нет
+        (
+            _spec(
+                Table.videos,
+                Aggregation.count_rows,
+                "id",
+                _between("video_created_at", T0, T1),
+            ),
+            1,
+        ),
+        (
+            _spec(
+                Table.videos,
+                Aggregation.count_rows,
+                "id",
+                _between("video_created_at", T1, T2 + timedelta(microseconds=1)),
+            ),
+            2,
+        ),
+        # пересечение двух окон
+        (
+            _spec(
+                Table.videos,
+                Aggregation.count_rows,
+                "id",
+                _between("video_created_at", T0, T2),
+                _between("video_created_at", T1, T2 + timedelta(hours=1)),
+            ),
+            1,
+        ),
+        # пустое пересечение
+        (
+            _spec(
+                Table.videos,
+                Aggregation.count_rows,
+                "id",
+                _between("video_created_at", T0, T1),
+                _between("video_created_at", T1, T2),
+            ),
+            0,
+        ),
+        # окно в другом часовом поясе: 03:00+03:00 = полночь UTC
+        (
+            _spec(
+                Table.videos,
+                Aggregation.count_rows,
+                "id",
+                _between(
+                    "video_created_at",
+                    T0.astimezone(timezone(timedelta(hours=3))),
+                    T1,
+                ),
+            ),
+            1,
+        ),
+        # креатор
+        (_spec(Table.videos, Aggregation.count_rows, "id", _creator(CREATOR_A)), 2),
+        (
+            _spec(
+                Table.videos,
+                Aggregation.count_distinct,
+                "id",
+                _creator(CREATOR_A),
+                _day("video_created_at", T2),
+            ),
+            1,
+        ),
+        (_spec(Table.videos, Aggregation.count_rows, "id", _creator("c" * 32)), 0),
+        # снапшоты: число строк и суммы delta_*
+        (
+            _spec(
+                Table.video_snapshots,
+                Aggregation.count_rows,
+                "id",
+                _day("created_at", T0),
+            ),
+            3,
+        ),
+        (
+            _spec(
+                Table.video_snapshots,
+                Aggregation.sum_field,
+                "delta_views_count",
+                _between("created_at", T1, T2 + timedelta(seconds=1)),
+            ),
+            12,
+        ),
+        (
+            _spec(
+                Table.video_snapshots,
+                Aggregation.sum_field,
+                "delta_likes_count",
+            ),
+            7,
+        ),
+    ],
+)
+def test_window_edges(small_index, spec, expected):
+    assert small_index.try_evaluate(spec) == expected
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        # суммы по videos индекс не хранит
+        _spec(Table.videos, Aggregation.sum_field, "views_count"),
+        # фильтр не по времени и не по креатору
+        _spec(
+            Table.videos,
+            Aggregation.count_rows,
+            "id",
+            Condition(column="views_count", op=ConditionOp.gt, value=10),
+        ),
+        # два разных креатора
+        _spec(
+            Table.videos,
+            Aggregation.count_rows,
+            "id",
+            _creator(CREATOR_A),
+            _creator(CREATOR_B),
+        ),
+        # время не той колонки
+        _spec(Table.videos, Aggregation.count_rows, "id", _day("created_at", T0)),
+        # у снапшотов креатора нет
+        _spec(Table.video_snapshots, Aggregation.count_rows, "id", _creator(CREATOR_A)),
+        # суммы по *_count и COUNT(DISTINCT video_id)
+        _spec(Table.video_snapshots, Aggregation.sum_field, "views_count"),
+        _spec(Table.video_snapshots, Aggregation.count_distinct, "video_id"),
+        _spec(
+            Table.video_snapshots,
+            Aggregation.count_rows,
+            "id",
+            Condition(column="delta_views_count", op=ConditionOp.gt, value=0),
+        ),
+        # некорректная дата — пусть отвергнет SQL-путь
+        _spec(
+            Table.videos,
+            Aggregation.count_rows,
+            "id",
+            Condition(
+                column="video_created_at", op=ConditionOp.date_eq, value="2025-11-31"
+            ),
+        ),
+    ],
+)
+def test_unsupported_specs_fall_back_to_sql(small_index, spec):
+    assert small_index.try_evaluate(spec) is None
+
+
+def test_index_is_not_used_before_the_first_refresh():
+    spec = _spec(Table.videos, Aggregation.count_rows, "id")
+    assert TimeIndex().try_evaluate(spec) is None
+
+
+# --- совпадение с Postgres ----------------------------------------------------
+
+_DAY2 = START + timedelta(days=2)
+
+SPECS: List[QuerySpec] = [
+    _spec(Table.videos, Aggregation.count_rows, "id"),
+    _spec(Table.videos, Aggregation.count_rows, "id", _day("video_created_at", _DAY2)),
+    _spec(
+        Table.videos,
+        Aggregation.count_rows,
+        "id",
+        _between(
+            "video_created_at", START + timedelta(hours=30), _DAY2 + timedelta(hours=5)
+        ),
+    ),
+    _spec(
+        Table.videos,
+        Aggregation.count_distinct,
+        "id",
+        _creator(CREATOR_PLACEHOLDER),
+        _between("video_created_at", START, _DAY2 + timedelta(days=2)),
+        _between(
+            "video_created_at", START + timedelta(days=1), START + timedelta(days=9)
+        ),
+    ),
+    _spec(
+        Table.videos,
+        Aggregation.count_rows,
+        "id",
+        _creator(CREATOR_PLACEHOLDER),
+        _day("video_created_at", START),
+    ),
+    _spec(
+        Table.video_snapshots, Aggregation.count_rows, "id", _day("created_at", _DAY2)
+    ),
+    _spec(
+        Table.video_snapshots,
+        Aggregation.sum_field,
+        "delta_views_count",
+        _between("created_at", START + timedelta(hours=7, minutes=30), _DAY2),
+    ),
+    _spec(
+        Table.video_snapshots,
+        Aggregation.sum_field,
+        "delta_comments_count",
+        _between("created_at", START, _DAY2 + timedelta(days=1)),
+        _day("created_at", _DAY2),
+    ),
+    _spec(Table.video_snapshots, Aggregation.sum_field, "delta_reports_count"),
+]
+
+
+def _with_creator(spec: QuerySpec, creator: str) -> QuerySpec:
+    spec = spec.model_copy(deep=True)
+    for cond in spec.filters:
+        if cond.value == CREATOR_PLACEHOLDER:
+            cond.value = creator
+    return spec
+
+
+async def _compare() -> List[Any]:
+    await seed(days=6)
+    index = TimeIndex()
+    await index.refresh()
+
+    async with database_manager.create_session() as session:
+        creator = (
+            await session.execute(text("SELECT MIN(creator_id) FROM videos"))
+        ).scalar_one()
+        # окно ровно от одного снапшота до следующего часа: начало входит, конец нет
+        moment = (
+            await session.execute(
+                text(
+                    "SELECT created_at FROM video_snapshots ORDER BY created_at LIMIT 1 OFFSET 500"
+                )
+            )
+        ).scalar_one()
+        specs = [_with_creator(spec, creator) for spec in SPECS] + [
+            _spec(
+                Table.video_snapshots,
+                Aggregation.count_rows,
+                "id",
+                _between("created_at", moment, moment + timedelta(hours=1)),
+            )
+        ]
+
+        mismatches = []
+        for spec in specs:
+            expected = await execute_query_spec(session, spec)
+            actual: Optional[int] = index.try_evaluate(spec)
+            if actual != expected:
+                mismatches.append((spec.model_dump_json(), expected, actual))
+    return mismatches
+
+
+def test_time_index_matches_postgres(pg):
+    assert run(_compare()) == []